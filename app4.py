@@ -12,6 +12,9 @@ import numpy as np
 import altair as alt
 from datetime import datetime
 
+from skudo_comparativo import comparar
+from skudo_ranking import primero
+
 # ----------------------------------------------------------------------
 # CONFIGURACIÓN GENERAL
 # ----------------------------------------------------------------------
@@ -143,8 +146,8 @@ def load_diagnostico_base():
 
 def get_diagnostico_for_instalacion(inst_id: int, base_df: pd.DataFrame) -> pd.DataFrame:
     """Simula ligeras variaciones por instalación."""
-    np.random.seed(inst_id)
-    variacion = np.random.randint(-10, 10, size=base_df.shape[0])
+    rng = np.random.RandomState(inst_id)  # generador local: seguro entre hilos
+    variacion = rng.randint(-10, 10, size=base_df.shape[0])
     df = base_df.copy()
     df["Puntaje"] = (df["Puntaje_base"] + variacion).clip(30, 95)
     return df[["Elemento", "Puntaje"]]
@@ -160,16 +163,16 @@ def get_cultura_for_instalacion(indice_cultura: int) -> pd.DataFrame:
         "Liderazgo visible",
         "Aprendizaje organizacional",
     ]
-    np.random.seed(indice_cultura)
-    variacion = np.random.randint(-15, 15, size=len(dims))
+    rng = np.random.RandomState(indice_cultura)
+    variacion = rng.randint(-15, 15, size=len(dims))
     puntajes = (base + variacion).clip(30, 95)
     return pd.DataFrame({"Dimensión": dims, "Puntaje": puntajes})
 
 
 def get_acciones_for_instalacion(inst_id: int, nombre: str) -> pd.DataFrame:
     """Acciones abiertas por instalación (dummy)."""
-    np.random.seed(inst_id + 10)
-    n = 3 + np.random.randint(0, 4)
+    rng = np.random.RandomState(inst_id + 10)
+    n = 3 + rng.randint(0, 4)
     crits = ["Crítica", "Alta", "Media"]
     estados = ["Abierta", "En curso", "Planificada"]
     data = []
@@ -179,11 +182,35 @@ def get_acciones_for_instalacion(inst_id: int, nombre: str) -> pd.DataFrame:
             "Instalación": nombre,
             "Descripción": f"Acción {i+1} para {nombre}",
             "Criticidad": crits[i % len(crits)],
-            "Días_vencida": int(np.random.randint(0, 20)),
+            "Días_vencida": int(rng.randint(0, 20)),
             "Estado": estados[i % len(estados)],
         })
     return pd.DataFrame(data)
 
+
+def resumen_instalacion(nombre: str, df_inst: pd.DataFrame, df_diag_base: pd.DataFrame) -> dict:
+    """Fila del comparativo corporativo (se calcula en paralelo por instalación)."""
+    inst_row = df_inst[df_inst["nombre"] == nombre].iloc[0]
+    df_diag = get_diagnostico_for_instalacion(int(inst_row["id"]), df_diag_base)
+    df_cultura = get_cultura_for_instalacion(int(inst_row["indice_cultura"]))
+    acciones_df = get_acciones_for_instalacion(int(inst_row["id"]), nombre)
+    return {
+        "Puntaje PSM medio": round(float(df_diag["Puntaje"].mean()), 1),
+        "Elemento más débil": primero(df_diag, "Puntaje")["Elemento"],
+        "Cultura media": round(float(df_cultura["Puntaje"].mean()), 1),
+        "Acciones críticas": int((acciones_df["Criticidad"] == "Crítica").sum()),
+        "Acciones abiertas": len(acciones_df),
+    }
+
+
+def comparativo_instalaciones(df_inst: pd.DataFrame, df_diag_base: pd.DataFrame) -> pd.DataFrame:
+    """Consolidado de todas las instalaciones (skudo_comparativo: pool de hilos + memo por sitio)."""
+    version = str(int(pd.util.hash_pandas_object(df_inst, index=False).sum()
+                      + pd.util.hash_pandas_object(df_diag_base, index=False).sum()))
+    df = comparar("app4_instalaciones", resumen_instalacion, df_inst["nombre"], version,
+                  args=(df_inst, df_diag_base))
+    return df.rename(columns={"instalacion": "Instalación"})
+
 # ----------------------------------------------------------------------
 # AGENTES IA (MOCKS)
 # Aquí es donde luego enchufas tu LLM (OpenAI, etc.)
@@ -259,8 +286,8 @@ def agente_informe_borrador(inst_row, df_diag, df_cultura, acciones_df) -> str:
     pec = "actualizado" if inst_row["pec_actualizado"] else "pendiente de actualización"
     shp = "disponible" if inst_row["tiene_shp"] else "no disponible"
 
-    elemento_mas_debil = df_diag.sort_values("Puntaje").iloc[0]["Elemento"]
-    dim_cultura_mas_baja = df_cultura.sort_values("Puntaje").iloc[0]["Dimensión"]
+    elemento_mas_debil = primero(df_diag, "Puntaje")["Elemento"]
+    dim_cultura_mas_baja = primero(df_cultura, "Puntaje")["Dimensión"]
     acciones_criticas = acciones_df[acciones_df["Criticidad"] == "Crítica"].shape[0]
 
     texto = f"""
@@ -438,6 +465,19 @@ def pantalla_diagnostico(df_inst: pd.DataFrame, vista: str, df_diag_base: pd.Dat
     st.subheader("2️⃣ Diagnóstico SKUDO – PSM/PPAM + Cultura")
 
     if vista == "Corporativo":
+        st.markdown("### Comparativo corporativo por instalación")
+        df_comp = comparativo_instalaciones(df_inst, df_diag_base)
+        chart_comp = (
+            alt.Chart(df_comp)
+            .mark_bar()
+            .encode(
+                x=alt.X("Instalación", sort=None),
+                y=alt.Y("Puntaje PSM medio", scale=alt.Scale(domain=[0, 100])),
+                tooltip=list(df_comp.columns),
+            )
+        )
+        st.altair_chart(chart_comp, use_container_width=True)
+        st.dataframe(df_comp, use_container_width=True, hide_index=True)
         st.info("Selecciona una instalación específica para ver su diagnóstico detallado.")
         return
 
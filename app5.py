@@ -5,11 +5,31 @@ import altair as alt
 from datetime import datetime
 
 import matplotlib.pyplot as plt
-import networkx as nx  # pip install networkx
 
 import os
 from pathlib import Path
 
+from skudo_almacen import AlmacenColumnar
+from skudo_busqueda import CAMPOS_CAUSA, IndiceInvertido, indice_persistente
+from skudo_comparativo import comparar
+from skudo_cubo import CALIFICACIONES_CRITICAS, DIMENSIONES, CuboDiagnostico
+from skudo_datos import DATOS_TTL_S, cargar_versionado, huella_fuente, ruta_datos
+from skudo_grafo import ETIQUETAS_TIPO, GrafoCSR, GrafoRelaciones
+from skudo_grilla import grilla_paginada
+from skudo_lopa import (
+    FACTOR_ERROR_IEF, SEMILLA_MC, MotorLOPA, aplicar_lopa, creditos_desde_salvaguardas, montecarlo,
+    supuestos_validos,
+)
+from skudo_madurez import (
+    CALIFICACIONES, calcular_madurez_global, calificacion_to_score, con_score, preparar_diagnostico,
+)
+from skudo_pid import derivados, visor_pid
+from skudo_prioridades import priorizar
+from skudo_ranking import top_k_df
+from skudo_texto import anotar_tokens, coincide_tokens, tokens_texto
+from skudo_trazas import cerrar_corrida, cuerpo_corrida, etiquetar_corrida, iniciar_corrida, panel_trazas, span, trazar
+from skudo_ui import fragmento, seccion_cacheada, selector_secciones
+
 BASE_DIR = Path(__file__).parent
 IMG_DIR = BASE_DIR / "imagenes"
 
@@ -22,6 +42,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+iniciar_corrida("app5")
 
 # ---------------------------------------------------------
 # ESTILO PERSONALIZADO
@@ -158,16 +179,6 @@ st.markdown(
 # =========================================================
 # DATOS DUMMY (reemplazables por tus datos reales)
 # =========================================================
-def calificacion_to_score(calif: str) -> int:
-    mapping = {
-        "Muy bajo": 20,
-        "Bajo": 40,
-        "Medio": 60,
-        "Alto": 80,
-        "Muy alto": 95
-    }
-    return mapping.get(calif, 50)
-
 def load_dummy_data():
     df_sites = pd.DataFrame([
         {
@@ -204,12 +215,13 @@ def load_dummy_data():
     pilares = ["Compromiso", "Comprender el riesgo", "Gestionar el riesgo", "Aprender"]
     sitios = df_sites["sitio"].tolist()
 
-    np.random.seed(42)
+    # RNG local: no altera el estado global de NumPy compartido entre sesiones
+    rng = np.random.RandomState(42)
 
     data_heat = []
     for el in elementos:
         for s in sitios:
-            cal = np.random.randint(40, 90)
+            cal = rng.randint(40, 90)
             data_heat.append({
                 "Elemento": el,
                 "Sitio": s,
@@ -223,13 +235,13 @@ def load_dummy_data():
     for i in range(1, 40):
         diag_rows.append({
             "id": f"D-{i:03d}",
-            "pilar": np.random.choice(pilares),
-            "elemento": np.random.choice(elementos),
-            "instalacion": np.random.choice(sitios),
+            "pilar": rng.choice(pilares),
+            "elemento": rng.choice(elementos),
+            "instalacion": rng.choice(sitios),
             "descripcion": f"Ítem de evaluación CCPS #{i}",
-            "calificacion": np.random.choice(califs, p=[0.1, 0.2, 0.3, 0.25, 0.15]),
+            "calificacion": rng.choice(califs, p=[0.1, 0.2, 0.3, 0.25, 0.15]),
             "evidencia": "Documento / Registros / Entrevistas",
-            "estado_plan": np.random.choice(["Sin plan", "En diseño", "En ejecución", "Cerrado"])
+            "estado_plan": rng.choice(["Sin plan", "En diseño", "En ejecución", "Cerrado"])
         })
     df_diag = pd.DataFrame(diag_rows)
 
@@ -325,7 +337,22 @@ def load_dummy_data():
     return df_sites, df_heat, df_diag, df_nodos, df_estudios
 
 
-df_sites, df_heat, df_diag, df_nodos, df_estudios = load_dummy_data()
+def cargar_datos():
+    """
+    Carga + preparación al ingerir: el texto de los nodos se normaliza una sola
+    vez (columna "tokens") y las búsquedas reutilizan esos tokens; el
+    diagnóstico queda con `calificacion` categórica y su columna `score`.
+    """
+    df_sites, df_heat, df_diag, df_nodos, df_estudios = load_dummy_data()
+    df_diag = preparar_diagnostico(df_diag)
+    df_nodos = anotar_tokens(df_nodos, ["descripcion"])
+    return df_sites, df_heat, df_diag, df_nodos, df_estudios
+
+
+# Se construye una sola vez por proceso (compartido entre sesiones) y se
+# reconstruye solo si cambia load_dummy_data. No mutar estos DataFrames.
+with span("carga_datos"):
+    df_sites, df_heat, df_diag, df_nodos, df_estudios = cargar_versionado("app5_dummy", cargar_datos, load_dummy_data)
 
 # =========================================================
 # ESTADO GLOBAL BÁSICO
@@ -354,10 +381,11 @@ def get_inf(name: str) -> str:
 def set_inf(name: str, value: str):
     st.session_state[name] = value
 
+@trazar
 def build_resumen_elementos(df_diag_filtrado: pd.DataFrame) -> pd.DataFrame:
     """
     Construye un resumen por elemento similar al de tu screenshot:
-    - Promedio (0–100) usando calificacion_to_score
+    - Promedio (0–100) de la columna `score`
     - Porcentaje aproximado de:
         Implementación completa        -> Muy alto
         Impl. parcial en toda la comp. -> Alto
@@ -378,11 +406,10 @@ def build_resumen_elementos(df_diag_filtrado: pd.DataFrame) -> pd.DataFrame:
             ]
         )
 
-    df = df_diag_filtrado.copy()
-    df["score"] = df["calificacion"].apply(calificacion_to_score)
+    df = con_score(df_diag_filtrado)
 
     resumen = []
-    for elemento, grp in df.groupby("elemento"):
+    for elemento, grp in df.groupby("elemento", observed=True):
         total = len(grp)
         if total == 0:
             continue
@@ -423,52 +450,19 @@ def resumen_calificaciones(df_diag_filtrado: pd.DataFrame) -> pd.DataFrame:
     return (
         df_diag_filtrado["calificacion"]
         .value_counts()
+        .loc[lambda s: s > 0]
         .rename_axis("Calificación")
         .reset_index(name="Cantidad")
     )
 
 
-def calcular_madurez_global(df_diag_filtrado: pd.DataFrame) -> float:
-    if df_diag_filtrado.empty:
-        return 0.0
-    scores = df_diag_filtrado["calificacion"].apply(calificacion_to_score)
-    return round(scores.mean(), 1)
-
-
+@trazar
 def prioridades_desde_diag(df_diag_filtrado: pd.DataFrame, top_n: int = 5) -> pd.DataFrame:
-    if df_diag_filtrado.empty:
-        return pd.DataFrame(columns=["Nodo / Tema", "Nivel", "Pilar", "Instalación", "Impacto", "Plazo sugerido"])
-    df = df_diag_filtrado.copy()
-    df["score"] = df["calificacion"].apply(calificacion_to_score)
-    df = df.sort_values("score").head(top_n)  # más bajo = peor
-
-    prioridades = []
-    for _, row in df.iterrows():
-        s = row["score"]
-        if s <= 40:
-            nivel = "Crítico"
-            plazo = "0–3 meses"
-            impacto = "Muy alto"
-        elif s <= 60:
-            nivel = "Importante"
-            plazo = "3–6 meses"
-            impacto = "Alto"
-        else:
-            nivel = "Mejorable"
-            plazo = "6–12 meses"
-            impacto = "Medio"
-        prioridades.append({
-            "Nodo / Tema": row["descripcion"],
-            "Nivel": nivel,
-            "Pilar": row["pilar"],
-            "Instalación": row["instalacion"],
-            "Impacto": impacto,
-            "Plazo sugerido": plazo
-        })
-    return pd.DataFrame(prioridades)
+    """Top-n brechas (motor vectorizado de skudo_prioridades; peor score primero)."""
+    return priorizar(df_diag_filtrado, top_n=top_n, col_tema="Nodo / Tema")
 
 
-def get_dummy_condiciones_para_estudio(id_estudio: str) -> pd.DataFrame:
+def dummy_condiciones_base() -> pd.DataFrame:
     """
     DEMO: condiciones/escenarios, causas, consecuencias, salvaguardas y acciones
     asociadas a cada estudio.
@@ -568,11 +562,16 @@ def get_dummy_condiciones_para_estudio(id_estudio: str) -> pd.DataFrame:
         },
     ]
 
-    df = pd.DataFrame(base)
+    return pd.DataFrame(base)
+
+
+def get_dummy_condiciones_para_estudio(id_estudio: str) -> pd.DataFrame:
+    df = dummy_condiciones_base()
     df_sel = df[df["id_estudio"] == id_estudio].copy()
     return df_sel.reset_index(drop=True)
 
 
+@trazar
 def clasificar_acciones_riesgos(df_condiciones: pd.DataFrame):
     """
     Clasifica acciones en:
@@ -613,6 +612,7 @@ def clasificar_acciones_riesgos(df_condiciones: pd.DataFrame):
     return texto, df_gen, df_team
 
 
+@trazar
 def sugerir_estudio_y_estudios(contexto: dict, df_estudios_base: pd.DataFrame, df_nodos_base: pd.DataFrame):
     """
     Dado el contexto del problema (instalación, unidad, equipo, descripción, tipo_situacion, fase),
@@ -678,10 +678,10 @@ def sugerir_estudio_y_estudios(contexto: dict, df_estudios_base: pd.DataFrame, d
         mask &= df_est["instalacion"] == instalacion
 
     if unidad:
-        mask &= df_est["unidad"].str.contains(unidad, case=False, na=False)
+        mask &= coincide_tokens(df_est["unidad"], unidad)
 
     if equipo:
-        mask &= df_est["equipo"].str.contains(equipo, case=False, na=False)
+        mask &= coincide_tokens(df_est["equipo"], equipo)
 
     df_rel = df_est[mask].copy()
 
@@ -702,25 +702,28 @@ def sugerir_estudio_y_estudios(contexto: dict, df_estudios_base: pd.DataFrame, d
     if instalacion != "Todas":
         mask_n &= df_n["instalacion"] == instalacion
 
-    desc_lower = desc.lower()
-    unidad_lower = unidad.lower()
-    equipo_lower = equipo.lower()
+    # La consulta se normaliza una vez; los nodos ya traen sus tokens de la ingesta
+    desc_tokens = set(tokens_texto(desc))
+    unidad_tokens = set(tokens_texto(unidad))
+    equipo_tokens = set(tokens_texto(equipo))
+    if "tokens" in df_n.columns:
+        tokens_nodos = df_n["tokens"]
+    else:
+        tokens_nodos = df_n["descripcion"].map(tokens_texto)
 
-    def es_relacionado(row):
-        texto = str(row["descripcion"]).lower()
+    def es_relacionado(tokens_fila) -> bool:
+        fila = set(tokens_fila)
         score = 0
-        if equipo_lower and equipo_lower in texto:
+        if equipo_tokens and equipo_tokens <= fila:
             score += 2
-        if unidad_lower and unidad_lower in texto:
+        if unidad_tokens and unidad_tokens <= fila:
             score += 1
         # Palabras clave de la descripción larga
-        for palabra in desc_lower.split():
-            if len(palabra) >= 5 and palabra in texto:
-                score += 1
+        score += len(desc_tokens & fila)
         return score >= 2  # umbral simple para DEMO
 
     if desc or unidad or equipo:
-        rel_mask = df_n.apply(es_relacionado, axis=1)
+        rel_mask = pd.Series([es_relacionado(t) for t in tokens_nodos], index=df_n.index)
         mask_n &= rel_mask
 
     df_n_rel = df_n[mask_n].copy()
@@ -758,7 +761,7 @@ He encontrado **{len(df_rel)} estudio(s)** histórico(s) potencialmente relevant
     return texto, df_rel, nodos_rel_ids
 
 
-def get_dummy_riesgos_por_estudios(estudios_ids: list[str]) -> pd.DataFrame:
+def dummy_riesgos_base() -> pd.DataFrame:
     """
     DEMO: Escenarios de riesgo de proceso consolidados por estudio.
     En producción esto vendría de tus hojas PHA/HAZOP/LOPA/QRA.
@@ -921,15 +924,22 @@ def get_dummy_riesgos_por_estudios(estudios_ids: list[str]) -> pd.DataFrame:
         },
     ]
 
-    df = pd.DataFrame(base)
+    return pd.DataFrame(base)
+
+
+def get_dummy_riesgos_por_estudios(estudios_ids: list[str]) -> pd.DataFrame:
+    df = dummy_riesgos_base()
     if estudios_ids:
         df = df[df["id_estudio"].isin(estudios_ids)]
     return df.reset_index(drop=True)
 
 
+@trazar
 def resumir_riesgos_y_acciones(df_rp: pd.DataFrame) -> dict:
     """
     Calcula métricas generales para la vista de análisis de riesgos de procesos.
+    Usa el riesgo residual / nivel / frecuencia mitigada calculados por el
+    motor LOPA (riesgos_con_lopa) cuando vienen en `df_rp`.
     """
     if df_rp.empty:
         return {
@@ -937,6 +947,8 @@ def resumir_riesgos_y_acciones(df_rp: pd.DataFrame) -> dict:
             "n_generales": 0,
             "n_equipo": 0,
             "prom_riesgo_residual": 0.0,
+            "n_muy_alto": 0,
+            "frecuencia_mitigada_total": 0.0,
             "top_peligros": [],
         }
 
@@ -944,6 +956,9 @@ def resumir_riesgos_y_acciones(df_rp: pd.DataFrame) -> dict:
     n_generales = int((df_rp["tipo_accion"] == "General").sum())
     n_equipo = int((df_rp["tipo_accion"] == "Trabajo en equipo").sum())
     prom_riesgo = round(df_rp["riesgo_residual"].mean(), 1)
+    n_muy_alto = int((df_rp["nivel_riesgo"] == "Muy alto").sum())
+    # suma de frecuencias mitigadas: eventos/año esperados del conjunto
+    frecuencia_total = float(df_rp["frecuencia_mitigada"].sum()) if "frecuencia_mitigada" in df_rp.columns else 0.0
 
     top_peligros = (
         df_rp["tipo_peligro"]
@@ -958,10 +973,13 @@ def resumir_riesgos_y_acciones(df_rp: pd.DataFrame) -> dict:
         "n_generales": n_generales,
         "n_equipo": n_equipo,
         "prom_riesgo_residual": prom_riesgo,
+        "n_muy_alto": n_muy_alto,
+        "frecuencia_mitigada_total": frecuencia_total,
         "top_peligros": top_peligros,
     }
 
 
+@trazar
 def agrupar_acciones_generales(df_rp: pd.DataFrame) -> pd.DataFrame:
     """
     Agrupa acciones generales por clase/tema para ver patrones que se pueden
@@ -984,6 +1002,7 @@ def agrupar_acciones_generales(df_rp: pd.DataFrame) -> pd.DataFrame:
     return resumen
 
 
+@trazar
 def clasificar_acciones_rp_agente(df_rp: pd.DataFrame) -> str:
     """
     Texto tipo agente que diferencia:
@@ -1039,13 +1058,21 @@ def clasificar_acciones_rp_agente(df_rp: pd.DataFrame) -> str:
     return texto
 
 
-def sugerir_consecuencias_y_salvaguardas_por_causa(causa_texto: str, df_hist: pd.DataFrame):
+@trazar
+def sugerir_consecuencias_y_salvaguardas_por_causa(
+    causa_texto: str,
+    df_hist: pd.DataFrame,
+    indice: IndiceInvertido | None = None,
+):
     """
     Dado un texto de causa (del estudio actual), busca en TODO el histórico
     de riesgos de proceso causas similares y sugiere consecuencias y salvaguardas
     típicas, más temas para trabajo en equipo.
 
-    DEMO: usa una similitud muy sencilla por palabras clave.
+    La similitud se calcula con BM25 sobre un índice invertido de
+    causa_principal, descripcion_escenario y tipo_peligro. `indice` debe estar
+    construido sobre `df_hist` (mismo orden de filas); si no se pasa, se arma
+    uno temporal.
     """
     causa = (causa_texto or "").strip()
     if not causa:
@@ -1061,10 +1088,7 @@ def sugerir_consecuencias_y_salvaguardas_por_causa(causa_texto: str, df_hist: pd
             pd.DataFrame()
         )
 
-    causa_tokens = [
-        w.lower() for w in causa.split()
-        if len(w) >= 4
-    ]
+    causa_tokens = list(tokens_texto(causa))
 
     if not causa_tokens:
         return (
@@ -1073,35 +1097,21 @@ def sugerir_consecuencias_y_salvaguardas_por_causa(causa_texto: str, df_hist: pd
             pd.DataFrame()
         )
 
-    df = df_hist.copy()
+    if indice is None:
+        indice = IndiceInvertido.construir(df_hist, CAMPOS_CAUSA, col_desempate="riesgo_residual")
 
-    def score_row(row):
-        texto = (
-            str(row.get("causa_principal", "")) + " " +
-            str(row.get("descripcion_escenario", "")) + " " +
-            str(row.get("tipo_peligro", ""))
-        ).lower()
-        score = 0
-        for t in causa_tokens:
-            if t in texto:
-                score += 1
-        return score
+    # Top 10 por similitud (BM25) y, en empate, por riesgo residual
+    posiciones, puntajes = indice.buscar(causa_tokens, k=10)
 
-    df["sim_score"] = df.apply(score_row, axis=1)
-    df_match = df[df["sim_score"] >= 1].copy()
-
-    if df_match.empty:
+    if len(posiciones) == 0:
         return (
             "No encontré causas similares en el histórico DEMO. "
             "En la versión real, se usarán modelos más avanzados para encontrar patrones.",
             pd.DataFrame()
         )
 
-    # Ordenar por similitud y riesgo
-    df_match = df_match.sort_values(
-        ["sim_score", "riesgo_residual"],
-        ascending=[False, False]
-    ).head(10)
+    df_match = df_hist.iloc[posiciones].copy()
+    df_match["sim_score"] = np.round(puntajes, 3)
 
     # Consecuencias y salvaguardas típicas
     consecuencias = (
@@ -1304,9 +1314,8 @@ def seleccionar_escenarios_para_taller(df_rp: pd.DataFrame) -> list[str]:
     ids_team = df_rp[df_rp["tipo_accion"] == "Trabajo en equipo"]["id_escenario"].tolist()
 
     if len(ids_team) < 3:
-        df_rest = df_rp[~df_rp["id_escenario"].isin(ids_team)].copy()
-        df_rest = df_rest.sort_values("riesgo_residual", ascending=False)
-        extra = df_rest["id_escenario"].head(3 - len(ids_team)).tolist()
+        df_rest = df_rp[~df_rp["id_escenario"].isin(ids_team)]
+        extra = top_k_df(df_rest, 3 - len(ids_team), "riesgo_residual", descendente=True)["id_escenario"].tolist()
         ids_team = list(dict.fromkeys(ids_team + extra))  # sin duplicados
 
     return ids_team
@@ -1332,6 +1341,179 @@ def filtrar_nodos_relacionados_desde_rp(df_rp: pd.DataFrame, df_nodos_base: pd.D
 
 
 
+# =========================================================
+# ALMACÉN COLUMNAR (Parquet particionado por instalación / año)
+# =========================================================
+# Año al que corresponden el diagnóstico y los nodos de la DEMO
+ANIO_DIAGNOSTICO = 2025
+
+ALMACEN = AlmacenColumnar(ruta_datos("almacen_app5"))
+
+# Columnas que realmente muestra cada vista (proyección en la lectura)
+COLS_DIAG_TABLERO = ["id", "pilar", "elemento", "instalacion", "descripcion", "calificacion", "score", "estado_plan"]
+COLS_NODOS_TABLERO = ["id", "instalacion", "riesgo"]
+COLS_ESTUDIOS = [
+    "id_estudio", "tipo", "anio", "instalacion", "unidad", "equipo",
+    "cobertura", "estado", "accion_sugerida",
+]
+COLS_CONDICIONES = [
+    "id_condicion", "condicion", "causa", "consecuencia", "salvaguardas",
+    "accion_sugerida", "tipo_accion", "criticidad", "estado_accion",
+]
+
+
+def _sembrar_almacen(version: str) -> bool:
+    """
+    Persiste las tablas DEMO en el almacén. En producción este paso lo haría
+    el proceso de carga de PHA/HAZOP, no la app.
+    """
+    est = df_estudios[["id_estudio", "instalacion", "anio"]]
+    tablas = {
+        "diag": df_diag.assign(anio=ANIO_DIAGNOSTICO),
+        "nodos": df_nodos.drop(columns=["tokens"]).assign(anio=ANIO_DIAGNOSTICO),
+        "estudios": df_estudios,
+        "riesgos": dummy_riesgos_base().merge(est[["id_estudio", "anio"]], on="id_estudio", how="left"),
+        "condiciones": dummy_condiciones_base().merge(est, on="id_estudio", how="left"),
+    }
+    return ALMACEN.sembrar(tablas, version)
+
+
+_VERSION_ALMACEN = huella_fuente(_sembrar_almacen, load_dummy_data, dummy_riesgos_base, dummy_condiciones_base)
+cargar_versionado("app5_almacen", _sembrar_almacen, args=(_VERSION_ALMACEN,))
+
+
+@trazar
+def leer_tabla(nombre: str, columnas: list[str] | None = None, instalacion: str = "Todas", **filtros) -> pd.DataFrame:
+    """
+    Lee una tabla del almacén con solo las columnas y particiones pedidas.
+    El resultado es compartido (caché): copiar antes de modificar.
+    """
+    if instalacion and instalacion != "Todas":
+        filtros["instalacion"] = instalacion
+    return ALMACEN.leer_cacheado(nombre, columnas, **filtros)
+
+
+def _construir_cubo(version_diag: str) -> CuboDiagnostico:
+    return CuboDiagnostico.desde_df(ALMACEN.leer("diag", [*DIMENSIONES, "score"]))
+
+
+def _construir_motor_lopa(version_riesgos: str) -> MotorLOPA:
+    df = ALMACEN.leer("riesgos", ["id_escenario", "severidad", "frecuencia", "salvaguardas_clave"])
+    return MotorLOPA(df, creditos_desde_salvaguardas(df))
+
+
+def motor_lopa() -> MotorLOPA:
+    """Motor LOPA de todo el registro de escenarios, uno por proceso y versión de "riesgos"."""
+    return cargar_versionado("app5_lopa", _construir_motor_lopa, args=(ALMACEN.version("riesgos"),))
+
+
+def supuestos_pfd() -> dict:
+    """PFD por tipo de IPL de la sesión (parten de los genéricos)."""
+    return st.session_state.setdefault("lopa_pfd", supuestos_validos(None))
+
+
+@trazar
+def riesgos_con_lopa(df_rp: pd.DataFrame) -> pd.DataFrame:
+    """Escenarios con frecuencia mitigada, riesgo residual y nivel calculados por el motor LOPA."""
+    return aplicar_lopa(df_rp, motor_lopa().evaluar(supuestos_pfd()))
+
+
+@st.cache_resource(ttl=DATOS_TTL_S, max_entries=32, show_spinner="Simulando incertidumbre (Monte Carlo)…")
+def _incertidumbre_lopa(version_riesgos: str, ids: tuple, pfd: tuple, n_muestras: int, semilla: int) -> pd.DataFrame:
+    return montecarlo(motor_lopa(), ids=list(ids), pfd=dict(pfd), n_muestras=n_muestras, semilla=semilla)
+
+
+@trazar
+def incertidumbre_lopa(df_rp: pd.DataFrame, n_muestras: int, semilla: int) -> pd.DataFrame:
+    """
+    P5 / P50 / P95 de la frecuencia mitigada de los escenarios de `df_rp`
+    (compartido entre sesiones por riesgos, escenarios, supuestos y semilla).
+    """
+    return _incertidumbre_lopa(
+        ALMACEN.version("riesgos"), tuple(df_rp["id_escenario"]),
+        tuple(sorted(supuestos_pfd().items())), n_muestras, semilla,
+    )
+
+
+def cubo_diagnostico() -> CuboDiagnostico:
+    """
+    Cubo de agregación del diagnóstico, uno por proceso y por versión de la
+    tabla "diag". Compartido entre sesiones: usar .copia() antes de modificar.
+    """
+    return cargar_versionado("app5_cubo", _construir_cubo, args=(ALMACEN.version("diag"),))
+
+
+# ---------------------------------------------------------
+# Edición del diagnóstico en sesión (taller en vivo)
+# ---------------------------------------------------------
+COLS_DIAG_EDITABLES = ["calificacion", "estado_plan"]
+ESTADOS_PLAN = ["Sin plan", "En diseño", "En ejecución", "Cerrado"]
+
+
+def estado_diag_sesion() -> dict:
+    """
+    Copia del diagnóstico y del cubo propia de la sesión. Las ediciones se
+    aplican como deltas sobre el cubo (sin recalcular todo el diagnóstico).
+    """
+    if "diag_sesion" not in st.session_state:
+        st.session_state["diag_sesion"] = {
+            "df": df_diag.set_index("id", drop=False),
+            "cubo": cubo_diagnostico().copia(),
+            "rev": 0,
+            "n_cambios": 0,
+        }
+    return st.session_state["diag_sesion"]
+
+
+def _aplicar_ediciones_diag(clave_editor: str, ids: list):
+    """Callback del editor: lleva cada celda editada al df de sesión y al cubo."""
+    estado = estado_diag_sesion()
+    df = estado["df"]
+    cubo = estado["cubo"]
+    editadas = st.session_state.get(clave_editor, {}).get("edited_rows", {})
+    for pos, cambios in editadas.items():
+        cambios = {c: v for c, v in cambios.items() if c in COLS_DIAG_EDITABLES and v is not None}
+        if not cambios:
+            continue
+        id_item = ids[int(pos)]
+        anterior = df.loc[id_item, list(DIMENSIONES)].to_dict()
+        nueva = {**anterior, **cambios}
+        if {k: str(v) for k, v in nueva.items()} == {k: str(v) for k, v in anterior.items()}:
+            continue
+        cubo.aplicar_cambio(anterior, nueva)
+        for col, val in cambios.items():
+            df.loc[id_item, col] = val
+        df.loc[id_item, "score"] = calificacion_to_score(str(nueva["calificacion"]))
+        estado["n_cambios"] += 1
+    # editor nuevo sobre los datos ya actualizados (los deltas son por posición)
+    estado["rev"] += 1
+
+
+# =========================================================
+# GRAFO DE RELACIONES (nodos, diagnóstico, acciones, requisitos, estudios)
+# =========================================================
+# incluye todo skudo_grafo.py: armado del grafo, conversión a CSR y formato de los .npy
+_VERSION_GRAFO = huella_fuente(BASE_DIR / "skudo_grafo.py", load_dummy_data, dummy_riesgos_base)
+
+
+def _construir_grafo(version: str) -> GrafoCSR:
+    """
+    Construye el grafo (networkx) una vez, lo guarda como CSR en disco y lo
+    abre mapeado en memoria: las sesiones comparten los arreglos de solo lectura.
+    """
+    carpeta = ruta_datos("grafos") / f"app5-{version}"
+    if not (carpeta / "indptr.npy").exists():
+        grafo = GrafoRelaciones.desde_tablas(df_nodos, dummy_riesgos_base(), df_estudios)
+        GrafoCSR.desde_grafo(grafo).guardar(carpeta)
+        GrafoCSR.podar_versiones(carpeta)
+    return GrafoCSR.abrir(carpeta)
+
+
+def grafo_relaciones() -> GrafoCSR:
+    """Grafo compartido entre sesiones; se reconstruye solo si cambian los datos."""
+    return cargar_versionado("app5_grafo", _construir_grafo, args=(_VERSION_GRAFO,))
+
+
 # =========================================================
 # COMPONENTES DE PÁGINA (tablero, diagnóstico, nodos) – SIN CAMBIOS GRANDES
 # =========================================================
@@ -1370,6 +1552,95 @@ def metric_card(title: str, value: str, subtitle: str):
     )
 
 
+# ---------------------------------------------------------
+# Secciones de la vista técnica del tablero: solo se calcula la sección
+# visible y su resultado queda cacheado por (instalación, perfil, versión).
+# ---------------------------------------------------------
+@trazar
+def _seccion_brechas(instalacion_activa: str) -> dict:
+    df_diag_f = leer_tabla("diag", COLS_DIAG_TABLERO, instalacion_activa)
+    df_count_elem = cubo_diagnostico().conteo_por(
+        "elemento", instalacion_activa, calificacion=CALIFICACIONES_CRITICAS
+    ).rename(columns={"n": "Brechas críticas"})
+    chart_crit = (
+        alt.Chart(df_count_elem)
+        .mark_bar()
+        .encode(
+            x=alt.X("Brechas críticas:Q"),
+            y=alt.Y("elemento:N", sort="-x", title="Elemento CCPS"),
+            tooltip=["elemento", "Brechas críticas"]
+        )
+        .properties(height=260)
+    )
+    return {"prios": prioridades_desde_diag(df_diag_f, top_n=12), "chart_crit": chart_crit}
+
+
+@trazar
+def _seccion_elementos(instalacion_activa: str) -> dict:
+    cubo = cubo_diagnostico()
+    df_elem = cubo.madurez_por("elemento", instalacion_activa)
+    chart_elem = (
+        alt.Chart(df_elem)
+        .mark_bar()
+        .encode(
+            x=alt.X("score:Q", title="Madurez (%)", scale=alt.Scale(domain=[0, 100])),
+            y=alt.Y("elemento:N", title="Elemento CCPS", sort="-x"),
+            tooltip=["elemento", "score"]
+        )
+        .properties(height=320)
+    )
+
+    dist = cubo.distribucion_calificaciones(instalacion_activa)
+    chart_dist = None
+    if not dist.empty:
+        chart_dist = (
+            alt.Chart(dist)
+            .mark_bar()
+            .encode(
+                x=alt.X("Calificación:N"),
+                y=alt.Y("Cantidad:Q"),
+                tooltip=["Calificación", "Cantidad"]
+            )
+            .properties(height=220)
+        )
+    return {"chart_elem": chart_elem, "chart_dist": chart_dist}
+
+
+def _resumen_instalacion(instalacion: str, cubo: CuboDiagnostico) -> dict:
+    """Fila del comparativo de una instalación (corre en el pool de skudo_comparativo)."""
+    kpis = cubo.kpis(instalacion)
+    df = ALMACEN.leer("diag", ["descripcion", "pilar", "instalacion", "score"], instalacion=instalacion)
+    brecha = priorizar(df, top_n=1)
+    return {
+        "score": kpis["madurez"],
+        "items": kpis["total"],
+        "brechas_criticas": kpis["brechas_criticas"],
+        "porcentaje_cerradas": kpis["porcentaje_cerradas"],
+        "brecha_principal": brecha["Tema"].iloc[0] if not brecha.empty else "",
+    }
+
+
+@trazar
+def _seccion_instalaciones(instalacion_activa: str) -> dict:
+    cubo = cubo_diagnostico()
+    sitios = cubo.conteo_por("instalacion")["instalacion"].astype(str).tolist()
+    df_site_mad = comparar(
+        "app5_instalaciones", _resumen_instalacion, sitios, ALMACEN.version("diag"), args=(cubo,)
+    )
+    chart_site = (
+        alt.Chart(df_site_mad)
+        .mark_bar()
+        .encode(
+            x=alt.X("instalacion:N", title="Instalación"),
+            y=alt.Y("score:Q", title="Madurez (%)", scale=alt.Scale(domain=[0, 100])),
+            tooltip=["instalacion", "score", "brechas_criticas", "porcentaje_cerradas", "brecha_principal"]
+        )
+        .properties(height=280)
+    )
+    return {"df_site_mad": df_site_mad, "chart_site": chart_site}
+
+
+@trazar
 def render_dashboard(instalacion_activa: str, perfil: str):
     # Cabecera tipo hero (ya la tenías)
     render_hero(instalacion_activa, perfil)
@@ -1377,38 +1648,28 @@ def render_dashboard(instalacion_activa: str, perfil: str):
     # --------------------------
     # FILTROS BASE DE DATOS
     # --------------------------
+    # KPIs y gráficos salen del cubo; las filas solo se leen para las tablas de
+    # brechas (particiones de la instalación activa y columnas usadas), y solo
+    # en la vista/sección que las muestra.
+    cubo = cubo_diagnostico()
+    kpis = cubo.kpis(instalacion_activa)
+    df_nodos_f = leer_tabla("nodos", COLS_NODOS_TABLERO, instalacion_activa)
     if instalacion_activa == "Todas":
-        df_diag_f = df_diag.copy()
         df_sites_f = df_sites.copy()
-        df_nodos_f = df_nodos.copy()
     else:
-        df_diag_f = df_diag[df_diag["instalacion"] == instalacion_activa]
         df_sites_f = df_sites[df_sites["sitio"] == instalacion_activa]
-        df_nodos_f = df_nodos[df_nodos["instalacion"] == instalacion_activa]
 
-    madurez_global = calcular_madurez_global(df_diag_f)
+    madurez_global = kpis["madurez"]
 
     # Escenarios de riesgo ALTO desde nodos
     n_escenarios_alto = len(df_nodos_f[df_nodos_f["riesgo"] == "ALTO"])
 
-    # Críticos de diagnóstico (Muy bajo / Bajo)
-    crit_mask = df_diag_f["calificacion"].isin(["Muy bajo", "Bajo"])
-    n_brechas_criticas = int(crit_mask.sum())
-    total_items_diag = int(len(df_diag_f))
-
-    # % acciones cerradas desde estado_plan
-    if total_items_diag > 0:
-        n_cerradas = int((df_diag_f["estado_plan"] == "Cerrado").sum())
-        porcentaje_cerradas = round(100 * n_cerradas / total_items_diag, 1)
-    else:
-        porcentaje_cerradas = 0.0
-
-    # "Cumplimiento normativo" demo (cuanto menos brecha crítica, más alto)
-    if total_items_diag > 0:
-        ratio_criticos = n_brechas_criticas / total_items_diag
-        cumplimiento_3687 = max(0, min(100, round(100 - ratio_criticos * 60, 1)))
-    else:
-        cumplimiento_3687 = 0.0
+    # Críticos de diagnóstico (Muy bajo / Bajo), % acciones cerradas y
+    # "cumplimiento normativo" demo (cuanto menos brecha crítica, más alto)
+    n_brechas_criticas = kpis["brechas_criticas"]
+    total_items_diag = kpis["total"]
+    porcentaje_cerradas = kpis["porcentaje_cerradas"]
+    cumplimiento_3687 = kpis["cumplimiento_3687"]
 
     # Riesgo global instalación (demo a partir de df_sites)
     def map_riesgo_val(r):
@@ -1514,11 +1775,8 @@ def render_dashboard(instalacion_activa: str, perfil: str):
         # ---- Derecha: madurez + top brechas + “relato ejecutivo” ----
         with c_bottom:
             st.markdown('<div class="section-title">Madurez por pilar CCPS</div>', unsafe_allow_html=True)
-            if not df_diag_f.empty:
-                df_pilar = df_diag_f.copy()
-                df_pilar["score"] = df_pilar["calificacion"].apply(calificacion_to_score)
-                df_pilar = df_pilar.groupby("pilar", as_index=False)["score"].mean()
-                df_pilar["score"] = df_pilar["score"].round(1)
+            if total_items_diag > 0:
+                df_pilar = cubo.madurez_por("pilar", instalacion_activa)
 
                 chart_pilar = (
                     alt.Chart(df_pilar)
@@ -1535,6 +1793,7 @@ def render_dashboard(instalacion_activa: str, perfil: str):
                 st.info("Sin datos de diagnóstico para calcular madurez (demo).")
 
             st.markdown("#### Top 5 brechas (demo)")
+            df_diag_f = leer_tabla("diag", COLS_DIAG_TABLERO, instalacion_activa)
             prios = prioridades_desde_diag(df_diag_f, top_n=5)
             if not prios.empty:
                 st.dataframe(prios, use_container_width=True, hide_index=True)
@@ -1560,92 +1819,54 @@ def render_dashboard(instalacion_activa: str, perfil: str):
             unsafe_allow_html=True
         )
 
-        tab1, tab2, tab3 = st.tabs(["⚠️ Brechas y acciones", "📊 Elementos CCPS", "🏭 Por instalación"])
+        seccion = selector_secciones(
+            "tablero_seccion_tecnica", ["⚠️ Brechas y acciones", "📊 Elementos CCPS", "🏭 Por instalación"]
+        )
+        version_diag = ALMACEN.version("diag")
 
-        # --------- TAB 1: Brechas y acciones ----------
-        with tab1:
+        # --------- Brechas y acciones ----------
+        if seccion == "⚠️ Brechas y acciones":
+            datos = seccion_cacheada("brechas", _seccion_brechas, instalacion_activa, perfil, version_diag)
             col_b1, col_b2 = st.columns([1.7, 1.3])
 
             with col_b1:
                 st.markdown('<div class="section-title">Brechas priorizadas (demo)</div>', unsafe_allow_html=True)
-                prios = prioridades_desde_diag(df_diag_f, top_n=12)
-                if not prios.empty:
-                    st.dataframe(prios, use_container_width=True, hide_index=True)
+                if not datos["prios"].empty:
+                    st.dataframe(datos["prios"], use_container_width=True, hide_index=True)
                 else:
                     st.info("No hay brechas para mostrar (demo).")
 
             with col_b2:
                 st.markdown('<div class="section-title">Brechas críticas por elemento</div>', unsafe_allow_html=True)
-                if not df_diag_f.empty:
-                    df_crit = df_diag_f[crit_mask].copy()
-                    if not df_crit.empty:
-                        df_count_elem = (
-                            df_crit.groupby("elemento", as_index=False)["id"]
-                            .count()
-                            .rename(columns={"id": "Brechas críticas"})
-                        )
-                        chart_crit = (
-                            alt.Chart(df_count_elem)
-                            .mark_bar()
-                            .encode(
-                                x=alt.X("Brechas críticas:Q"),
-                                y=alt.Y("elemento:N", sort="-x", title="Elemento CCPS"),
-                                tooltip=["elemento", "Brechas críticas"]
-                            )
-                            .properties(height=260)
-                        )
-                        st.altair_chart(chart_crit, use_container_width=True)
+                if total_items_diag > 0:
+                    if n_brechas_criticas > 0:
+                        st.altair_chart(datos["chart_crit"], use_container_width=True)
                     else:
                         st.info("No hay ítems con calificación Muy bajo / Bajo (demo).")
                 else:
                     st.info("Sin datos de diagnóstico (demo).")
 
-        # --------- TAB 2: Elementos CCPS ----------
-        with tab2:
+        # --------- Elementos CCPS ----------
+        elif seccion == "📊 Elementos CCPS":
+            datos = seccion_cacheada("elementos", _seccion_elementos, instalacion_activa, perfil, version_diag)
             c_e1, c_e2 = st.columns([1.7, 1.3])
 
             with c_e1:
                 st.markdown('<div class="section-title">Madurez por elemento CCPS</div>', unsafe_allow_html=True)
-                if not df_diag_f.empty:
-                    df_elem = df_diag_f.copy()
-                    df_elem["score"] = df_elem["calificacion"].apply(calificacion_to_score)
-                    df_elem = df_elem.groupby("elemento", as_index=False)["score"].mean()
-                    df_elem["score"] = df_elem["score"].round(1)
-
-                    chart_elem = (
-                        alt.Chart(df_elem)
-                        .mark_bar()
-                        .encode(
-                            x=alt.X("score:Q", title="Madurez (%)", scale=alt.Scale(domain=[0, 100])),
-                            y=alt.Y("elemento:N", title="Elemento CCPS", sort="-x"),
-                            tooltip=["elemento", "score"]
-                        )
-                        .properties(height=320)
-                    )
-                    st.altair_chart(chart_elem, use_container_width=True)
+                if total_items_diag > 0:
+                    st.altair_chart(datos["chart_elem"], use_container_width=True)
                 else:
                     st.info("Sin datos de diagnóstico para calcular madurez (demo).")
 
             with c_e2:
                 st.markdown('<div class="section-title">Distribución de calificaciones</div>', unsafe_allow_html=True)
-                dist = resumen_calificaciones(df_diag_f)
-                if not dist.empty:
-                    chart_dist = (
-                        alt.Chart(dist)
-                        .mark_bar()
-                        .encode(
-                            x=alt.X("Calificación:N"),
-                            y=alt.Y("Cantidad:Q"),
-                            tooltip=["Calificación", "Cantidad"]
-                        )
-                        .properties(height=220)
-                    )
-                    st.altair_chart(chart_dist, use_container_width=True)
+                if datos["chart_dist"] is not None:
+                    st.altair_chart(datos["chart_dist"], use_container_width=True)
                 else:
                     st.info("Sin datos de diagnóstico (demo).")
 
-        # --------- TAB 3: Por instalación ----------
-        with tab3:
+        # --------- Por instalación ----------
+        else:
             st.markdown('<div class="section-title">Comparativo por instalación</div>', unsafe_allow_html=True)
             if instalacion_activa != "Todas":
                 st.info(
@@ -1653,46 +1874,35 @@ def render_dashboard(instalacion_activa: str, perfil: str):
                     "en la barra lateral."
                 )
             else:
-                if not df_diag_f.empty:
-                    df_site_mad = df_diag_f.copy()
-                    df_site_mad["score"] = df_site_mad["calificacion"].apply(calificacion_to_score)
-                    df_site_mad = df_site_mad.groupby("instalacion", as_index=False)["score"].mean()
-                    df_site_mad["score"] = df_site_mad["score"].round(1)
-
-                    chart_site = (
-                        alt.Chart(df_site_mad)
-                        .mark_bar()
-                        .encode(
-                            x=alt.X("instalacion:N", title="Instalación"),
-                            y=alt.Y("score:Q", title="Madurez (%)", scale=alt.Scale(domain=[0, 100])),
-                            tooltip=["instalacion", "score"]
-                        )
-                        .properties(height=280)
-                    )
-                    st.altair_chart(chart_site, use_container_width=True)
+                if total_items_diag > 0:
+                    datos = seccion_cacheada("instalaciones", _seccion_instalaciones, instalacion_activa, perfil, version_diag)
+                    st.altair_chart(datos["chart_site"], use_container_width=True)
 
                     st.markdown("#### Tabla resumen por instalación (demo)")
-                    st.dataframe(df_site_mad, use_container_width=True, hide_index=True)
+                    st.dataframe(datos["df_site_mad"], use_container_width=True, hide_index=True)
                 else:
                     st.info("Sin datos para construir el comparativo (demo).")
 
 
+@trazar
 def render_diagnostico(instalacion_activa: str, perfil: str):
     st.markdown("### Diagnóstico CCPS – Madurez, cultura y brechas")
 
     # --------------------------
-    # BASE: diagnostico filtrado por instalación
+    # BASE: diagnostico de la sesión (con ediciones) filtrado por instalación
     # --------------------------
+    estado = estado_diag_sesion()
+    df_sesion = estado["df"]
+    cubo = estado["cubo"]
     if instalacion_activa == "Todas":
-        df_diag_f = df_diag.copy()
+        df_diag_f = df_sesion
     else:
-        df_diag_f = df_diag[df_diag["instalacion"] == instalacion_activa]
+        df_diag_f = df_sesion[df_sesion["instalacion"] == instalacion_activa]
 
-    madurez_global = calcular_madurez_global(df_diag_f)
-    total_items = len(df_diag_f)
-    brechas_criticas = int(
-        df_diag_f["calificacion"].isin(["Muy bajo", "Bajo"]).sum()
-    )
+    kpis = cubo.kpis(instalacion_activa)
+    madurez_global = kpis["madurez"]
+    total_items = kpis["total"]
+    brechas_criticas = kpis["brechas_criticas"]
 
     # --------------------------
     # FILTROS SUPERIORES
@@ -1711,13 +1921,20 @@ def render_diagnostico(instalacion_activa: str, perfil: str):
     with fc3:
         solo_criticos = st.checkbox("Solo críticos (Muy bajo / Bajo)", value=False)
 
-    df_filtrado = df_diag_f.copy()
+    df_filtrado = df_diag_f
     if filtro_pilar != "Todos":
         df_filtrado = df_filtrado[df_filtrado["pilar"] == filtro_pilar]
     if filtro_elemento != "Todos":
         df_filtrado = df_filtrado[df_filtrado["elemento"] == filtro_elemento]
     if solo_criticos:
-        df_filtrado = df_filtrado[df_filtrado["calificacion"].isin(["Muy bajo", "Bajo"])]
+        df_filtrado = df_filtrado[df_filtrado["calificacion"].isin(CALIFICACIONES_CRITICAS)]
+
+    # mismos filtros, aplicados sobre las celdas del cubo
+    filtros_cubo = {
+        "pilar": None if filtro_pilar == "Todos" else filtro_pilar,
+        "elemento": None if filtro_elemento == "Todos" else filtro_elemento,
+        "calificacion": CALIFICACIONES_CRITICAS if solo_criticos else None,
+    }
 
     # =====================================================
     # CARD 1 – Calificación promedio + resumen por elemento
@@ -1768,15 +1985,11 @@ def render_diagnostico(instalacion_activa: str, perfil: str):
             label_visibility="collapsed",
         )
 
-        df_plot = df_filtrado.copy()
-        if df_plot.empty:
+        if df_filtrado.empty:
             st.info("No hay datos para el filtro seleccionado (demo).")
         else:
-            df_plot["score"] = df_plot["calificacion"].apply(calificacion_to_score)
-
             if modo_grafica == "Pilar CCPS":
-                df_plot = df_plot.groupby("pilar", as_index=False)["score"].mean()
-                df_plot["score"] = df_plot["score"].round(1)
+                df_plot = cubo.madurez_por("pilar", instalacion_activa, **filtros_cubo)
                 chart = (
                     alt.Chart(df_plot)
                     .mark_bar()
@@ -1793,8 +2006,7 @@ def render_diagnostico(instalacion_activa: str, perfil: str):
                     .properties(height=260)
                 )
             else:
-                df_plot = df_plot.groupby("elemento", as_index=False)["score"].mean()
-                df_plot["score"] = df_plot["score"].round(1)
+                df_plot = cubo.madurez_por("elemento", instalacion_activa, **filtros_cubo)
                 chart = (
                     alt.Chart(df_plot)
                     .mark_bar()
@@ -1852,6 +2064,43 @@ def render_diagnostico(instalacion_activa: str, perfil: str):
 
     st.markdown("</div>", unsafe_allow_html=True)
 
+    # =====================================================
+    # CARD 1b – Edición en vivo de calificaciones y plan
+    # =====================================================
+    with st.expander("✏️ Editar calificaciones y estado del plan (taller)", expanded=False):
+        st.caption(
+            "Cada cambio actualiza la madurez y las brechas aplicando solo la diferencia "
+            "(se resta el valor anterior y se suma el nuevo)."
+        )
+        df_edit = df_filtrado[["id", "pilar", "elemento", "descripcion", "calificacion", "estado_plan"]].copy()
+        df_edit["calificacion"] = df_edit["calificacion"].astype(str)
+        clave_editor = f"diag_editor_{estado['rev']}"
+        st.data_editor(
+            df_edit,
+            key=clave_editor,
+            use_container_width=True,
+            hide_index=True,
+            disabled=["id", "pilar", "elemento", "descripcion"],
+            column_config={
+                "calificacion": st.column_config.SelectboxColumn("calificacion", options=CALIFICACIONES, required=True),
+                "estado_plan": st.column_config.SelectboxColumn("estado_plan", options=ESTADOS_PLAN, required=True),
+            },
+            on_change=_aplicar_ediciones_diag,
+            args=(clave_editor, df_edit["id"].tolist()),
+        )
+
+        e1, e2 = st.columns([1, 2])
+        with e1:
+            st.caption(f"Cambios aplicados en esta sesión: {estado['n_cambios']}")
+        with e2:
+            if st.button("Verificar agregados contra recálculo completo"):
+                diferencias = cubo.verificar_consistencia(df_sesion)
+                if diferencias:
+                    st.error(f"{len(diferencias)} celdas no coinciden con el recálculo:")
+                    st.code("\n".join(diferencias[:50]))
+                else:
+                    st.success("El cubo coincide con el recálculo completo.")
+
     # =====================================================
     # CARD 2 – Cultura + simulador de impacto
     # =====================================================
@@ -1988,6 +2237,7 @@ def render_diagnostico(instalacion_activa: str, perfil: str):
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+@trazar
 def render_nodos(instalacion_activa: str):
     st.markdown("### Nodos & Estudios – Asistente de estudios y P&ID (DEMO)")
 
@@ -2130,6 +2380,8 @@ def render_nodos(instalacion_activa: str):
             )
             st.session_state["nodos_sugerencia_texto"] = texto
             st.session_state["nodos_estudios_rel"] = df_est_rel
+            # identifica el resultado para la grilla (la caché de consultas es compartida entre sesiones)
+            st.session_state["nodos_estudios_rel_version"] = huella_fuente(load_dummy_data, sorted(contexto.items()))
             st.session_state["nodos_relevantes_ids"] = nodos_rel_ids
 
     with col_a2:
@@ -2176,18 +2428,23 @@ def render_nodos(instalacion_activa: str):
 
     df_est_rel = st.session_state["nodos_estudios_rel"]
     if df_est_rel is not None and not df_est_rel.empty:
-        df_show = df_est_rel[[
-            "id_estudio",
-            "tipo",
-            "anio",
-            "instalacion",
-            "unidad",
-            "equipo",
-            "cobertura",
-            "estado",
-            "accion_sugerida",
-        ]].copy()
-        st.dataframe(df_show, use_container_width=True, hide_index=True)
+        grilla_paginada(
+            "grilla_nodos_estudios",
+            df_est_rel,
+            [
+                "id_estudio",
+                "tipo",
+                "anio",
+                "instalacion",
+                "unidad",
+                "equipo",
+                "cobertura",
+                "estado",
+                "accion_sugerida",
+            ],
+            clave="id_estudio",
+            version=st.session_state.get("nodos_estudios_rel_version"),
+        )
     else:
         st.info(
             "Aquí verás los estudios que el agente identifica como relacionados con el problema. "
@@ -2200,11 +2457,35 @@ def render_nodos(instalacion_activa: str):
     # BLOQUE C – Nodos & P&ID (vista limpia)
     # =====================================================
 
+    st.markdown("<div class='panel-card'>", unsafe_allow_html=True)
+    st.markdown(
+        """
+        <div class="panel-header">
+          <div class="panel-header-title">3. Nodos & P&ID resaltado (DEMO)</div>
+          <div class="panel-header-sub">
+            Cambia el P&ID y el nodo, y SKUDO ajusta el contexto y las recomendaciones.
+          </div>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+
+    _panel_pid(df_n_base)
+
+
+# ---------------------------------------------------------
+# Panel P&ID + nodo: fragmento, así cambiar de P&ID o de nodo solo vuelve a
+# ejecutar este panel y no la página completa.
+# ---------------------------------------------------------
+@fragmento
+def _panel_pid(df_n_base: pd.DataFrame):
     # Config por P&ID: qué imagen usar, qué nodos mostrar y mensaje base del agente
     pid_configs = {
         "P&ID 1 – Línea con Nodo 1 y 2": {
             "file": "Imagen1.png",          # imagen central (nodos 1 y 2)
             "ids": ["N-001"],
+            # zonas de resaltado (fracciones x0, y0, x1, y1 de la imagen)
+            "zonas": {"N-001": (0.17, 0.59, 0.995, 0.90)},
             "texto_agente": (
                 "Este diagrama muestra una **línea de proceso** con dos nodos principales. "
                 "Es clave revisar escenarios de **sobrepresión y fugas** en la línea, y "
@@ -2234,24 +2515,18 @@ def render_nodos(instalacion_activa: str):
         },
     }
 
-    st.markdown("<div class='panel-card'>", unsafe_allow_html=True)
-    st.markdown(
-        """
-        <div class="panel-header">
-          <div class="panel-header-title">3. Nodos & P&ID resaltado (DEMO)</div>
-          <div class="panel-header-sub">
-            Cambia el P&ID y el nodo, y SKUDO ajusta el contexto y las recomendaciones.
-          </div>
-        </div>
-        """,
-        unsafe_allow_html=True,
-    )
-
     if df_n_base.empty:
         st.info("No hay nodos configurados para esta instalación en la DEMO.")
         st.markdown("</div>", unsafe_allow_html=True)
         return
 
+    # -------- Miniaturas de los P&ID (WebP cacheados por contenido) --------
+    for col, (etiqueta, cfg) in zip(st.columns(len(pid_configs)), pid_configs.items()):
+        ruta_min = IMG_DIR / cfg["file"]
+        if ruta_min.exists():
+            with col:
+                st.image(str(derivados(ruta_min, confiable=True)["miniatura"]), caption=etiqueta, use_column_width=True)
+
     # -------- Selección de P&ID (arriba, horizontal) --------
     pid_label = st.radio(
         "Seleccione el P&ID a analizar",
@@ -2285,17 +2560,19 @@ def render_nodos(instalacion_activa: str):
     with col_img:
         ruta_img = IMG_DIR / pid_cfg["file"]
         try:
-            st.image(
-                str(ruta_img),
-                caption=pid_label,
-                use_column_width=True,
-            )
-        except Exception as e:
-            st.error(
-                f"No pude cargar la imagen '{ruta_img}'. "
-                "Verifica que exista en la carpeta 'imagenes' y que el nombre coincida.\n\n"
-                f"Detalle técnico: {e}"
-            )
+            # teselas precalculadas + resaltado en el navegador (no se reenvía la imagen)
+            visor_pid(ruta_img, pid_cfg.get("zonas"), activa=nodo_sel)
+            st.caption(pid_label)
+        except Exception:
+            # sin visor (teselas o Leaflet de static/ no disponibles): vista previa WebP cacheada
+            try:
+                st.image(str(derivados(ruta_img, confiable=True)["vista"]), caption=pid_label, use_column_width=True)
+            except Exception as e:
+                st.error(
+                    f"No pude cargar la imagen '{ruta_img}'. "
+                    "Verifica que exista en la carpeta 'imagenes' y que el nombre coincida.\n\n"
+                    f"Detalle técnico: {e}"
+                )
 
     with col_info:
         st.markdown('<div class="section-title">Detalle del nodo seleccionado</div>', unsafe_allow_html=True)
@@ -2308,13 +2585,27 @@ def render_nodos(instalacion_activa: str):
         st.write(f"- Pilar asociado: `{nodo_row['pilar']}`")
         st.write(f"- Descripción: {nodo_row['descripcion']}")
 
-        rels = [
-            r.strip() for r in str(nodo_row["relacionados"]).split("|") if r.strip()
-        ]
+        grafo = grafo_relaciones()
+        rels = grafo.vecinos_por_tipo(nodo_sel)
         if rels:
             st.markdown("**Nodos / referencias relacionadas (diagnóstico, acciones, requisitos):**")
-            for r in rels:
-                st.write(f"- {r}")
+            for tipo, refs in rels.items():
+                st.write(f"- {ETIQUETAS_TIPO.get(tipo, tipo)}: " + ", ".join(f"`{r}`" for r in refs))
+
+            requisitos = rels.get("requisito", [])
+            with st.expander("Análisis de impacto", expanded=False):
+                origen = st.selectbox(
+                    "Entidad de origen",
+                    options=requisitos + [nodo_sel],
+                    key="nodos_impacto_origen",
+                )
+                saltos = st.slider("Saltos máximos", 1, 5, 2, key="nodos_impacto_saltos")
+                df_imp = grafo.impactados_por(origen, k=saltos)
+                if df_imp.empty:
+                    st.info("Sin entidades relacionadas.")
+                else:
+                    df_imp["tipo"] = df_imp["tipo"].map(ETIQUETAS_TIPO).fillna(df_imp["tipo"])
+                    st.dataframe(df_imp, use_container_width=True, hide_index=True)
 
         st.markdown("---")
         st.markdown('<div class="section-title">Agente SKUDO – Recomendaciones para este nodo</div>', unsafe_allow_html=True)
@@ -2338,6 +2629,7 @@ def render_nodos(instalacion_activa: str):
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+@trazar
 def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
     st.markdown("### Análisis de riesgos de procesos (DEMO)")
 
@@ -2392,12 +2684,36 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
     if incluir_todos and instalacion_activa != "Todas":
         estudios_sel_ids = list(set(estudios_sel_ids + df_e["id_estudio"].tolist()))
 
+    with st.expander("Supuestos LOPA – PFD por tipo de IPL"):
+        st.caption(
+            "Frecuencia mitigada = frecuencia del evento iniciador × producto de las PFD de las IPL "
+            "acreditadas. Cambiar un supuesto recalcula todo el registro de escenarios."
+        )
+        pfd = supuestos_pfd()
+        df_pfd = st.data_editor(
+            pd.DataFrame({"ipl": list(pfd), "pfd": list(pfd.values())}),
+            use_container_width=True,
+            hide_index=True,
+            disabled=["ipl"],
+            column_config={
+                "ipl": st.column_config.TextColumn("IPL"),
+                "pfd": st.column_config.NumberColumn("PFD", min_value=1e-5, max_value=1.0, format="%.4f"),
+            },
+            key="lopa_pfd_editor",
+        )
+        # una celda borrada (NaN) o fuera de (0, 1] vuelve a la PFD genérica del IPL
+        st.session_state["lopa_pfd"] = supuestos_validos(dict(zip(df_pfd["ipl"], df_pfd["pfd"])))
+
     st.markdown("</div>", unsafe_allow_html=True)
 
     # -------------------------
     # 2. Escenarios consolidados y KPIs
     # -------------------------
-    df_rp = get_dummy_riesgos_por_estudios(estudios_sel_ids)
+    df_rp = riesgos_con_lopa(leer_tabla("riesgos", id_estudio=estudios_sel_ids or None))
+    version_rp = (
+        f"{ALMACEN.version('riesgos')}:{','.join(sorted(estudios_sel_ids))}:"
+        f"{sorted(supuestos_pfd().items())}"
+    )
     met = resumir_riesgos_y_acciones(df_rp)
 
     st.markdown("<div class='panel-card'>", unsafe_allow_html=True)
@@ -2434,11 +2750,62 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
     with k4:
         st.markdown("**Riesgo residual promedio (S×F)**")
         st.markdown(f"<h3 style='margin:0.1rem 0'>{met['prom_riesgo_residual']}</h3>", unsafe_allow_html=True)
+        st.caption(
+            f"LOPA: {met['n_muy_alto']} escenario(s) Muy alto · "
+            f"frecuencia mitigada total {met['frecuencia_mitigada_total']:.2e}/año"
+        )
         if met["top_peligros"]:
             st.caption("Peligros frecuentes: " + ", ".join(met["top_peligros"]))
         else:
             st.caption("Sin datos en la DEMO.")
 
+    # ---- Incertidumbre LOPA (Monte Carlo) ----
+    with st.expander("📈 Incertidumbre LOPA (Monte Carlo) – P5 / P50 / P95"):
+        st.caption(
+            "Muestrea la frecuencia del evento iniciador (lognormal, factor de error "
+            f"{FACTOR_ERROR_IEF:g}) y la PFD de cada IPL (beta con media = supuesto de arriba). "
+            "Útil para revisiones LOPA como E-002: ajusta la PFD del PSV y compara la banda P5–P95."
+        )
+        c_mc1, c_mc2, c_mc3 = st.columns([1.4, 1.0, 1.0])
+        with c_mc1:
+            n_muestras = st.select_slider(
+                "Muestras por escenario", options=[1_000, 2_000, 5_000, 10_000], value=2_000, key="mc_muestras"
+            )
+        with c_mc2:
+            semilla = int(st.number_input("Semilla", min_value=0, value=SEMILLA_MC, step=1, key="mc_semilla"))
+        with c_mc3:
+            mc_activo = st.toggle("Calcular distribución", key="mc_activo")
+
+        if mc_activo:
+            df_mc = incertidumbre_lopa(df_rp, n_muestras, semilla)
+            df_inc = df_rp[["id_escenario", "id_estudio", "descripcion_escenario", "n_ipl", "frecuencia_mitigada"]].merge(
+                df_mc, left_on="id_escenario", right_index=True, how="left"
+            )
+            df_top = top_k_df(df_inc, 30, ["p95", "id_escenario"], descendente=[True, False])
+            base_mc = alt.Chart(df_top).encode(
+                y=alt.Y("id_escenario:N", title="Escenario", sort=None),
+                tooltip=[
+                    "id_escenario", "id_estudio", "descripcion_escenario", "n_ipl",
+                    alt.Tooltip("p5:Q", format=".2e"), alt.Tooltip("p50:Q", format=".2e"),
+                    alt.Tooltip("p95:Q", format=".2e"),
+                ],
+            )
+            escala_log = alt.Scale(type="log")
+            chart_mc = (
+                base_mc.mark_rule(strokeWidth=2).encode(
+                    x=alt.X("p5:Q", title="Frecuencia mitigada (1/año, P5–P95)", scale=escala_log), x2="p95:Q"
+                )
+                + base_mc.mark_point(filled=True, size=60).encode(x=alt.X("p50:Q", scale=escala_log))
+            ).properties(height=max(160, 18 * len(df_top)))
+            st.altair_chart(chart_mc, use_container_width=True)
+            st.caption("Escenarios con mayor P95 (hasta 30).")
+            grilla_paginada(
+                "grilla_incertidumbre",
+                df_inc,
+                clave="id_escenario",
+                version=f"{version_rp}:{n_muestras}:{semilla}",
+            )
+
     st.markdown("---")
 
     # ==========================
@@ -2453,7 +2820,7 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
 
     # ---- TAB 1: Mapa de riesgo ----
     with tab_mapa:
-        st.markdown("#### Mapa de riesgo (Severidad vs Frecuencia) – DEMO")
+        st.markdown("#### Mapa de riesgo (Severidad vs Frecuencia residual LOPA) – DEMO")
 
         df_plot = df_rp.copy()
 
@@ -2461,7 +2828,7 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
             alt.Chart(df_plot)
             .mark_circle()
             .encode(
-                x=alt.X("frecuencia:Q", title="Frecuencia (1–5)", scale=alt.Scale(domain=[0.5, 5.5])),
+                x=alt.X("frecuencia_residual:Q", title="Frecuencia residual (1–5)", scale=alt.Scale(domain=[0.5, 5.5])),
                 y=alt.Y("severidad:Q", title="Severidad (1–5)", scale=alt.Scale(domain=[0.5, 5.5])),
                 size=alt.Size("riesgo_residual:Q", title="Riesgo residual (S×F)", scale=alt.Scale(range=[50, 800])),
                 color=alt.Color("nivel_riesgo:N", title="Nivel de riesgo"),
@@ -2478,6 +2845,8 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
                     "causa_principal",
                     "consecuencia_principal",
                     "salvaguardas_clave",
+                    "n_ipl",
+                    alt.Tooltip("frecuencia_mitigada:Q", title="Frecuencia mitigada (1/año)", format=".2e"),
                     "nivel_riesgo",
                     "riesgo_residual",
                     "tipo_accion",
@@ -2494,8 +2863,10 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
         )
 
         st.markdown("#### Tabla de escenarios (DEMO)")
-        st.dataframe(
-            df_plot[[
+        grilla_paginada(
+            "grilla_rp_escenarios",
+            df_rp,
+            [
                 "id_escenario",
                 "id_estudio",
                 "instalacion",
@@ -2508,17 +2879,16 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
                 "tipo_accion",
                 "clase_accion",
                 "accion_sugerida"
-            ]],
-            use_container_width=True,
-            hide_index=True
+            ],
+            clave="id_escenario",
+            version=version_rp,
         )
 
     # ---- TAB 2: Acciones generales / típicas ----
     with tab_generales:
         st.markdown("#### Acciones generales / típicas (para estandarizar)")
 
-        df_gen = df_rp[df_rp["tipo_accion"] == "General"].copy()
-        if df_gen.empty:
+        if not (df_rp["tipo_accion"] == "General").any():
             st.info("No hay acciones generales en los escenarios analizados (DEMO).")
         else:
             df_res = agrupar_acciones_generales(df_rp)
@@ -2527,8 +2897,10 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
 
             st.markdown("---")
             st.markdown("**Detalle de acciones generales por escenario**")
-            st.dataframe(
-                df_gen[[
+            grilla_paginada(
+                "grilla_rp_generales",
+                df_rp,
+                [
                     "id_escenario",
                     "id_estudio",
                     "instalacion",
@@ -2540,9 +2912,10 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
                     "clase_accion",
                     "nivel_riesgo",
                     "estado_accion"
-                ]],
-                use_container_width=True,
-                hide_index=True
+                ],
+                clave="id_escenario",
+                version=version_rp,
+                filtros={"tipo_accion": "General"},
             )
 
             st.caption(
@@ -2554,13 +2927,14 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
     with tab_equipo:
         st.markdown("#### Acciones y temas para trabajo en equipo")
 
-        df_team = df_rp[df_rp["tipo_accion"] == "Trabajo en equipo"].copy()
-        if df_team.empty:
+        if not (df_rp["tipo_accion"] == "Trabajo en equipo").any():
             st.info("No hay acciones marcadas como 'Trabajo en equipo' en los escenarios seleccionados (DEMO).")
         else:
             st.markdown("**Acciones / temas de sesión**")
-            st.dataframe(
-                df_team[[
+            grilla_paginada(
+                "grilla_rp_equipo",
+                df_rp,
+                [
                     "id_escenario",
                     "id_estudio",
                     "instalacion",
@@ -2574,9 +2948,10 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
                     "accion_sugerida",
                     "clase_accion",
                     "estado_accion"
-                ]],
-                use_container_width=True,
-                hide_index=True
+                ],
+                clave="id_escenario",
+                version=version_rp,
+                filtros={"tipo_accion": "Trabajo en equipo"},
             )
 
         st.markdown("---")
@@ -2595,14 +2970,30 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
         st.session_state["causa_rp_input"] = causa_actual
 
         if st.button("Buscar consecuencias y salvaguardas típicas (DEMO)"):
-            df_hist = get_dummy_riesgos_por_estudios([])  # todos en DEMO
-            texto_causa, df_match = sugerir_consecuencias_y_salvaguardas_por_causa(causa_actual, df_hist)
+            df_hist = leer_tabla("riesgos")  # todo el histórico
+            indice = indice_persistente(
+                "riesgos_causa",
+                ALMACEN.version("riesgos"),
+                df_hist,
+                tuple(CAMPOS_CAUSA),
+                "riesgo_residual",
+            )
+            st.session_state["causa_rp_resultado"] = sugerir_consecuencias_y_salvaguardas_por_causa(
+                causa_actual, df_hist, indice
+            )
+            st.session_state["causa_rp_version"] = huella_fuente(ALMACEN.version("riesgos"), causa_actual)
+
+        # El resultado queda en sesión para poder paginarlo sin repetir la búsqueda
+        if st.session_state.get("causa_rp_resultado"):
+            texto_causa, df_match = st.session_state["causa_rp_resultado"]
             st.markdown(texto_causa)
 
             if df_match is not None and not df_match.empty:
                 st.markdown("**Escenarios históricos utilizados como referencia (DEMO):**")
-                st.dataframe(
-                    df_match[[
+                grilla_paginada(
+                    "grilla_rp_causa",
+                    df_match,
+                    [
                         "id_escenario",
                         "id_estudio",
                         "instalacion",
@@ -2617,9 +3008,9 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
                         "riesgo_residual",
                         "tipo_accion",
                         "clase_accion"
-                    ]],
-                    use_container_width=True,
-                    hide_index=True
+                    ],
+                    clave="id_escenario",
+                    version=st.session_state.get("causa_rp_version"),
                 )
 
     # ---- TAB 4: Nodos & Estudios (TODO lo que ya tienes) ----
@@ -2631,16 +3022,14 @@ def render_analisis_riesgos_proceso(instalacion_activa: str, perfil: str):
 
 
 
+@trazar
 def render_analisis_riesgos(instalacion_activa: str):
     st.markdown("### Análisis de riesgos – Condiciones, causas, consecuencias y acciones (DEMO)")
 
     # -------------------------
     # 1. Selección de estudio
     # -------------------------
-    if instalacion_activa == "Todas":
-        df_e = df_estudios.copy()
-    else:
-        df_e = df_estudios[df_estudios["instalacion"] == instalacion_activa].copy()
+    df_e = leer_tabla("estudios", COLS_ESTUDIOS, instalacion_activa)
 
     st.markdown("<div class='panel-card'>", unsafe_allow_html=True)
     st.markdown(
@@ -2699,7 +3088,14 @@ def render_analisis_riesgos(instalacion_activa: str):
     # -------------------------
     # 2. Condiciones del estudio + agente
     # -------------------------
-    df_cond = get_dummy_condiciones_para_estudio(id_est_sel)
+    # Poda por partición (instalación/año del estudio) + predicado sobre id_estudio
+    df_cond = leer_tabla(
+        "condiciones",
+        COLS_CONDICIONES,
+        estudio_row["instalacion"],
+        anio=int(estudio_row["anio"]),
+        id_estudio=id_est_sel,
+    )
 
     st.markdown("<div class='panel-card'>", unsafe_allow_html=True)
     st.markdown(
@@ -2724,18 +3120,13 @@ def render_analisis_riesgos(instalacion_activa: str):
             )
         else:
             st.markdown("**Tabla de condiciones y acciones**")
-            df_show = df_cond[[
-                "id_condicion",
-                "condicion",
-                "causa",
-                "consecuencia",
-                "salvaguardas",
-                "accion_sugerida",
-                "tipo_accion",
-                "criticidad",
-                "estado_accion"
-            ]].copy()
-            st.dataframe(df_show, use_container_width=True, hide_index=True)
+            grilla_paginada(
+                "grilla_condiciones",
+                df_cond,
+                COLS_CONDICIONES,
+                clave="id_condicion",
+                version=f"{ALMACEN.version('condiciones')}:{id_est_sel}",
+            )
 
     with col_c2:
         st.markdown('<div class="section-title">Agente de análisis (DEMO)</div>', unsafe_allow_html=True)
@@ -2785,6 +3176,7 @@ def render_analisis_riesgos(instalacion_activa: str):
 # =========================================================
 # INFORME – AQUÍ VIENE LA PARTE CRÍTICA DEL % DE AVANCE
 # =========================================================
+@trazar
 def render_informe():
     st.markdown("### Informe de Seguridad – Construcción guiada (DEMO)")
 
@@ -2943,6 +3335,7 @@ def render_informe():
     st.button("Generar borrador de Informe de Seguridad (PDF/Word) – DEMO")
 
 
+@trazar
 def render_agente(instalacion_activa: str, perfil: str):
     st.markdown("### Mi Agente SKUDO – DEMO")
 
@@ -3033,23 +3426,28 @@ with st.sidebar:
     ]
     )
 
+etiquetar_corrida(pagina=menu, perfil=perfil, instalacion=instalacion_activa)
+
 
 
 # =========================================================
 # ROUTER
 # =========================================================
-if menu == "Tablero de control":
-    render_dashboard(instalacion_activa, perfil)
+# st.rerun() / st.stop() o un error también cierran la corrida de trazas
+with cuerpo_corrida():
+    if menu == "Tablero de control":
+        render_dashboard(instalacion_activa, perfil)
 
-elif menu == "Agente inteligente & Estudios":
-    render_agente_inteligente_estudios(instalacion_activa, perfil)
+    elif menu == "Agente inteligente & Estudios":
+        render_agente_inteligente_estudios(instalacion_activa, perfil)
 
-elif menu == "Análisis de riesgos de procesos":
-    render_analisis_riesgos_proceso(instalacion_activa, perfil)
+    elif menu == "Análisis de riesgos de procesos":
+        render_analisis_riesgos_proceso(instalacion_activa, perfil)
 
-elif menu == "Informe de Seguridad":
-    render_informe()
+    elif menu == "Informe de Seguridad":
+        render_informe()
 
-else:
-    render_agente(instalacion_activa, perfil)
+    else:
+        render_agente(instalacion_activa, perfil)
 
+panel_trazas(cerrar_corrida())
@@ -6,11 +6,23 @@ from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 
+from skudo_blobs import AlmacenBlobs
+from skudo_datos import cargar_versionado, ruta_datos
+from skudo_estudios import RepositorioEstudios
+from skudo_hazop import HojaHazop
+from skudo_madurez import calcular_madurez_global, madurez_por, preparar_diagnostico
+from skudo_pid import ERRORES_IMAGEN, derivados, derivados_guardados, es_imagen
+from skudo_prioridades import priorizar
+from skudo_texto import anotar_tokens, coincide_tokens, tokens_texto
+from skudo_trazas import cerrar_corrida, cuerpo_corrida, etiquetar_corrida, iniciar_corrida, panel_trazas, span, trazar
+from skudo_ui import editor_por_cambios, fragmento, parchar_celdas, rerun_fragmento
+
 # =========================================================
 # RUTAS
 # =========================================================
 BASE_DIR = Path(__file__).parent
 IMG_DIR = BASE_DIR / "imagenes"
+BLOBS = AlmacenBlobs(ruta_datos("blobs"))
 
 # =========================================================
 # CONFIG GENERAL
@@ -20,6 +32,7 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+iniciar_corrida("app6")
 
 # =========================================================
 # ESTILO PERSONALIZADO
@@ -171,10 +184,6 @@ st.markdown(
 # =========================================================
 # DATOS DUMMY
 # =========================================================
-def calificacion_to_score(calif: str) -> int:
-    mapping = {"Muy bajo": 20, "Bajo": 40, "Medio": 60, "Alto": 80, "Muy alto": 95}
-    return mapping.get(calif, 50)
-
 def load_dummy_data():
     df_sites = pd.DataFrame([
         {"sitio": "Planta Mezclas Norte", "lat": 6.2518, "lon": -75.5636, "riesgo_global": "ALTO", "madurez_ccps": 58},
@@ -193,7 +202,8 @@ def load_dummy_data():
     pilares = ["Compromiso", "Comprender el riesgo", "Gestionar el riesgo", "Aprender"]
     sitios = df_sites["sitio"].tolist()
 
-    np.random.seed(42)
+    # RNG local: no altera el estado global de NumPy compartido entre sesiones
+    rng = np.random.RandomState(42)
 
     # Diagnóstico CCPS (demo)
     diag_rows = []
@@ -201,13 +211,13 @@ def load_dummy_data():
     for i in range(1, 60):
         diag_rows.append({
             "id": f"D-{i:03d}",
-            "pilar": np.random.choice(pilares),
-            "elemento": np.random.choice(elementos),
-            "instalacion": np.random.choice(sitios),
+            "pilar": rng.choice(pilares),
+            "elemento": rng.choice(elementos),
+            "instalacion": rng.choice(sitios),
             "descripcion": f"Ítem de evaluación CCPS #{i}",
-            "calificacion": np.random.choice(califs, p=[0.1, 0.2, 0.3, 0.25, 0.15]),
+            "calificacion": rng.choice(califs, p=[0.1, 0.2, 0.3, 0.25, 0.15]),
             "evidencia": "Documento / Registros / Entrevistas",
-            "estado_plan": np.random.choice(["Sin plan", "En diseño", "En ejecución", "Cerrado"], p=[0.35, 0.25, 0.25, 0.15])
+            "estado_plan": rng.choice(["Sin plan", "En diseño", "En ejecución", "Cerrado"], p=[0.35, 0.25, 0.25, 0.15])
         })
     df_diag = pd.DataFrame(diag_rows)
 
@@ -282,7 +292,16 @@ def load_dummy_data():
 
     return df_sites, df_diag, df_nodos, df_estudios
 
-df_sites, df_diag, df_nodos, df_estudios = load_dummy_data()
+def cargar_datos():
+    """Carga + tokens de nodos y `score` del diagnóstico, una sola vez al ingerir."""
+    df_sites, df_diag, df_nodos, df_estudios = load_dummy_data()
+    df_diag = preparar_diagnostico(df_diag)
+    df_nodos = anotar_tokens(df_nodos, ["descripcion", "equipo", "unidad"])
+    return df_sites, df_diag, df_nodos, df_estudios
+
+# Cacheado por proceso y compartido entre sesiones; no mutar en sitio.
+with span("carga_datos"):
+    df_sites, df_diag, df_nodos, df_estudios = cargar_versionado("app6_dummy", cargar_datos, load_dummy_data)
 
 # =========================================================
 # ESTADO GLOBAL
@@ -319,43 +338,15 @@ def resumen_calificaciones(df_diag_filtrado: pd.DataFrame) -> pd.DataFrame:
     return (
         df_diag_filtrado["calificacion"]
         .value_counts()
+        .loc[lambda s: s > 0]
         .rename_axis("Calificación")
         .reset_index(name="Cantidad")
     )
 
-def calcular_madurez_global(df_diag_filtrado: pd.DataFrame) -> float:
-    if df_diag_filtrado.empty:
-        return 0.0
-    scores = df_diag_filtrado["calificacion"].apply(calificacion_to_score)
-    return round(scores.mean(), 1)
-
+@trazar
 def prioridades_desde_diag(df_diag_filtrado: pd.DataFrame, top_n: int = 5) -> pd.DataFrame:
-    if df_diag_filtrado.empty:
-        return pd.DataFrame(columns=["Tema", "Nivel", "Pilar", "Instalación", "Impacto", "Plazo sugerido"])
-
-    df = df_diag_filtrado.copy()
-    df["score"] = df["calificacion"].apply(calificacion_to_score)
-    df = df.sort_values("score").head(top_n)
-
-    prioridades = []
-    for _, row in df.iterrows():
-        s = row["score"]
-        if s <= 40:
-            nivel, plazo, impacto = "Crítico", "0–3 meses", "Muy alto"
-        elif s <= 60:
-            nivel, plazo, impacto = "Importante", "3–6 meses", "Alto"
-        else:
-            nivel, plazo, impacto = "Mejorable", "6–12 meses", "Medio"
-
-        prioridades.append({
-            "Tema": row["descripcion"],
-            "Nivel": nivel,
-            "Pilar": row["pilar"],
-            "Instalación": row["instalacion"],
-            "Impacto": impacto,
-            "Plazo sugerido": plazo
-        })
-    return pd.DataFrame(prioridades)
+    """Top-n brechas (motor vectorizado de skudo_prioridades; peor score primero)."""
+    return priorizar(df_diag_filtrado, top_n=top_n, col_tema="Tema")
 
 # =========================================================
 # HERO
@@ -397,6 +388,7 @@ def kpi_box(title: str, value: str, sub: str):
 # =========================================================
 # PANTALLA 1: TABLERO
 # =========================================================
+@trazar
 def render_dashboard(instalacion_activa: str, perfil: str):
     render_hero(instalacion_activa, perfil, "Tablero")
 
@@ -444,9 +436,7 @@ def render_dashboard(instalacion_activa: str, perfil: str):
         st.dataframe(pr, use_container_width=True, hide_index=True)
     with colR:
         if not df_diag_f.empty:
-            df_p = df_diag_f.copy()
-            df_p["score"] = df_p["calificacion"].apply(calificacion_to_score)
-            df_p = df_p.groupby("pilar", as_index=False)["score"].mean()
+            df_p = madurez_por(df_diag_f, "pilar")
             chart = (
                 alt.Chart(df_p)
                 .mark_bar()
@@ -483,6 +473,7 @@ def render_dashboard(instalacion_activa: str, perfil: str):
 # =========================================================
 # MOTOR “RECOMENDAR ESTUDIO” (reusa idea de nodos)
 # =========================================================
+@trazar
 def sugerir_estudio_y_estudios(contexto: dict, df_estudios_base: pd.DataFrame, df_nodos_base: pd.DataFrame):
     tipo_situacion = contexto.get("tipo_situacion", "")
     fase = contexto.get("fase", "")
@@ -510,9 +501,9 @@ def sugerir_estudio_y_estudios(contexto: dict, df_estudios_base: pd.DataFrame, d
     if instalacion != "Todas":
         df_rel = df_rel[df_rel["instalacion"] == instalacion]
     if unidad:
-        df_rel = df_rel[df_rel["unidad"].str.lower().str.contains(unidad, na=False)]
+        df_rel = df_rel[coincide_tokens(df_rel["unidad"], unidad)]
     if equipo:
-        df_rel = df_rel[df_rel["equipo"].str.lower().str.contains(equipo, na=False)]
+        df_rel = df_rel[coincide_tokens(df_rel["equipo"], equipo)]
     if df_rel.empty:
         df_rel = df_estudios_base[df_estudios_base["instalacion"] == instalacion] if instalacion != "Todas" else df_estudios_base
         df_rel = df_rel.head(3)
@@ -522,21 +513,25 @@ def sugerir_estudio_y_estudios(contexto: dict, df_estudios_base: pd.DataFrame, d
     if instalacion != "Todas":
         df_n = df_n[df_n["instalacion"] == instalacion]
 
-    def score_row(row):
-        text = (str(row.get("descripcion", "")) + " " + str(row.get("equipo", "")) + " " + str(row.get("unidad", ""))).lower()
-        score = 0
-        for token in desc.split():
-            if len(token) >= 5 and token in text:
-                score += 1
-        if equipo and equipo in text:
+    # consulta normalizada una vez; los nodos traen "tokens" desde la ingesta
+    desc_tokens = set(tokens_texto(desc))
+    unidad_tokens = set(tokens_texto(unidad))
+    equipo_tokens = set(tokens_texto(equipo))
+
+    def score_tokens(tokens_fila) -> int:
+        fila = set(tokens_fila)
+        score = len(desc_tokens & fila)
+        if equipo_tokens and equipo_tokens <= fila:
             score += 2
-        if unidad and unidad in text:
+        if unidad_tokens and unidad_tokens <= fila:
             score += 1
         return score
 
     if desc or unidad or equipo:
         df_n = df_n.copy()
-        df_n["score"] = df_n.apply(score_row, axis=1)
+        if "tokens" not in df_n.columns:
+            df_n = anotar_tokens(df_n, ["descripcion", "equipo", "unidad"])
+        df_n["score"] = [score_tokens(t) for t in df_n["tokens"]]
         df_n_rel = df_n[df_n["score"] >= 2].copy()
         if df_n_rel.empty:
             df_n_rel = df_n.head(3).copy()
@@ -556,18 +551,40 @@ def sugerir_estudio_y_estudios(contexto: dict, df_estudios_base: pd.DataFrame, d
 # =========================================================
 # ESTUDIOS – FLUJO COMPLETO (lo que pediste)
 # =========================================================
+# Los estudios viven en SQLite (skudo_estudios); la sesión solo guarda el id
+# activo (también en la URL, para recuperarlo tras una reconexión) y el estudio
+# activo ya cargado.
+ESTUDIOS = cargar_versionado(
+    "app6_estudios",
+    RepositorioEstudios,
+    BASE_DIR / "skudo_estudios.py",
+    args=(ruta_datos("estudios") / "estudios.sqlite3",),
+)
+
 if "estudios_flow" not in st.session_state:
-    st.session_state["estudios_flow"] = {"active_id": None, "items": {}}
+    st.session_state["estudios_flow"] = {"active_id": st.query_params.get("estudio"), "study": None}
 
 def new_study_id() -> str:
-    n = len(st.session_state["estudios_flow"]["items"]) + 1
-    return f"ST-2025-{n:04d}"
+    # crea el estudio en la base: el id se asigna en la misma transacción
+    return ESTUDIOS.crear()
+
+def set_active_study(sid: Optional[str]):
+    flow = st.session_state["estudios_flow"]
+    flow["active_id"] = sid
+    flow["study"] = None
+    if sid:
+        st.query_params["estudio"] = sid
+    else:
+        st.query_params.pop("estudio", None)
 
 def get_active_study() -> Optional[Dict[str, Any]]:
-    sid = st.session_state["estudios_flow"]["active_id"]
+    flow = st.session_state["estudios_flow"]
+    sid = flow["active_id"]
     if not sid:
         return None
-    return st.session_state["estudios_flow"]["items"].get(sid)
+    if flow["study"] is None or flow["study"]["study_id"] != sid:
+        flow["study"] = ESTUDIOS.cargar(sid)
+    return flow["study"]
 
 def ensure_study_struct(study: Dict[str, Any], instalacion_activa: str):
     study.setdefault("study_id", study.get("study_id") or new_study_id())
@@ -591,7 +608,7 @@ def ensure_study_struct(study: Dict[str, Any], instalacion_activa: str):
     study.setdefault("preparacion", {"pid_files": [], "disciplinas": [], "participantes": ""})
     study.setdefault("historico_estudios", pd.DataFrame())
     study.setdefault("nodos_rel", pd.DataFrame())
-    study.setdefault("hazop_by_nodo", {})  # {nodo_id: {"recomendacion_nodo":"", "rows":[...]}}
+    study.setdefault("hoja_hazop", HojaHazop())  # filas HAZOP de todos los nodos (columnar)
     study.setdefault("aprobacion", {"aprobado": False, "aprobador": "", "fecha": ""})
     study.setdefault("asignaciones", pd.DataFrame(columns=["id_row", "responsable", "fecha", "estado"]))
     study.setdefault("ai_log", [])
@@ -599,57 +616,134 @@ def ensure_study_struct(study: Dict[str, Any], instalacion_activa: str):
 def log_ai(study: Dict[str, Any], msg: str):
     study["ai_log"].append({"ts": datetime.now().strftime("%H:%M:%S"), "msg": msg})
 
-def build_prefab_hazop_from_nodos(nodos_df: pd.DataFrame, metodo: str) -> Dict[str, Any]:
+@trazar
+def build_prefab_hazop_from_nodos(nodos_df: pd.DataFrame, metodo: str) -> HojaHazop:
     """
-    Prefabricado DEMO: arma filas estilo HAZOP worksheet por nodo.
+    Prefabricado DEMO: arma la hoja HAZOP (columnar) con dos filas por nodo.
     """
-    out: Dict[str, Any] = {}
-    for _, n in nodos_df.iterrows():
-        nid = n["id"]
-        rec = (
-            f"Enfocar el {metodo} en este nodo: validar desviaciones, salvaguardas y acciones. "
-            f"Conectar con estudios previos y con plan de acción."
-        )
-        rows = [
-            {
-                "id_row": f"{nid}-R-001",
-                "Nodo": f"{n.get('unidad','')} – {n.get('equipo','')}".strip(" – "),
-                "Desviación": "Alta presión",
-                "Causa": "Falla del transmisor / bloqueo aguas abajo (editable)",
-                "Consecuencia": n.get("descripcion", ""),
-                "Salvaguarda": "Alarma de alta presión + PSV + procedimiento (editable)",
-                "Recomendación": ""
-            },
-            {
-                "id_row": f"{nid}-R-002",
-                "Nodo": f"{n.get('unidad','')} – {n.get('equipo','')}".strip(" – "),
-                "Desviación": "Pérdida de contención",
-                "Causa": "Corrosión / bridas / mantenimiento deficiente (editable)",
-                "Consecuencia": n.get("descripcion", ""),
-                "Salvaguarda": "Inspección + detección + contención (editable)",
-                "Recomendación": ""
-            },
-        ]
-        out[nid] = {"recomendacion_nodo": rec, "rows": rows}
-    return out
-
-def hazop_rows_to_df(hazop_by_nodo: Dict[str, Any]) -> pd.DataFrame:
-    all_rows = []
-    for nid, pack in hazop_by_nodo.items():
-        for r in pack.get("rows", []):
-            rr = r.copy()
-            rr["id_nodo"] = nid
-            all_rows.append(rr)
-    cols = ["id_row","id_nodo","Nodo","Desviación","Causa","Consecuencia","Salvaguarda","Recomendación"]
-    if not all_rows:
-        return pd.DataFrame(columns=cols)
-    df = pd.DataFrame(all_rows)
-    # asegurar orden de columnas
-    for c in cols:
-        if c not in df.columns:
-            df[c] = ""
-    return df[cols]
+    rec = (
+        f"Enfocar el {metodo} en este nodo: validar desviaciones, salvaguardas y acciones. "
+        f"Conectar con estudios previos y con plan de acción."
+    )
+    plantillas = [
+        ("R-001", "Alta presión",
+         "Falla del transmisor / bloqueo aguas abajo (editable)",
+         "Alarma de alta presión + PSV + procedimiento (editable)"),
+        ("R-002", "Pérdida de contención",
+         "Corrosión / bridas / mantenimiento deficiente (editable)",
+         "Inspección + detección + contención (editable)"),
+    ]
+    nodos = nodos_df.reindex(columns=["id", "unidad", "equipo", "descripcion"]).fillna("")
+    filas = []
+    for nid, unidad, equipo, descripcion in nodos.itertuples(index=False, name=None):
+        etiqueta = f"{unidad} – {equipo}".strip(" – ")
+        for sufijo, desviacion, causa, salvaguarda in plantillas:
+            filas.append({
+                "id_row": f"{nid}-{sufijo}",
+                "id_nodo": nid,
+                "Nodo": etiqueta,
+                "Desviación": desviacion,
+                "Causa": causa,
+                "Consecuencia": descripcion,
+                "Salvaguarda": salvaguarda,
+                "Recomendación": "",
+            })
+    return HojaHazop.desde_filas(filas, {nid: rec for nid in nodos["id"]})
+
+# Paso 4 como fragmento: elegir nodo o editar una fila del worksheet solo
+# vuelve a ejecutar este bloque, no la página completa.
+@fragmento
+def _curacion_nodo(study: Dict[str, Any]):
+    # Selector nodo
+    hoja = study["hoja_hazop"]
+    nid = st.selectbox("Nodo", hoja.nodos())
+
+    # Recomendación por nodo editable
+    hoja.set_recomendacion(nid, st.text_area(
+        "Recomendación para este nodo (editable)",
+        value=hoja.recomendacion(nid),
+        height=90
+    ))
+
+    # Worksheet por nodo (editor): vista directa de la hoja columnar; solo las
+    # celdas / filas cambiadas se aplican a la hoja
+    df_n = hoja.vista(nid)
+
+    def _aplicar_edicion(cambios):
+        n = hoja.aplicar_cambios(nid, df_n, cambios)
+        log_ai(study, f"Worksheet {nid}: {n} cambio(s) aplicados.")
+
+    st.markdown("**HAZOP Worksheet (solo este nodo)**")
+    editor_por_cambios(
+        f"hazop_node_{nid}",
+        df_n,
+        _aplicar_edicion,
+        use_container_width=True,
+        num_rows="dynamic",
+        hide_index=True,
+        disabled=["id_row"],
+    )
 
+    # Panel rápido de “sugerencias IA” (DEMO) tipo tu mockup
+    st.markdown("---")
+    st.markdown("**Sugerencia IA (DEMO) para la fila seleccionada**")
+    st.caption("Esto simula tu panel: similitud histórica + recomendación y botones.")
+
+    # elegimos una fila (si existe)
+    if not df_n.empty:
+        row_pick = st.selectbox(
+            "Selecciona fila para sugerencia",
+            options=df_n["id_row"].tolist(),
+            index=0
+        )
+        sug = (
+            "Inteligencia Histórica Detectada: escenario 92% similar a uno ocurrido en ‘Planta Cartagena (2022)’. "
+            "Sugerencia: evaluar trazado eléctrico en líneas de impulso para evitar congelamiento/obstrucción."
+        )
+        st.markdown(f"<div class='ai-box'><div class='ai-title'>{sug}</div><div class='ai-small'>Normas cruzadas (demo): NFPA 59A, ASME B31.8 chequeadas.</div></div>", unsafe_allow_html=True)
+
+        b1, b2, b3 = st.columns(3)
+        with b1:
+            if st.button("Aceptar sugerencia"):
+                # aplicarla a recomendación de esa fila
+                hoja.actualizar(
+                    row_pick, "Recomendación",
+                    "Evaluar trazado eléctrico en líneas de impulso para evitar congelamiento/obstrucción."
+                )
+                log_ai(study, f"Sugerencia aceptada en {row_pick}.")
+                rerun_fragmento()
+        with b2:
+            if st.button("Editar sugerencia"):
+                # no hace nada sofisticado; deja listo el campo en la tabla
+                log_ai(study, f"Sugerencia marcada para edición en {row_pick}.")
+                st.info("Edita directamente la celda 'Recomendación' en la tabla.")
+        with b3:
+            if st.button("Ignorar"):
+                log_ai(study, f"Sugerencia ignorada en {row_pick}.")
+                st.success("Ignorada (DEMO).")
+
+    cadd, cundo, cnext = st.columns([1,1,1])
+    with cadd:
+        if st.button("Agregar fila manual"):
+            hoja.agregar_fila(nid)
+            log_ai(study, f"Fila manual agregada en {nid}.")
+            rerun_fragmento()
+    with cundo:
+        if st.button("↶ Deshacer", disabled=not hoja.puede_deshacer, key="hazop_deshacer"):
+            hoja.deshacer()
+            log_ai(study, "Último cambio del worksheet deshecho.")
+            rerun_fragmento()
+    with cnext:
+        if st.button("Curación lista → Completar estudio"):
+            study["estado"] = "COMPLETAR"
+            log_ai(study, "Curación finalizada → completar estudio.")
+            ESTUDIOS.guardar_cambios(study)
+            st.rerun()  # cambia el estado del estudio: refrescar la página completa
+
+    # los reruns del fragmento no llegan al final de la página: guardar aquí
+    ESTUDIOS.guardar_cambios(study)
+
+@trazar
 def render_estudios_flujo(instalacion_activa: str, perfil: str):
     render_hero(instalacion_activa, perfil, "Agente inteligente & Estudios")
 
@@ -666,7 +760,7 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
             """, unsafe_allow_html=True
         )
 
-        existentes = list(st.session_state["estudios_flow"]["items"].keys())
+        existentes = ESTUDIOS.listar()
         opciones = ["(Crear nuevo)"] + existentes
 
         idx = 0
@@ -679,16 +773,18 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
             if sel == "(Crear nuevo)":
                 if st.button("Crear estudio"):
                     sid = new_study_id()
-                    st.session_state["estudios_flow"]["items"][sid] = {"study_id": sid}
-                    st.session_state["estudios_flow"]["active_id"] = sid
+                    set_active_study(sid)
                     st.rerun()
-            else:
-                st.session_state["estudios_flow"]["active_id"] = sel
+            elif sel != st.session_state["estudios_flow"]["active_id"]:
+                set_active_study(sel)
         with cbtn2:
             if st.button("Reset flujo (solo este estudio)"):
                 sid = st.session_state["estudios_flow"]["active_id"]
                 if sid:
-                    st.session_state["estudios_flow"]["items"][sid] = {"study_id": sid}
+                    ESTUDIOS.reiniciar(sid)
+                    # documentos que ya no usa ningún estudio
+                    BLOBS.limpiar({d.get("sha256") for d in ESTUDIOS.documentos()})
+                    set_active_study(sid)
                     st.rerun()
         st.markdown("</div>", unsafe_allow_html=True)
 
@@ -842,10 +938,73 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
                 accept_multiple_files=True,
                 type=["pdf","png","jpg","jpeg"]
             )
+            docs = study["preparacion"]["pid_files"]
+            conocidos = {d.get("sha256") for d in docs}
             if files:
+                # cada archivo se guarda por bloques en el almacén de blobs y el estudio
+                # lo referencia por SHA-256; las imágenes generan sus derivados una vez
+                subidos = st.session_state.setdefault("blobs_subidos", {})
+                nuevos = 0
                 for f in files:
-                    study["preparacion"]["pid_files"].append({"name": f.name, "size": f.size})
-                log_ai(study, f"Se cargaron {len(files)} documento(s) base.")
+                    id_subida = getattr(f, "file_id", None) or (f.name, f.size)
+                    if id_subida not in subidos:
+                        subidos[id_subida] = BLOBS.guardar(f)[0]
+                    sha = subidos[id_subida]
+                    if sha in conocidos:
+                        continue
+                    if es_imagen(f.name):
+                        try:
+                            derivados(BLOBS.ruta(sha), sha=sha)
+                        except ERRORES_IMAGEN as e:
+                            # se guarda igual como documento, sin miniatura
+                            st.warning(f"No se generó la vista previa de {f.name}: {e}")
+                    docs.append({"name": f.name, "size": f.size, "sha256": sha})
+                    conocidos.add(sha)
+                    nuevos += 1
+                if nuevos:
+                    log_ai(study, f"Se cargaron {nuevos} documento(s) base.")
+
+            # documentos ya guardados en otros estudios: se enlazan por hash, sin volver a subirlos
+            otros = {
+                d["sha256"]: d
+                for d in ESTUDIOS.documentos(excluir=study["study_id"])
+                if d.get("sha256") and d["sha256"] not in conocidos and BLOBS.existe(d["sha256"])
+            }
+            if otros:
+                reusar = st.multiselect(
+                    "Reutilizar documentos de otros estudios",
+                    list(otros),
+                    format_func=lambda sha: f"{otros[sha]['name']} ({otros[sha]['size'] / 1e6:.1f} MB)",
+                )
+                if reusar and st.button("Agregar documentos seleccionados"):
+                    docs.extend(dict(otros[sha]) for sha in reusar)
+                    log_ai(study, f"Se reutilizaron {len(reusar)} documento(s) de otros estudios.")
+                    st.rerun()
+
+            imagenes = [
+                (d["name"], rutas) for d in docs
+                if es_imagen(d["name"]) and (rutas := derivados_guardados(d.get("sha256", ""))) is not None
+            ]
+            if imagenes:
+                st.markdown("**P&ID cargados:**")
+                for col, (nombre, rutas) in zip(st.columns(4) * (len(imagenes) // 4 + 1), imagenes):
+                    with col:
+                        st.image(str(rutas["miniatura"]), caption=nombre, use_column_width=True)
+
+            guardados = [d for d in docs if BLOBS.existe(d.get("sha256", ""))]
+            if guardados:
+                with st.expander(f"Documentos del estudio ({len(guardados)})", expanded=False):
+                    doc = st.selectbox(
+                        "Documento", guardados,
+                        format_func=lambda d: f"{d['name']} · {d['size'] / 1e6:.1f} MB · {d['sha256'][:12]}",
+                    )
+                    # el contenido solo se lee al hacer clic (no en cada rerun)
+                    st.download_button(
+                        "Descargar",
+                        data=lambda sha=doc["sha256"]: BLOBS.leer(sha),
+                        file_name=doc["name"],
+                        key=f"blob_desc_{doc['sha256'][:12]}",
+                    )
 
             study["preparacion"]["disciplinas"] = st.multiselect(
                 "Disciplinas",
@@ -887,13 +1046,13 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
                 if st.button("Generar prefabricado (DEMO)"):
                     df_sel = study["nodos_rel"][study["nodos_rel"]["id"].isin(include)].copy()
                     metodo = study["recomendacion"]["metodo"] or "HAZOP"
-                    study["hazop_by_nodo"] = build_prefab_hazop_from_nodos(df_sel, metodo=metodo)
+                    study["hoja_hazop"] = build_prefab_hazop_from_nodos(df_sel, metodo=metodo)
                     study["estado"] = "CURACION"
                     log_ai(study, f"Prefabricado HAZOP generado para {len(include)} nodo(s).")
 
                 st.markdown("---")
                 st.markdown("**Vista previa consolidada del worksheet:**")
-                df_ws = hazop_rows_to_df(study["hazop_by_nodo"])
+                df_ws = study["hoja_hazop"].tabla()
                 st.dataframe(df_ws, use_container_width=True, hide_index=True)
 
         # ===== PASO 4 =====
@@ -901,94 +1060,16 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
             st.markdown("### 4) Curación humana por nodo")
             st.markdown("<div class='section-sub'>El humano define qué aplica por nodo: edita, agrega o quita filas.</div>", unsafe_allow_html=True)
 
-            if not study["hazop_by_nodo"]:
+            if not study["hoja_hazop"]:
                 st.warning("No hay prefabricado. Ve al paso 3.")
             else:
-                # Selector nodo
-                nodos = list(study["hazop_by_nodo"].keys())
-                nid = st.selectbox("Nodo", nodos)
-                pack = study["hazop_by_nodo"][nid]
-
-                # Recomendación por nodo editable
-                pack["recomendacion_nodo"] = st.text_area(
-                    "Recomendación para este nodo (editable)",
-                    value=pack.get("recomendacion_nodo",""),
-                    height=90
-                )
-
-                # Worksheet por nodo (editor)
-                df_n = pd.DataFrame(pack["rows"])
-                st.markdown("**HAZOP Worksheet (solo este nodo)**")
-                df_n_edit = st.data_editor(
-                    df_n,
-                    use_container_width=True,
-                    num_rows="dynamic",
-                    hide_index=True,
-                    key=f"hazop_node_{nid}"
-                )
-                pack["rows"] = df_n_edit.to_dict(orient="records")
-
-                # Panel rápido de “sugerencias IA” (DEMO) tipo tu mockup
-                st.markdown("---")
-                st.markdown("**Sugerencia IA (DEMO) para la fila seleccionada**")
-                st.caption("Esto simula tu panel: similitud histórica + recomendación y botones.")
-
-                # elegimos una fila (si existe)
-                if not df_n_edit.empty:
-                    row_pick = st.selectbox(
-                        "Selecciona fila para sugerencia",
-                        options=df_n_edit["id_row"].tolist(),
-                        index=0
-                    )
-                    sug = (
-                        "Inteligencia Histórica Detectada: escenario 92% similar a uno ocurrido en ‘Planta Cartagena (2022)’. "
-                        "Sugerencia: evaluar trazado eléctrico en líneas de impulso para evitar congelamiento/obstrucción."
-                    )
-                    st.markdown(f"<div class='ai-box'><div class='ai-title'>{sug}</div><div class='ai-small'>Normas cruzadas (demo): NFPA 59A, ASME B31.8 chequeadas.</div></div>", unsafe_allow_html=True)
-
-                    b1, b2, b3 = st.columns(3)
-                    with b1:
-                        if st.button("Aceptar sugerencia"):
-                            # aplicarla a recomendación de esa fila
-                            for r in pack["rows"]:
-                                if r.get("id_row") == row_pick:
-                                    r["Recomendación"] = "Evaluar trazado eléctrico en líneas de impulso para evitar congelamiento/obstrucción."
-                            log_ai(study, f"Sugerencia aceptada en {row_pick}.")
-                            st.rerun()
-                    with b2:
-                        if st.button("Editar sugerencia"):
-                            # no hace nada sofisticado; deja listo el campo en la tabla
-                            log_ai(study, f"Sugerencia marcada para edición en {row_pick}.")
-                            st.info("Edita directamente la celda 'Recomendación' en la tabla.")
-                    with b3:
-                        if st.button("Ignorar"):
-                            log_ai(study, f"Sugerencia ignorada en {row_pick}.")
-                            st.success("Ignorada (DEMO).")
-
-                cadd, cnext = st.columns([1,1])
-                with cadd:
-                    if st.button("Agregar fila manual"):
-                        pack["rows"].append({
-                            "id_row": f"{nid}-R-{len(pack['rows'])+1:03d}",
-                            "Nodo": "",
-                            "Desviación": "",
-                            "Causa": "",
-                            "Consecuencia": "",
-                            "Salvaguarda": "",
-                            "Recomendación": ""
-                        })
-                        log_ai(study, f"Fila manual agregada en {nid}.")
-                        st.rerun()
-                with cnext:
-                    if st.button("Curación lista → Completar estudio"):
-                        study["estado"] = "COMPLETAR"
-                        log_ai(study, "Curación finalizada → completar estudio.")
+                _curacion_nodo(study)
 
         # ===== PASO 5 =====
         elif paso == "5) Completar estudio":
             st.markdown("### 5) Completar el estudio (consolidado)")
 
-            df_ws = hazop_rows_to_df(study["hazop_by_nodo"])
+            df_ws = study["hoja_hazop"].tabla()
             if df_ws.empty:
                 st.warning("No hay filas. Vuelve al paso 3/4.")
             else:
@@ -1023,7 +1104,7 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
         else:
             st.markdown("### 7) Asignar responsables + fechas + enviar recomendaciones")
 
-            df_ws = hazop_rows_to_df(study["hazop_by_nodo"])
+            df_ws = study["hoja_hazop"].tabla()
             if df_ws.empty:
                 st.warning("No hay filas para asignar.")
             else:
@@ -1045,16 +1126,28 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
                             "fecha": [""] * len(df_to_assign),
                             "estado": ["Pendiente"] * len(df_to_assign)
                         })
+                        study["_deshacer_asignaciones"] = []
+
+                    # pila de deshacer: cada paso son las celdas anteriores ({pos: {col: valor}})
+                    deshacer_asig = study.setdefault("_deshacer_asignaciones", [])
+
+                    def _aplicar_asignaciones(cambios):
+                        deshacer_asig.append(parchar_celdas(study["asignaciones"], cambios.get("edited_rows", {})))
+                        del deshacer_asig[:-50]
 
                     st.caption("Completa responsable y fecha por recomendación.")
-                    asign = st.data_editor(
+                    editor_por_cambios(
+                        "asig_editor",
                         study["asignaciones"],
+                        _aplicar_asignaciones,
                         use_container_width=True,
                         hide_index=True,
                         num_rows="fixed",
-                        key="asig_editor"
+                        disabled=["id_row"],
                     )
-                    study["asignaciones"] = asign
+                    if st.button("↶ Deshacer", disabled=not deshacer_asig, key="asig_deshacer"):
+                        parchar_celdas(study["asignaciones"], deshacer_asig.pop())
+                        st.rerun()
 
                     c1, c2 = st.columns(2)
                     with c1:
@@ -1068,9 +1161,15 @@ def render_estudios_flujo(instalacion_activa: str, perfil: str):
 
         st.markdown("</div>", unsafe_allow_html=True)
 
+    # autoguardado: solo se escriben las partes / hojas que cambiaron en este rerun
+    ESTUDIOS.guardar_cambios(study)
+    if ESTUDIOS.ultimo_error is not None:
+        st.warning(f"No se pudo guardar el estudio: {ESTUDIOS.ultimo_error}")
+
 # =========================================================
 # PANTALLA 3: ANÁLISIS DE RIESGOS (separado del flujo)
 # =========================================================
+@trazar
 def render_analisis_riesgos(instalacion_activa: str, perfil: str):
     render_hero(instalacion_activa, perfil, "Análisis de riesgos")
 
@@ -1122,6 +1221,7 @@ def render_analisis_riesgos(instalacion_activa: str, perfil: str):
 # =========================================================
 # PANTALLA 4: INFORME
 # =========================================================
+@trazar
 def render_informe():
     render_hero("—", "—", "Informe de Seguridad (DEMO)")
 
@@ -1221,6 +1321,7 @@ def respuesta_dummy_chat(user_msg: str) -> str:
         f"Tu mensaje:\n> {user_msg}\n"
     )
 
+@trazar
 def render_agente_skudo(instalacion_activa: str, perfil: str):
     render_hero(instalacion_activa, perfil, "Mi Agente SKUDO")
 
@@ -1276,16 +1377,22 @@ with st.sidebar:
         index=0
     )
 
+etiquetar_corrida(pagina=menu, perfil=perfil, instalacion=instalacion_activa)
+
 # =========================================================
 # ROUTER (ORDEN PEDIDO)
 # =========================================================
-if menu == "Tablero":
-    render_dashboard(instalacion_activa, perfil)
-elif menu == "Estudios con SKUDO":
-    render_estudios_flujo(instalacion_activa, perfil)
-elif menu == "Análisis de riesgos":
-    render_analisis_riesgos(instalacion_activa, perfil)
-elif menu == "Informe":
-    render_informe()
-else:
-    render_agente_skudo(instalacion_activa, perfil)
+# st.rerun() / st.stop() o un error también cierran la corrida de trazas
+with cuerpo_corrida():
+    if menu == "Tablero":
+        render_dashboard(instalacion_activa, perfil)
+    elif menu == "Estudios con SKUDO":
+        render_estudios_flujo(instalacion_activa, perfil)
+    elif menu == "Análisis de riesgos":
+        render_analisis_riesgos(instalacion_activa, perfil)
+    elif menu == "Informe":
+        render_informe()
+    else:
+        render_agente_skudo(instalacion_activa, perfil)
+
+panel_trazas(cerrar_corrida())
@@ -0,0 +1,291 @@
+"""
+Benchmarks de las funciones puras de SKUDO sobre datos sintéticos.
+
+    python benchmark_skudo.py                      # escala "s" (10⁴ ítems)
+    python benchmark_skudo.py --escala l -r 3      # 10⁶ ítems, 3 repeticiones
+    python benchmark_skudo.py --solo prioridades   # solo casos que contengan el texto
+
+Las apps (app5.py, app6.py) son scripts de Streamlit que dibujan la página al
+importarse, así que las funciones se extraen de su código con `ast` (la
+función, las funciones que llama y los imports del módulo) y se ejecutan
+fuera de Streamlit.
+
+Cada corrida agrega una línea por caso a datos/benchmarks/resultados.jsonl
+con el commit de git. Al final se compara cada caso contra la última corrida
+de OTRO commit con la misma escala y se marcan las regresiones.
+"""
+import argparse
+import ast
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+
+
+# =========================================================
+# EXTRACCIÓN DE FUNCIONES DE LAS APPS
+# =========================================================
+def _nombres_usados(nodo: ast.AST) -> set[str]:
+    return {n.id for n in ast.walk(nodo) if isinstance(n, ast.Name)}
+
+
+def cargar_funciones(archivo: str, nombres: list[str]) -> dict:
+    """
+    Ejecuta solo los imports, las constantes literales y las funciones pedidas
+    (más las funciones del mismo archivo que estas llamen) de `archivo`.
+    """
+    arbol = ast.parse((BASE_DIR / archivo).read_text(encoding="utf-8"), filename=archivo)
+    funciones = {n.name: n for n in arbol.body if isinstance(n, ast.FunctionDef)}
+
+    necesarias, pendientes = set(), list(nombres)
+    while pendientes:
+        nombre = pendientes.pop()
+        if nombre in necesarias or nombre not in funciones:
+            continue
+        necesarias.add(nombre)
+        pendientes.extend(_nombres_usados(funciones[nombre]) & funciones.keys())
+
+    cuerpo = []
+    for nodo in arbol.body:
+        if isinstance(nodo, (ast.Import, ast.ImportFrom)):
+            cuerpo.append(nodo)
+        elif isinstance(nodo, ast.FunctionDef) and nodo.name in necesarias:
+            cuerpo.append(nodo)
+        elif isinstance(nodo, ast.Assign):
+            try:
+                ast.literal_eval(nodo.value)
+            except (ValueError, TypeError):
+                continue
+            cuerpo.append(nodo)
+
+    ns = {"__name__": f"bench_{Path(archivo).stem}", "__file__": str(BASE_DIR / archivo)}
+    exec(compile(ast.Module(body=cuerpo, type_ignores=[]), archivo, "exec"), ns)
+    faltan = [n for n in nombres if n not in ns]
+    if faltan:
+        raise KeyError(f"{archivo}: no se encontraron {faltan}")
+    return {n: ns[n] for n in nombres}
+
+
+# =========================================================
+# CASOS
+# =========================================================
+def construir_casos(n_diag: int, semilla: int) -> list[tuple[str, int, object]]:
+    """Lista de (nombre, filas procesadas, función sin argumentos)."""
+    from skudo_busqueda import CAMPOS_CAUSA, IndiceInvertido
+    from skudo_cubo import CuboDiagnostico
+    from skudo_grafo import GrafoCSR, GrafoRelaciones
+    from skudo_lopa import MotorLOPA, creditos_desde_salvaguardas, montecarlo
+    from skudo_madurez import calcular_madurez_global, preparar_diagnostico
+    from skudo_prioridades import priorizar
+    from skudo_ranking import top_k_df, top_k_por_lotes
+    from skudo_sintetico import generar
+    from skudo_texto import anotar_tokens, tokens_texto
+
+    t0 = time.perf_counter()
+    tablas = generar(n_diag=n_diag, semilla=semilla)
+    print(f"Datos sintéticos generados en {time.perf_counter() - t0:.1f} s "
+          + ", ".join(f"{k}={len(v):,}" for k, v in tablas.items()))
+
+    diag_crudo = tablas["diag"]
+    diag = preparar_diagnostico(diag_crudo)
+    riesgos = tablas["riesgos"]
+    estudios = tablas["estudios"]
+    nodos = anotar_tokens(tablas["nodos"], ["descripcion"])
+    nodos6 = anotar_tokens(tablas["nodos"], ["descripcion", "equipo", "unidad"])
+    planta = tablas["sites"]["sitio"].iloc[0]
+
+    app5 = cargar_funciones("app5.py", [
+        "prioridades_desde_diag", "build_resumen_elementos", "sugerir_estudio_y_estudios",
+        "sugerir_consecuencias_y_salvaguardas_por_causa", "agrupar_acciones_generales",
+        "clasificar_acciones_rp_agente",
+    ])
+    app6 = cargar_funciones("app6.py", [
+        "prioridades_desde_diag", "sugerir_estudio_y_estudios",
+        "build_prefab_hazop_from_nodos",
+    ])
+
+    contexto = {
+        "instalacion": planta,
+        "unidad": "Reactor",
+        "equipo": str(nodos["equipo"].iloc[0]),
+        "tipo_situacion": "Problema recurrente / desviación operacional",
+        "fase": "Operación",
+        "descripcion": "Disparos frecuentes del PSV por sobrepresión y bloqueo aguas abajo",
+    }
+    causa = "Sobrepresión por cierre inadvertido de válvula de salida"
+    indice = IndiceInvertido.construir(riesgos, CAMPOS_CAUSA, col_desempate="riesgo_residual")
+    cubo = CuboDiagnostico.desde_df(diag)
+    nodos_hazop = tablas["nodos"].head(min(len(tablas["nodos"]), 5_000))
+    hazop = app6["build_prefab_hazop_from_nodos"](nodos_hazop, "HAZOP")
+    nodo_hazop = hazop.nodos()[len(hazop) // 2]
+    vista_hazop = hazop.vista(nodo_hazop)
+    fila_hazop = vista_hazop["id_row"].iloc[0]
+    motor_lopa = MotorLOPA(riesgos, creditos_desde_salvaguardas(riesgos))
+    grafo_csr = GrafoCSR.desde_grafo(GrafoRelaciones.desde_tablas(tablas["nodos"], riesgos, estudios))
+
+    return [
+        ("madurez.preparar_diagnostico", len(diag), lambda: preparar_diagnostico(diag_crudo)),
+        ("madurez.calcular_madurez_global", len(diag), lambda: calcular_madurez_global(diag)),
+        ("app5.prioridades_desde_diag", len(diag), lambda: app5["prioridades_desde_diag"](diag, top_n=12)),
+        ("app6.prioridades_desde_diag", len(diag), lambda: app6["prioridades_desde_diag"](diag, top_n=8)),
+        ("prioridades.priorizar_ponderado", len(diag), lambda: priorizar(
+            diag, top_n=12, pesos={"score": 1.0, "pilar": 0.3, "estado_plan": 0.5})),
+        ("ranking.top_k_df_riesgo", len(riesgos),
+         lambda: top_k_df(riesgos, 10, ["riesgo_residual", "id_escenario"], descendente=[True, False])),
+        ("ranking.top_k_por_lotes", len(riesgos), lambda: top_k_por_lotes(
+            (riesgos.iloc[i:i + 100_000] for i in range(0, len(riesgos), 100_000)),
+            10, "riesgo_residual", descendente=True)),
+        ("app5.build_resumen_elementos", len(diag), lambda: app5["build_resumen_elementos"](diag)),
+        ("cubo.desde_df", len(diag), lambda: CuboDiagnostico.desde_df(diag)),
+        ("cubo.kpis", len(cubo.celdas), lambda: cubo.kpis(planta)),
+        ("texto.anotar_tokens", len(nodos), lambda: anotar_tokens(tablas["nodos"], ["descripcion"])),
+        ("app5.sugerir_estudio_y_estudios", len(nodos),
+         lambda: app5["sugerir_estudio_y_estudios"](contexto, estudios, nodos)),
+        ("app6.sugerir_estudio_y_estudios", len(nodos6),
+         lambda: app6["sugerir_estudio_y_estudios"](contexto, estudios, nodos6)),
+        ("busqueda.construir_indice", len(riesgos),
+         lambda: IndiceInvertido.construir(riesgos, CAMPOS_CAUSA, col_desempate="riesgo_residual")),
+        ("busqueda.buscar", len(riesgos), lambda: indice.buscar(list(tokens_texto(causa)), k=10)),
+        ("app5.sugerir_consecuencias_y_salvaguardas_por_causa", len(riesgos),
+         lambda: app5["sugerir_consecuencias_y_salvaguardas_por_causa"](causa, riesgos, indice)),
+        ("app5.agrupar_acciones_generales", len(riesgos), lambda: app5["agrupar_acciones_generales"](riesgos)),
+        ("app5.clasificar_acciones_rp_agente", len(riesgos), lambda: app5["clasificar_acciones_rp_agente"](riesgos)),
+        ("app6.build_prefab_hazop_from_nodos", len(nodos_hazop),
+         lambda: app6["build_prefab_hazop_from_nodos"](nodos_hazop, "HAZOP")),
+        ("hazop.actualizar_y_tabla", len(hazop.df), lambda: (
+            hazop.actualizar(fila_hazop, "Recomendación", "Revisar (benchmark)"), hazop.tabla())),
+        ("hazop.vista_nodo", len(hazop.df), lambda: hazop.vista(nodo_hazop)),
+        ("hazop.aplicar_cambios+deshacer", len(hazop.df), lambda: (
+            hazop.aplicar_cambios(nodo_hazop, vista_hazop, {"edited_rows": {0: {"Causa": "Bloqueo (benchmark)"}}}),
+            hazop.deshacer())),
+        ("lopa.creditos_desde_salvaguardas", len(riesgos), lambda: creditos_desde_salvaguardas(riesgos)),
+        ("lopa.evaluar_registro_pfd_psv", len(riesgos), lambda: motor_lopa.evaluar({"PSV": 0.05})),
+        ("lopa.montecarlo_2k_esc_x_1k", min(len(riesgos), 2_000) * 1_000, lambda: montecarlo(
+            motor_lopa, ids=riesgos["id_escenario"].head(2_000), n_muestras=1_000, procesos=1)),
+        ("grafo.desde_tablas", len(nodos) + len(riesgos),
+         lambda: GrafoRelaciones.desde_tablas(tablas["nodos"], riesgos, estudios)),
+        ("grafo_csr.bfs_3_saltos", grafo_csr.n_aristas, lambda: grafo_csr.bfs([0], k=3)),
+    ]
+
+
+# =========================================================
+# MEDICIÓN Y RESULTADOS
+# =========================================================
+def medir(fn, repeticiones: int) -> list[float]:
+    """Tiempos en ms (una corrida de calentamiento, GC apagado mientras se mide)."""
+    fn()
+    tiempos = []
+    gc_activo = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            fn()
+            tiempos.append((time.perf_counter() - t0) * 1000)
+    finally:
+        if gc_activo:
+            gc.enable()
+    return tiempos
+
+
+def commit_actual() -> tuple[str, bool]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        sucio = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR, capture_output=True, text=True
+        ).stdout.strip())
+        return commit, sucio
+    except (OSError, subprocess.CalledProcessError):
+        return "sin-git", False
+
+
+def leer_historial(ruta: Path) -> list[dict]:
+    if not ruta.exists():
+        return []
+    with open(ruta, encoding="utf-8") as fh:
+        return [json.loads(linea) for linea in fh if linea.strip()]
+
+
+def referencia_previa(historial: list[dict], caso: str, escala: str, commit: str) -> dict | None:
+    """Última medición del mismo caso y escala en otro commit."""
+    for reg in reversed(historial):
+        if reg["caso"] == caso and reg["escala"] == escala and reg["commit"] != commit:
+            return reg
+    return None
+
+
+def main(argv=None) -> int:
+    from skudo_datos import ruta_datos
+    from skudo_sintetico import ESCALAS
+
+    parser = argparse.ArgumentParser(description="Benchmarks de funciones puras de SKUDO")
+    parser.add_argument("--escala", choices=list(ESCALAS), default="s")
+    parser.add_argument("-r", "--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--solo", default="", help="filtra casos por texto")
+    parser.add_argument("--tolerancia", type=float, default=0.20, help="regresión si la mediana sube más de esto")
+    parser.add_argument("--fallar-si-regresion", action="store_true")
+    parser.add_argument("--no-guardar", action="store_true")
+    args = parser.parse_args(argv)
+
+    ruta = ruta_datos("benchmarks") / "resultados.jsonl"
+    historial = leer_historial(ruta)
+    commit, sucio = commit_actual()
+    n_diag = ESCALAS[args.escala]
+
+    casos = [c for c in construir_casos(n_diag, args.semilla) if args.solo in c[0]]
+    registros, regresiones = [], []
+    print(f"\n{'caso':<55} {'filas':>11} {'mín ms':>10} {'mediana ms':>11} {'vs previo':>10}")
+    for nombre, filas, fn in casos:
+        tiempos = medir(fn, args.repeticiones)
+        reg = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "sucio": sucio,
+            "escala": args.escala,
+            "n_diag": n_diag,
+            "caso": nombre,
+            "filas": int(filas),
+            "repeticiones": args.repeticiones,
+            "min_ms": round(min(tiempos), 3),
+            "mediana_ms": round(statistics.median(tiempos), 3),
+            "python": platform.python_version(),
+        }
+        registros.append(reg)
+
+        previo = referencia_previa(historial, nombre, args.escala, commit)
+        cambio = ""
+        if previo and previo["mediana_ms"] > 0:
+            ratio = reg["mediana_ms"] / previo["mediana_ms"]
+            cambio = f"{(ratio - 1) * 100:+.0f}%"
+            if ratio > 1 + args.tolerancia:
+                regresiones.append((nombre, previo["commit"], previo["mediana_ms"], reg["mediana_ms"]))
+                cambio += " !"
+        print(f"{nombre:<55} {filas:>11,} {reg['min_ms']:>10.2f} {reg['mediana_ms']:>11.2f} {cambio:>10}")
+
+    if not args.no_guardar:
+        with open(ruta, "a", encoding="utf-8") as fh:
+            for reg in registros:
+                fh.write(json.dumps(reg, ensure_ascii=False) + "\n")
+        print(f"\nResultados agregados a {ruta}")
+
+    if regresiones:
+        print(f"\nRegresiones (> {args.tolerancia:.0%} sobre la mediana previa):")
+        for nombre, commit_prev, antes, ahora in regresiones:
+            print(f"- {nombre}: {antes:.2f} ms ({commit_prev}) -> {ahora:.2f} ms")
+        if args.fallar_si_regresion:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
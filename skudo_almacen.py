@@ -0,0 +1,160 @@
+"""
+Almacén columnar (Parquet/Arrow) para las tablas de SKUDO.
+
+Cada tabla se guarda como un dataset Parquet particionado estilo Hive por
+`instalacion` y `anio` (carpetas instalacion=.../anio=.../*.parquet). Las
+lecturas usan proyección de columnas y empuje de predicados: solo se abren
+las particiones que cumplen el filtro y solo se decodifican las columnas
+pedidas, así que cada vista carga lo que muestra y nada más.
+"""
+import json
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import streamlit as st
+
+from skudo_datos import DATOS_TTL_S, huella_fuente
+
+PARTICIONES = ("instalacion", "anio")
+
+_ESQUEMA_PARTICION = pa.schema([
+    ("instalacion", pa.string()),
+    ("anio", pa.int64()),
+])
+
+
+def _particionado():
+    return ds.partitioning(_ESQUEMA_PARTICION, flavor="hive")
+
+
+def _expresion_filtro(filtros: dict):
+    """
+    Convierte {"col": valor} / {"col": [v1, v2]} en una expresión de Arrow.
+    Los filtros sobre columnas de partición descartan carpetas completas; el
+    resto se evalúa con las estadísticas de cada row group.
+    """
+    expr = None
+    for col, val in filtros.items():
+        if val is None:
+            continue
+        if isinstance(val, (list, tuple, set, frozenset)):
+            cond = ds.field(col).isin(list(val))
+        else:
+            cond = ds.field(col) == val
+        expr = cond if expr is None else (expr & cond)
+    return expr
+
+
+class AlmacenColumnar:
+    """
+    Conjunto de tablas Parquet bajo una carpeta raíz.
+    """
+
+    def __init__(self, raiz: Path):
+        self.raiz = Path(raiz)
+        self.raiz.mkdir(parents=True, exist_ok=True)
+
+    def ruta_tabla(self, nombre: str) -> Path:
+        return self.raiz / nombre
+
+    def existe(self, nombre: str) -> bool:
+        return (self.ruta_tabla(nombre) / "_columnas.json").exists()
+
+    def columnas(self, nombre: str) -> list[str]:
+        with open(self.ruta_tabla(nombre) / "_columnas.json", encoding="utf-8") as fh:
+            return json.load(fh)
+
+    # ---------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------
+    def escribir(self, nombre: str, df: pd.DataFrame):
+        """
+        Reescribe la tabla completa. `df` debe traer las columnas `instalacion`
+        y `anio` (las de partición).
+        """
+        faltan = [c for c in PARTICIONES if c not in df.columns]
+        if faltan:
+            raise ValueError(f"La tabla '{nombre}' no tiene columnas de partición: {faltan}")
+
+        destino = self.ruta_tabla(nombre)
+        if destino.exists():
+            shutil.rmtree(destino)
+        destino.mkdir(parents=True)
+
+        df = df.copy()
+        df["instalacion"] = df["instalacion"].fillna("Sin instalación").astype(str)
+        df["anio"] = df["anio"].astype("int64")
+        tabla = pa.Table.from_pandas(df, preserve_index=False)
+        ds.write_dataset(
+            tabla,
+            destino,
+            format="parquet",
+            partitioning=_particionado(),
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        # orden original de columnas (las de partición salen al final al leer).
+        # Los archivos con prefijo "_" los ignora pyarrow al abrir el dataset.
+        with open(destino / "_columnas.json", "w", encoding="utf-8") as fh:
+            json.dump(list(df.columns), fh, ensure_ascii=False)
+
+    def sembrar(self, tablas: dict[str, pd.DataFrame], version: str) -> bool:
+        """
+        Escribe todas las tablas si la versión registrada es distinta.
+        Devuelve True si hubo escritura.
+        """
+        marca = self.raiz / "_version"
+        if marca.exists() and marca.read_text(encoding="utf-8") == version and all(
+            self.existe(n) for n in tablas
+        ):
+            return False
+        for nombre, df in tablas.items():
+            self.escribir(nombre, df)
+        marca.write_text(version, encoding="utf-8")
+        return True
+
+    # ---------------------------------------------------------
+    # Lectura
+    # ---------------------------------------------------------
+    def leer(self, nombre: str, columnas: list[str] | None = None, **filtros) -> pd.DataFrame:
+        """
+        Lee solo las particiones y columnas necesarias.
+
+        Ejemplo: almacen.leer("diag", ["pilar", "calificacion"], instalacion="Planta Mezclas Norte")
+        """
+        orden = self.columnas(nombre)
+        if columnas is None:
+            columnas = orden
+        dataset = ds.dataset(
+            self.ruta_tabla(nombre),
+            format="parquet",
+            partitioning=_particionado(),
+        )
+        tabla = dataset.to_table(columns=list(columnas), filter=_expresion_filtro(filtros))
+        return tabla.to_pandas().reset_index(drop=True)
+
+    def version(self, nombre: str) -> str:
+        return huella_fuente(self.ruta_tabla(nombre))
+
+    def leer_cacheado(self, nombre: str, columnas: list[str] | None = None, **filtros) -> pd.DataFrame:
+        """
+        Igual que `leer`, pero compartido entre sesiones y reruns mientras los
+        archivos de la tabla no cambien. El resultado NO se debe mutar.
+        """
+        filtros_h = tuple(sorted(
+            (k, tuple(sorted(v)) if isinstance(v, (list, tuple, set, frozenset)) else v)
+            for k, v in filtros.items() if v is not None
+        ))
+        cols_h = tuple(columnas) if columnas is not None else None
+        return _leer_cacheado(str(self.raiz), nombre, self.version(nombre), cols_h, filtros_h)
+
+
+@st.cache_resource(ttl=DATOS_TTL_S, max_entries=256, show_spinner=False)
+def _leer_cacheado(raiz: str, nombre: str, version: str, columnas, filtros) -> pd.DataFrame:
+    return AlmacenColumnar(Path(raiz)).leer(
+        nombre,
+        list(columnas) if columnas is not None else None,
+        **dict(filtros),
+    )
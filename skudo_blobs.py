@@ -0,0 +1,113 @@
+"""
+Almacén de archivos direccionado por contenido.
+
+Cada archivo (P&ID, PDF de estudio...) se guarda una sola vez en
+<raiz>/<sha256[:2]>/<sha256>, y los estudios lo referencian por su hash. Subir
+el mismo documento en varios estudios no ocupa más espacio.
+
+La escritura es por bloques: se lee la fuente de a CHUNK bytes, se va
+calculando el SHA-256 y escribiendo a un temporal, y al final se renombra
+(atómico) o se descarta si el contenido ya existía. Nunca se arma una copia
+completa en memoria. La lectura sí es completa (`leer`): solo se usa al
+descargar y st.download_button copia el contenido a bytes de todos modos.
+
+Los blobs que ningún estudio referencia se borran con `limpiar`, respetando
+un margen (GRACIA_LIMPIEZA_S) para no borrar uno recién subido cuyo estudio
+todavía no se guardó.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+CHUNK = 1024 * 1024
+GRACIA_LIMPIEZA_S = 3600
+
+
+class AlmacenBlobs:
+    """
+    Blobs inmutables bajo una carpeta raíz, identificados por SHA-256.
+    """
+
+    def __init__(self, raiz: Path):
+        self.raiz = Path(raiz)
+        (self.raiz / "tmp").mkdir(parents=True, exist_ok=True)
+
+    def ruta(self, sha: str) -> Path:
+        return self.raiz / sha[:2] / sha
+
+    def existe(self, sha: str) -> bool:
+        return bool(sha) and self.ruta(sha).exists()
+
+    def tamano(self, sha: str) -> int:
+        return self.ruta(sha).stat().st_size
+
+    # ---------------------------------------------------------
+    # Escritura
+    # ---------------------------------------------------------
+    def guardar(self, fuente) -> tuple[str, int, bool]:
+        """
+        Guarda un archivo binario abierto (file-like con .read), por bloques.
+        Devuelve (sha256, tamaño, nuevo); nuevo=False si ya estaba guardado.
+        """
+        if hasattr(fuente, "seek"):
+            fuente.seek(0)
+        h = hashlib.sha256()
+        tamano = 0
+        fd, tmp = tempfile.mkstemp(dir=self.raiz / "tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for bloque in iter(lambda: fuente.read(CHUNK), b""):
+                    h.update(bloque)
+                    out.write(bloque)
+                    tamano += len(bloque)
+            sha = h.hexdigest()
+            destino = self.ruta(sha)
+            if destino.exists():
+                os.unlink(tmp)
+                os.utime(destino)  # recién usado: la limpieza lo respeta
+                return sha, tamano, False
+            destino.parent.mkdir(exist_ok=True)
+            os.replace(tmp, destino)
+            return sha, tamano, True
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def guardar_archivo(self, ruta: Path) -> tuple[str, int, bool]:
+        with open(ruta, "rb") as fh:
+            return self.guardar(fh)
+
+    # ---------------------------------------------------------
+    # Lectura
+    # ---------------------------------------------------------
+    def leer(self, sha: str) -> bytes:
+        """Contenido completo (una copia en memoria; usar solo al descargar)."""
+        return self.ruta(sha).read_bytes()
+
+    # ---------------------------------------------------------
+    # Limpieza
+    # ---------------------------------------------------------
+    def limpiar(self, referenciados: set[str], gracia_s: float = GRACIA_LIMPIEZA_S) -> int:
+        """
+        Borra los blobs que no están en `referenciados` (y temporales
+        abandonados) con más de `gracia_s` segundos sin usarse. Devuelve
+        cuántos borró.
+        """
+        limite = time.time() - gracia_s
+        borrados = 0
+        for carpeta in self.raiz.iterdir():
+            if not carpeta.is_dir():
+                continue
+            for f in carpeta.iterdir():
+                if carpeta.name != "tmp" and f.name in referenciados:
+                    continue
+                try:
+                    if f.stat().st_mtime < limite:
+                        f.unlink()
+                        borrados += 1
+                except FileNotFoundError:
+                    pass
+        return borrados
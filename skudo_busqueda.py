@@ -0,0 +1,161 @@
+"""
+Índice invertido con ranking BM25 para el histórico de escenarios de riesgo.
+
+Se construye una vez (por versión de los datos), se guarda en disco y se
+comparte entre sesiones. Una consulta solo recorre las listas de postings de
+sus términos, así que el costo depende de cuántos escenarios contienen esas
+palabras y no del tamaño total del histórico.
+"""
+import pickle
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from skudo_datos import DATOS_TTL_S, ruta_datos
+from skudo_ranking import top_k
+from skudo_texto import tokens_texto
+
+# Subir si cambia el formato del índice o el tokenizador (invalida los .pkl)
+INDICE_VERSION = 3
+
+# Campos del histórico sobre los que se busca una causa
+CAMPOS_CAUSA = ["causa_principal", "descripcion_escenario", "tipo_peligro"]
+
+
+class IndiceInvertido:
+    """
+    Índice término -> (posiciones de documento, frecuencias) con BM25.
+
+    Los documentos se identifican por su posición en el DataFrame de origen
+    (usar df.iloc[posiciones] para recuperar las filas).
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.n_docs = 0
+        self.long_docs = np.zeros(0, dtype=np.float32)
+        self.long_media = 0.0
+        self.desempate = np.zeros(0, dtype=np.float64)
+        # término -> (docs int32, tf float32, idf)
+        self.postings: dict[str, tuple[np.ndarray, np.ndarray, float]] = {}
+
+    # ---------------------------------------------------------
+    # Construcción
+    # ---------------------------------------------------------
+    @classmethod
+    def construir(
+        cls,
+        df: pd.DataFrame,
+        campos: list[str],
+        col_desempate: str | None = None,
+        col_tokens: str | None = None,
+        **kwargs,
+    ) -> "IndiceInvertido":
+        """
+        Si `col_tokens` existe en `df` (tokens precalculados al ingerir con
+        skudo_texto.anotar_tokens) se usa tal cual; si no, se tokenizan los campos.
+        """
+        idx = cls(**kwargs)
+        n = len(df)
+        idx.n_docs = n
+
+        if col_tokens and col_tokens in df.columns:
+            secuencias = df[col_tokens].tolist()
+        else:
+            textos = df[campos[0]].fillna("").astype(str)
+            for c in campos[1:]:
+                textos = textos + " " + df[c].fillna("").astype(str)
+            secuencias = [tokens_texto(t) for t in textos.tolist()]
+
+        docs_por_termino: dict[str, list[int]] = {}
+        tf_por_termino: dict[str, list[int]] = {}
+        longitudes = np.zeros(n, dtype=np.float32)
+        for pos, tokens in enumerate(secuencias):
+            longitudes[pos] = len(tokens)
+            for termino, tf in Counter(tokens).items():
+                docs_por_termino.setdefault(termino, []).append(pos)
+                tf_por_termino.setdefault(termino, []).append(tf)
+
+        idx.long_docs = longitudes
+        idx.long_media = float(longitudes.mean()) if n else 0.0
+        for termino, docs in docs_por_termino.items():
+            df_t = len(docs)
+            idf = float(np.log(1.0 + (n - df_t + 0.5) / (df_t + 0.5)))
+            idx.postings[termino] = (
+                np.asarray(docs, dtype=np.int32),
+                np.asarray(tf_por_termino[termino], dtype=np.float32),
+                idf,
+            )
+
+        if col_desempate and col_desempate in df.columns:
+            idx.desempate = pd.to_numeric(df[col_desempate], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        else:
+            idx.desempate = np.zeros(n, dtype=np.float64)
+        return idx
+
+    # ---------------------------------------------------------
+    # Consulta
+    # ---------------------------------------------------------
+    def buscar(self, terminos: list[str], k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Devuelve (posiciones, puntajes) de los k mejores documentos según BM25.
+        Los empates se resuelven por la columna de desempate (mayor primero).
+        """
+        docs_l, contrib_l = [], []
+        for termino in dict.fromkeys(terminos):
+            post = self.postings.get(termino)
+            if post is None:
+                continue
+            docs, tf, idf = post
+            norm = self.k1 * (1.0 - self.b + self.b * self.long_docs[docs] / max(self.long_media, 1e-9))
+            docs_l.append(docs)
+            contrib_l.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+
+        if not docs_l:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        # acumular por documento solo sobre los postings tocados
+        todos = np.concatenate(docs_l)
+        candidatos, inv = np.unique(todos, return_inverse=True)
+        puntajes = np.bincount(inv, weights=np.concatenate(contrib_l).astype(np.float64))
+
+        mejores = top_k([puntajes, self.desempate[candidatos]], k, descendente=True)
+        return candidatos[mejores].astype(np.int64), puntajes[mejores]
+
+    # ---------------------------------------------------------
+    # Persistencia
+    # ---------------------------------------------------------
+    def guardar(self, ruta: Path):
+        tmp = Path(ruta).with_suffix(".tmp")
+        with open(tmp, "wb") as fh:
+            pickle.dump(self, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(ruta)
+
+    @staticmethod
+    def cargar(ruta: Path) -> "IndiceInvertido":
+        with open(ruta, "rb") as fh:
+            return pickle.load(fh)
+
+
+@st.cache_resource(ttl=DATOS_TTL_S, max_entries=8, show_spinner=False)
+def indice_persistente(nombre: str, version: str, _df: pd.DataFrame, campos: tuple, col_desempate: str | None = None):
+    """
+    Índice compartido entre sesiones. Si ya existe en disco para esta versión
+    de los datos se carga; si no, se construye y se guarda.
+    """
+    ruta = ruta_datos("indices") / f"{nombre}-v{INDICE_VERSION}-{version}.pkl"
+    if ruta.exists():
+        try:
+            return IndiceInvertido.cargar(ruta)
+        except Exception:
+            ruta.unlink(missing_ok=True)
+    idx = IndiceInvertido.construir(_df, list(campos), col_desempate=col_desempate)
+    idx.guardar(ruta)
+    for viejo in ruta.parent.glob(f"{nombre}-*.pkl"):
+        if viejo != ruta:
+            viejo.unlink(missing_ok=True)
+    return idx
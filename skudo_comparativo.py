@@ -0,0 +1,75 @@
+"""
+Motor de comparación entre instalaciones.
+
+El comparativo "Por instalación" calcula lo mismo para cada sitio (KPIs,
+lectura de su partición del diagnóstico, brecha principal...). En vez de
+hacerlo en serie en el hilo del rerun, `comparar` reparte un cálculo por
+instalación en un pool de hilos compartido por el proceso (concurrencia
+acotada a HILOS) y junta los resultados en un solo DataFrame para los
+gráficos. La lectura de Parquet y la mayor parte de pandas/NumPy liberan el
+GIL, así que "Todas" tarda del orden de la instalación más lenta.
+
+Cada resultado se memoriza por (nombre del cálculo, versión de los datos,
+instalación), con tope LRU, y se comparte entre sesiones: dos sesiones que
+piden el mismo sitio a la vez esperan el mismo cálculo.
+
+IMPORTANTE: el cálculo corre fuera del hilo de Streamlit; no debe usar `st.*`
+ni llamar a `comparar` (usaría el mismo pool).
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pandas as pd
+
+HILOS = int(os.environ.get("SKUDO_COMPARATIVO_HILOS", str(min(16, 2 * (os.cpu_count() or 4)))))
+MEMO_MAX = 4096
+
+_pool = ThreadPoolExecutor(max_workers=HILOS, thread_name_prefix="skudo-comparativo")
+_memo: "OrderedDict[tuple, Future]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _futuro(nombre: str, version: str, instalacion: str, calculo, args: tuple) -> Future:
+    clave = (nombre, version, instalacion)
+    with _lock:
+        fut = _memo.get(clave)
+        # un cálculo que falló se vuelve a intentar
+        if fut is not None and not (fut.done() and fut.exception() is not None):
+            _memo.move_to_end(clave)
+            return fut
+        fut = _pool.submit(calculo, instalacion, *args)
+        _memo[clave] = fut
+        while len(_memo) > MEMO_MAX:
+            _memo.popitem(last=False)
+    return fut
+
+
+def _como_df(instalacion: str, resultado) -> pd.DataFrame:
+    df = pd.DataFrame([resultado]) if isinstance(resultado, dict) else pd.DataFrame(resultado)
+    if "instalacion" not in df.columns:
+        df.insert(0, "instalacion", instalacion)
+    return df
+
+
+def comparar(nombre: str, calculo, instalaciones, version: str, args: tuple = ()) -> pd.DataFrame:
+    """
+    Ejecuta `calculo(instalacion, *args)` para cada instalación en paralelo y
+    devuelve el consolidado (una fila por dict devuelto, o las filas de cada
+    DataFrame), en el orden de `instalaciones`, con columna "instalacion".
+    `version` debe cambiar cuando cambian los datos o los `args`.
+    """
+    instalaciones = list(dict.fromkeys(instalaciones))
+    futuros = [(inst, _futuro(nombre, version, inst, calculo, tuple(args))) for inst in instalaciones]
+    partes = [_como_df(inst, fut.result()) for inst, fut in futuros]
+    if not partes:
+        return pd.DataFrame(columns=["instalacion"])
+    return pd.concat(partes, ignore_index=True)
+
+
+def olvidar(nombre: str | None = None):
+    """Descarta los resultados memorizados (de un cálculo o de todos)."""
+    with _lock:
+        for clave in [c for c in _memo if nombre is None or c[0] == nombre]:
+            del _memo[clave]
@@ -0,0 +1,172 @@
+"""
+Cubo de agregación del diagnóstico CCPS.
+
+En vez de filtrar y agrupar las filas del diagnóstico en cada rerun, se
+materializa una vez un cubo con una celda por combinación
+(instalacion, pilar, elemento, calificacion, estado_plan) que guarda el número
+de ítems y la suma de `score`. Todos los KPIs y gráficos del tablero salen de
+rebanar esas celdas: cambiar de instalación cuesta O(celdas), no O(filas).
+
+El cubo se puede actualizar sumando o restando lotes de filas (`sumar`) o
+aplicando la edición de un ítem (`aplicar_cambio`: se resta la contribución
+anterior y se suma la nueva), sin reconstruirlo. `verificar_consistencia`
+compara contra un recálculo completo.
+"""
+import pandas as pd
+
+from skudo_madurez import CALIFICACIONES, calificacion_to_score, con_score
+
+DIMENSIONES = ("instalacion", "pilar", "elemento", "calificacion", "estado_plan")
+CALIFICACIONES_CRITICAS = ("Muy bajo", "Bajo")
+ESTADO_CERRADO = "Cerrado"
+
+
+def _clave(fila) -> tuple:
+    return tuple(str(fila[d]) for d in DIMENSIONES)
+
+
+class CuboDiagnostico:
+    """
+    Celdas {(instalacion, pilar, elemento, calificacion, estado_plan): [n, suma_score]}.
+    """
+
+    def __init__(self):
+        self.celdas: dict[tuple, list] = {}
+        self._tabla: pd.DataFrame | None = None
+
+    @classmethod
+    def desde_df(cls, df_diag: pd.DataFrame) -> "CuboDiagnostico":
+        cubo = cls()
+        cubo.sumar(df_diag)
+        return cubo
+
+    def copia(self) -> "CuboDiagnostico":
+        """Copia independiente (p. ej. para editar en una sesión sin tocar el cubo compartido)."""
+        nuevo = CuboDiagnostico()
+        nuevo.celdas = {k: list(v) for k, v in self.celdas.items()}
+        return nuevo
+
+    # ---------------------------------------------------------
+    # Actualización
+    # ---------------------------------------------------------
+    def sumar(self, df_diag: pd.DataFrame, signo: int = 1):
+        """
+        Suma (signo=1) o resta (signo=-1) la contribución de un lote de filas.
+        Las celdas que quedan en cero se eliminan.
+        """
+        if df_diag.empty:
+            return
+        df = con_score(df_diag)
+        grupos = (
+            df.assign(calificacion=df["calificacion"].astype(str))
+            .groupby(list(DIMENSIONES), observed=True, sort=False)["score"]
+            .agg(["size", "sum"])
+        )
+        for clave, (n, suma) in zip(grupos.index, grupos.to_numpy()):
+            self._acumular(clave, signo * int(n), signo * float(suma))
+        self._tabla = None
+
+    def aplicar_cambio(self, fila_anterior, fila_nueva):
+        """
+        Actualiza el cubo por la edición de un ítem del diagnóstico.
+        Las filas son dict/Series con las DIMENSIONES; None en `fila_anterior`
+        es un alta y None en `fila_nueva` una baja.
+        """
+        if fila_anterior is not None:
+            self._acumular(_clave(fila_anterior), -1, -float(calificacion_to_score(str(fila_anterior["calificacion"]))))
+        if fila_nueva is not None:
+            self._acumular(_clave(fila_nueva), 1, float(calificacion_to_score(str(fila_nueva["calificacion"]))))
+        self._tabla = None
+
+    def verificar_consistencia(self, df_diag: pd.DataFrame, tolerancia: float = 1e-6) -> list[str]:
+        """
+        Compara el cubo contra uno recalculado desde `df_diag`.
+        Devuelve las diferencias encontradas (lista vacía = consistente).
+        """
+        esperado = CuboDiagnostico.desde_df(df_diag).celdas
+        diferencias = []
+        for clave in sorted(set(esperado) | set(self.celdas), key=str):
+            n_e, s_e = esperado.get(clave, (0, 0.0))
+            n_c, s_c = self.celdas.get(clave, (0, 0.0))
+            if n_e != n_c or abs(s_e - s_c) > tolerancia:
+                diferencias.append(f"{' / '.join(map(str, clave))}: cubo n={n_c} suma={s_c:g}, recalculado n={n_e} suma={s_e:g}")
+        return diferencias
+
+    def _acumular(self, clave: tuple, n: int, suma: float):
+        celda = self.celdas.get(clave)
+        if celda is None:
+            celda = self.celdas[clave] = [0, 0.0]
+        celda[0] += n
+        celda[1] += suma
+        if celda[0] <= 0:
+            del self.celdas[clave]
+
+    # ---------------------------------------------------------
+    # Consultas
+    # ---------------------------------------------------------
+    def tabla(self) -> pd.DataFrame:
+        """Celdas como DataFrame (columnas de dimensión + n + suma_score)."""
+        if self._tabla is None:
+            filas = [(*k, v[0], v[1]) for k, v in self.celdas.items()]
+            tabla = pd.DataFrame(filas, columns=[*DIMENSIONES, "n", "suma_score"])
+            tabla["n"] = tabla["n"].astype("int64")
+            tabla["suma_score"] = tabla["suma_score"].astype("float64")
+            self._tabla = tabla
+        return self._tabla
+
+    def rebanada(self, instalacion: str | None = None, **filtros) -> pd.DataFrame:
+        """
+        Celdas que cumplen los filtros. `instalacion` None o "Todas" = sin filtro.
+        Los valores de filtro pueden ser un escalar o una lista.
+        """
+        t = self.tabla()
+        if instalacion not in (None, "Todas"):
+            filtros["instalacion"] = instalacion
+        for col, val in filtros.items():
+            if val is None:
+                continue
+            if isinstance(val, (list, tuple, set, frozenset)):
+                t = t[t[col].isin(list(val))]
+            else:
+                t = t[t[col] == val]
+        return t
+
+    def kpis(self, instalacion: str | None = None) -> dict:
+        """Madurez, brechas críticas, % de acciones cerradas y cumplimiento demo."""
+        t = self.rebanada(instalacion)
+        total = int(t["n"].sum())
+        if total == 0:
+            return {
+                "total": 0, "madurez": 0.0, "brechas_criticas": 0,
+                "porcentaje_cerradas": 0.0, "cumplimiento_3687": 0.0,
+            }
+        criticas = int(t.loc[t["calificacion"].isin(CALIFICACIONES_CRITICAS), "n"].sum())
+        cerradas = int(t.loc[t["estado_plan"] == ESTADO_CERRADO, "n"].sum())
+        return {
+            "total": total,
+            "madurez": round(float(t["suma_score"].sum()) / total, 1),
+            "brechas_criticas": criticas,
+            "porcentaje_cerradas": round(100 * cerradas / total, 1),
+            # demo: cuanto menos brecha crítica, más alto
+            "cumplimiento_3687": max(0, min(100, round(100 - (criticas / total) * 60, 1))),
+        }
+
+    def madurez_por(self, columna: str, instalacion: str | None = None, **filtros) -> pd.DataFrame:
+        """Promedio de `score` por `columna` (mismo formato que skudo_madurez.madurez_por)."""
+        t = self.rebanada(instalacion, **filtros)
+        g = t.groupby(columna, as_index=False)[["n", "suma_score"]].sum()
+        g["score"] = (g["suma_score"] / g["n"]).round(1)
+        return g[[columna, "score"]]
+
+    def conteo_por(self, columna: str, instalacion: str | None = None, **filtros) -> pd.DataFrame:
+        """Número de ítems por `columna` (columnas: columna, n), sin grupos vacíos."""
+        t = self.rebanada(instalacion, **filtros)
+        g = t.groupby(columna, as_index=False)["n"].sum()
+        return g[g["n"] > 0].reset_index(drop=True)
+
+    def distribucion_calificaciones(self, instalacion: str | None = None) -> pd.DataFrame:
+        """Equivalente a resumen_calificaciones() pero desde el cubo."""
+        g = self.conteo_por("calificacion", instalacion)
+        g["orden"] = g["calificacion"].map({c: i for i, c in enumerate(CALIFICACIONES)})
+        g = g.sort_values(["n", "orden"], ascending=[False, True])
+        return g.rename(columns={"calificacion": "Calificación", "n": "Cantidad"})[["Calificación", "Cantidad"]]
@@ -0,0 +1,138 @@
+"""
+Capa de acceso a datos de SKUDO.
+
+Los cargadores se ejecutan una sola vez por proceso y su resultado se comparte
+entre todas las sesiones de Streamlit. Cada resultado queda asociado a una
+huella (SHA-256) de su fuente: mientras la fuente no cambie, las reejecuciones
+del script (cada clic en un widget) reutilizan el mismo objeto; si la fuente
+cambia o vence el TTL, se reconstruye.
+
+IMPORTANTE: los objetos devueltos son compartidos entre sesiones, así que no se
+deben mutar en sitio (usar .copy() antes de modificar).
+"""
+import hashlib
+import os
+import threading
+import types
+from pathlib import Path
+
+import streamlit as st
+
+# Subir este número invalida todas las cachés (p. ej. al cambiar el esquema).
+DATOS_VERSION = 1
+# Tiempo máximo de vida de un cargador aunque la fuente no cambie.
+DATOS_TTL_S = 6 * 60 * 60
+
+_CHUNK = 1024 * 1024
+
+_lock = threading.Lock()
+_huellas_archivo: dict[str, tuple[int, int, str]] = {}
+_versiones: dict[str, str] = {}
+
+
+# =========================================================
+# HUELLAS DE CONTENIDO
+# =========================================================
+def _huella_archivo(ruta: Path) -> str:
+    """
+    Hash del contenido de un archivo. Se memoriza por (mtime, tamaño) para no
+    releer el archivo en cada rerun.
+    """
+    st_ = ruta.stat()
+    clave = str(ruta.resolve())
+    with _lock:
+        previo = _huellas_archivo.get(clave)
+    if previo and previo[0] == st_.st_mtime_ns and previo[1] == st_.st_size:
+        return previo[2]
+
+    h = hashlib.sha256()
+    with open(ruta, "rb") as fh:
+        for bloque in iter(lambda: fh.read(_CHUNK), b""):
+            h.update(bloque)
+    digest = h.hexdigest()
+    with _lock:
+        _huellas_archivo[clave] = (st_.st_mtime_ns, st_.st_size, digest)
+    return digest
+
+
+def sha256_archivo(ruta: Path) -> str:
+    """SHA-256 completo del contenido (memorizado por mtime y tamaño)."""
+    return _huella_archivo(Path(ruta))
+
+
+def sha256_bytes(datos: bytes) -> str:
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _actualizar_con_codigo(h, code: types.CodeType):
+    # bytecode + constantes: cambia si cambia la lógica o los datos literales
+    h.update(code.co_code)
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            _actualizar_con_codigo(h, c)
+        else:
+            h.update(repr(c).encode("utf-8"))
+
+
+def huella_fuente(*fuentes) -> str:
+    """
+    Huella corta de una o varias fuentes de datos:
+    - Path a archivo: hash del contenido.
+    - Path a carpeta: hash de todos sus archivos (orden estable).
+    - función: hash de su bytecode y constantes (datos dummy embebidos).
+    - cualquier otro valor: su repr().
+    """
+    h = hashlib.sha256(f"v{DATOS_VERSION}".encode("utf-8"))
+    for f in fuentes:
+        if isinstance(f, Path):
+            if f.is_dir():
+                for sub in sorted(p for p in f.rglob("*") if p.is_file()):
+                    h.update(str(sub.relative_to(f)).encode("utf-8"))
+                    h.update(_huella_archivo(sub).encode("ascii"))
+            elif f.exists():
+                h.update(_huella_archivo(f).encode("ascii"))
+            else:
+                h.update(b"<sin-archivo>")
+        elif isinstance(f, types.FunctionType):
+            h.update(f.__qualname__.encode("utf-8"))
+            _actualizar_con_codigo(h, f.__code__)
+        else:
+            h.update(repr(f).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+# =========================================================
+# CARGADORES CACHEADOS
+# =========================================================
+@st.cache_resource(ttl=DATOS_TTL_S, max_entries=64, show_spinner=False)
+def _cargar(nombre: str, version: str, _constructor, _args: tuple):
+    return _constructor(*_args)
+
+
+def cargar_versionado(nombre: str, constructor, *fuentes, args: tuple = ()):
+    """
+    Ejecuta `constructor(*args)` una vez por proceso y por versión de la fuente.
+
+    La versión se calcula con `huella_fuente(constructor, *fuentes, *args)`,
+    de modo que cambiar el código del cargador, los archivos fuente o los
+    argumentos invalida la caché automáticamente.
+    """
+    version = huella_fuente(constructor, *fuentes, *args)
+    with _lock:
+        _versiones[nombre] = version
+    return _cargar(nombre, version, constructor, tuple(args))
+
+
+def version_datos(nombre: str) -> str:
+    """Versión vigente de un cargador (útil como clave de cachés derivadas)."""
+    with _lock:
+        return _versiones.get(nombre, "")
+
+
+
+def ruta_datos(*partes: str) -> Path:
+    """Carpeta local de datos generados (almacén, índices, cachés en disco)."""
+    base = Path(os.environ.get("SKUDO_DATOS_DIR", Path(__file__).parent / "datos"))
+    ruta = base.joinpath(*partes)
+    ruta.mkdir(parents=True, exist_ok=True)
+    return ruta
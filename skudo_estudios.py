@@ -0,0 +1,380 @@
+"""
+Repositorio persistente de estudios (flujo de estudios de app6).
+
+Los estudios se guardan en SQLite (modo WAL, un archivo en datos/estudios/),
+no en st.session_state: sobreviven a una reconexión y cada sesión solo tiene
+en memoria el estudio activo.
+
+Esquema:
+- partes: una fila por (estudio, parte) con el JSON de esa parte (meta,
+  contexto, recomendación, DataFrames de histórico / nodos / asignaciones...).
+- hojas: una fila por (estudio, nodo) con la hoja HAZOP de ese nodo. En
+  memoria el estudio tiene una HojaHazop (skudo_hazop) que lee los nodos
+  recién cuando se usan (los que faltan, en una sola consulta).
+- ai_log: bitácora del asistente, solo se agrega.
+
+Autoguardado "write-behind": `guardar_cambios(estudio)` compara la huella de
+cada parte contra la última guardada, toma los nodos que la HojaHazop marcó
+como modificados y encola solo eso; un hilo escritor lo confirma en lotes, sin bloquear el rerun.
+Si un lote falla (sqlite3.Error) se revierte y sus operaciones quedan
+pendientes: el siguiente `guardar_cambios` (o `cargar`) del estudio las vuelve
+a encolar antes que las nuevas, así que ninguna edición se pierde. Una
+pendiente se descarta si después se confirma una escritura más nueva del
+mismo elemento (parte, nodo).
+
+Las lecturas del catálogo (`listar`, `documentos`) no esperan al escritor:
+pueden no ver todavía un guardado recién encolado. `cargar` y `leer_hojas`
+sí esperan, pero solo a los lotes encolados del mismo estudio, no a la cola
+de todas las sesiones.
+
+Limitación: no hay edición concurrente de un mismo estudio. Cada sesión
+guarda desde su copia en memoria el nodo completo (hoja) o la parte completa
+(p. ej. asignaciones) y gana la última escritura; no hay control de versión
+ni se recargan los cambios de otra sesión.
+"""
+import hashlib
+import io
+import itertools
+import json
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from skudo_hazop import HojaHazop
+
+PARTES_JSON = ("estado", "meta", "contexto_problema", "recomendacion", "preparacion", "aprobacion")
+PARTES_DF = ("historico_estudios", "nodos_rel", "asignaciones")
+LOG_EN_MEMORIA = 50
+LOTE_LECTURA = 500  # nodos por consulta (límite de parámetros de SQLite)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS estudios (
+    study_id TEXT PRIMARY KEY,
+    creado   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS partes (
+    study_id    TEXT NOT NULL,
+    parte       TEXT NOT NULL,
+    valor       TEXT NOT NULL,
+    actualizado TEXT NOT NULL,
+    PRIMARY KEY (study_id, parte)
+);
+CREATE TABLE IF NOT EXISTS hojas (
+    study_id    TEXT NOT NULL,
+    nodo_id     TEXT NOT NULL,
+    orden       INTEGER NOT NULL,
+    valor       TEXT NOT NULL,
+    actualizado TEXT NOT NULL,
+    PRIMARY KEY (study_id, nodo_id)
+);
+CREATE TABLE IF NOT EXISTS ai_log (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    study_id TEXT NOT NULL,
+    ts       TEXT NOT NULL,
+    msg      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ai_log_estudio ON ai_log (study_id, id);
+"""
+
+
+def _json(valor) -> str:
+    if isinstance(valor, pd.DataFrame):
+        return valor.to_json(orient="split", date_format="iso", force_ascii=False)
+    return json.dumps(valor, ensure_ascii=False, default=str, sort_keys=True)
+
+
+def _huella(texto: str) -> str:
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def _clave(tipo: str, args: tuple) -> tuple | None:
+    """Elemento que escribe una operación (None para la bitácora, que solo agrega)."""
+    if tipo in ("parte", "hoja"):
+        return tipo, args[0], args[1]
+    if tipo == "borrar_hojas":
+        return tipo, args[0]
+    return None
+
+
+def _leer_df(texto: str) -> pd.DataFrame:
+    df = pd.read_json(io.StringIO(texto), orient="split", dtype=False)
+    return df.reset_index(drop=True)
+
+
+# =========================================================
+# REPOSITORIO
+# =========================================================
+class RepositorioEstudios:
+    """
+    Acceso a la base de estudios. Una instancia por proceso (comparte el hilo
+    escritor); cada hilo usa su propia conexión SQLite.
+    """
+
+    def __init__(self, ruta: Path):
+        self.ruta = Path(ruta)
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self.ultimo_error: Exception | None = None
+        with self._con() as con:
+            con.executescript(_ESQUEMA)
+        self._cola: queue.Queue = queue.Queue()
+        # lotes encolados y todavía no escritos, por estudio: {estudio: n}
+        self._en_cola: dict[str, int] = {}
+        self._cond_cola = threading.Condition()
+        # operaciones de lotes fallidos a reintentar: {estudio: {clave: op}}
+        self._pendientes: dict[str, dict] = {}
+        self._lock_pendientes = threading.Lock()
+        self._n_log = itertools.count()
+        threading.Thread(target=self._escritor, name="skudo-estudios", daemon=True).start()
+
+    def _con(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.ruta, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            self._local.con = con
+        return con
+
+    # ---------------------------------------------------------
+    # Catálogo
+    # ---------------------------------------------------------
+    def listar(self) -> list[str]:
+        return [r[0] for r in self._con().execute("SELECT study_id FROM estudios ORDER BY creado, study_id")]
+
+    def crear(self) -> str:
+        """
+        Crea un estudio vacío y devuelve su id (ST-<año>-<n>). El número se
+        asigna dentro de la misma transacción que lo inserta (BEGIN IMMEDIATE
+        bloquea a los demás escritores), como el máximo del año + 1: dos
+        sesiones nunca reciben el mismo id y un conflicto falla en vez de
+        ignorarse.
+        """
+        ahora = datetime.now()
+        prefijo = f"ST-{ahora.year}-"
+        con = self._con()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            ultimo = con.execute(
+                "SELECT MAX(CAST(substr(study_id, ?) AS INTEGER)) FROM estudios WHERE study_id LIKE ?",
+                (len(prefijo) + 1, prefijo + "%"),
+            ).fetchone()[0] or 0
+            study_id = f"{prefijo}{ultimo + 1:04d}"
+            con.execute(
+                "INSERT INTO estudios (study_id, creado) VALUES (?, ?)",
+                (study_id, ahora.isoformat(timespec="seconds")),
+            )
+        except BaseException:
+            con.rollback()
+            raise
+        con.commit()
+        return study_id
+
+    def reiniciar(self, study_id: str):
+        """Borra el contenido del estudio (conserva el id)."""
+        self._esperar(study_id)
+        with self._con() as con:
+            for tabla in ("partes", "hojas", "ai_log"):
+                con.execute(f"DELETE FROM {tabla} WHERE study_id = ?", (study_id,))
+
+    def documentos(self, excluir: str | None = None) -> list[dict]:
+        """Documentos (`preparacion.pid_files`) de los demás estudios."""
+        filas = self._con().execute(
+            "SELECT study_id, valor FROM partes WHERE parte = 'preparacion' AND study_id != ?",
+            (excluir or "",),
+        )
+        return [d for _, valor in filas for d in json.loads(valor).get("pid_files", [])]
+
+    # ---------------------------------------------------------
+    # Carga
+    # ---------------------------------------------------------
+    def cargar(self, study_id: str) -> dict | None:
+        """
+        Estudio con la misma forma de dict que usa app6. Las hojas HAZOP no se
+        leen aquí (la HojaHazop las pide por lote de nodos) y la bitácora trae solo las
+        últimas entradas.
+        """
+        # lo que quedó pendiente de un lote fallido se reintenta antes de leer
+        pendientes = self._tomar_pendientes(study_id)
+        if pendientes:
+            self._encolar(study_id, pendientes)
+        self._esperar(study_id)
+        con = self._con()
+        if con.execute("SELECT 1 FROM estudios WHERE study_id = ?", (study_id,)).fetchone() is None:
+            return None
+
+        estudio: dict = {"study_id": study_id}
+        huellas = {}
+        for parte, valor in con.execute("SELECT parte, valor FROM partes WHERE study_id = ?", (study_id,)):
+            estudio[parte] = _leer_df(valor) if parte in PARTES_DF else json.loads(valor)
+            huellas[parte] = _huella(valor)
+
+        nodos = [r[0] for r in con.execute(
+            "SELECT nodo_id FROM hojas WHERE study_id = ? ORDER BY orden, nodo_id", (study_id,)
+        )]
+        estudio["hoja_hazop"] = HojaHazop(nodos, cargador=lambda nids: self.leer_hojas(study_id, nids))
+
+        log = con.execute(
+            "SELECT ts, msg FROM ai_log WHERE study_id = ? ORDER BY id DESC LIMIT ?",
+            (study_id, LOG_EN_MEMORIA),
+        ).fetchall()
+        estudio["ai_log"] = [{"ts": ts, "msg": msg} for ts, msg in reversed(log)]
+        estudio["_guardado"] = {"huellas": huellas, "n_log": len(estudio["ai_log"])}
+        return estudio
+
+    def leer_hojas(self, study_id: str, nodos: list[str]) -> dict[str, tuple[str, list[dict]]]:
+        """{nodo: (recomendación, filas)} guardados de los `nodos` pedidos (los que existan)."""
+        self._esperar(study_id)
+        con = self._con()
+        out = {}
+        for ini in range(0, len(nodos), LOTE_LECTURA):
+            lote = nodos[ini:ini + LOTE_LECTURA]
+            marcas = ",".join("?" * len(lote))
+            for nid, valor in con.execute(
+                f"SELECT nodo_id, valor FROM hojas WHERE study_id = ? AND nodo_id IN ({marcas})",
+                (study_id, *lote),
+            ):
+                pack = json.loads(valor)
+                out[nid] = (pack.get("recomendacion_nodo", ""), pack.get("rows", []))
+        return out
+
+    # ---------------------------------------------------------
+    # Autoguardado (write-behind)
+    # ---------------------------------------------------------
+    def guardar_cambios(self, estudio: dict) -> int:
+        """
+        Encola solo las partes, hojas y entradas de bitácora que cambiaron
+        desde el último guardado, precedidas por las de lotes anteriores que
+        fallaron. Devuelve el número de elementos encolados.
+        """
+        sid = estudio["study_id"]
+        guardado = estudio.setdefault("_guardado", {"huellas": {}, "n_log": 0})
+        ahora = datetime.now().isoformat(timespec="seconds")
+        ops = self._tomar_pendientes(sid)
+
+        for parte in PARTES_JSON + PARTES_DF:
+            if parte not in estudio:
+                continue
+            texto = _json(estudio[parte])
+            h = _huella(texto)
+            if guardado["huellas"].get(parte) != h:
+                ops.append(("parte", (sid, parte, texto, ahora)))
+                guardado["huellas"][parte] = h
+
+        hoja = estudio.get("hoja_hazop")
+        if hoja is not None:
+            orden = {nid: i for i, nid in enumerate(hoja.nodos())}
+            if not hoja.persistida:
+                # hoja nueva (p. ej. otro prefabricado): reemplaza todos los nodos
+                ops.append(("borrar_hojas", (sid,)))
+                cambiados = hoja.nodos()
+                hoja.persistida = True
+            else:
+                cambiados = sorted(hoja.sucios, key=orden.get)
+            ops += [
+                ("hoja", (sid, nid, orden[nid], _json(hoja.registro_nodo(nid)), ahora))
+                for nid in cambiados
+            ]
+            hoja.sucios.clear()
+
+        log = estudio.get("ai_log", [])
+        ops += [("log", (sid, e["ts"], e["msg"])) for e in log[guardado["n_log"]:]]
+        if len(log) > LOG_EN_MEMORIA:
+            del log[:-LOG_EN_MEMORIA]
+        guardado["n_log"] = len(log)
+
+        if ops:
+            self._encolar(sid, ops)
+        return len(ops)
+
+    def _encolar(self, study_id: str, ops: list):
+        with self._cond_cola:
+            self._en_cola[study_id] = self._en_cola.get(study_id, 0) + 1
+        self._cola.put((study_id, ops))
+
+    def _esperar(self, study_id: str):
+        """Espera a que se escriban los lotes encolados de un estudio."""
+        with self._cond_cola:
+            self._cond_cola.wait_for(lambda: not self._en_cola.get(study_id))
+
+    def _tomar_pendientes(self, study_id: str) -> list:
+        with self._lock_pendientes:
+            return list(self._pendientes.pop(study_id, {}).values())
+
+    def _devolver_pendientes(self, lotes: list):
+        # en orden de llegada: la última versión de cada elemento queda al final
+        with self._lock_pendientes:
+            for ops in lotes:
+                for tipo, args in ops:
+                    pend = self._pendientes.setdefault(args[0], {})
+                    if tipo == "borrar_hojas":
+                        # reemplaza todas las hojas: las pendientes anteriores sobran
+                        for clave in [c for c in pend if c[0] == "hoja"]:
+                            del pend[clave]
+                    clave = _clave(tipo, args) or ("log", next(self._n_log))
+                    pend.pop(clave, None)
+                    pend[clave] = (tipo, args)
+
+    def _descartar_pendientes(self, lotes: list):
+        # lo recién confirmado es más nuevo que lo pendiente del mismo elemento
+        with self._lock_pendientes:
+            if not self._pendientes:
+                return
+            for ops in lotes:
+                for tipo, args in ops:
+                    pend = self._pendientes.get(args[0])
+                    if not pend:
+                        continue
+                    if tipo == "borrar_hojas":
+                        for clave in [c for c in pend if c[0] == "hoja"]:
+                            del pend[clave]
+                    clave = _clave(tipo, args)
+                    if clave is not None:
+                        pend.pop(clave, None)
+                    if not pend:
+                        del self._pendientes[args[0]]
+
+    def vaciar(self):
+        """Espera a que se escriban los cambios encolados de todos los estudios."""
+        if hasattr(self, "_cola"):
+            self._cola.join()
+
+    def _escritor(self):
+        sql = {
+            "parte": "INSERT OR REPLACE INTO partes (study_id, parte, valor, actualizado) VALUES (?, ?, ?, ?)",
+            "hoja": "INSERT OR REPLACE INTO hojas (study_id, nodo_id, orden, valor, actualizado) VALUES (?, ?, ?, ?, ?)",
+            "borrar_hojas": "DELETE FROM hojas WHERE study_id = ?",
+            "log": "INSERT INTO ai_log (study_id, ts, msg) VALUES (?, ?, ?)",
+        }
+        while True:
+            lotes = [self._cola.get()]
+            while True:
+                try:
+                    lotes.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self._con() as con:
+                    for _, ops in lotes:
+                        for tipo, args in ops:
+                            con.execute(sql[tipo], args)
+                self._descartar_pendientes([ops for _, ops in lotes])
+                self.ultimo_error = None
+            except sqlite3.Error as e:
+                # el lote se revirtió: sus operaciones quedan pendientes para el
+                # próximo guardado; el hilo sigue vivo y el error queda visible
+                self._devolver_pendientes([ops for _, ops in lotes])
+                self.ultimo_error = e
+            finally:
+                with self._cond_cola:
+                    for sid, _ in lotes:
+                        self._en_cola[sid] -= 1
+                        if not self._en_cola[sid]:
+                            del self._en_cola[sid]
+                    self._cond_cola.notify_all()
+                for _ in lotes:
+                    self._cola.task_done()
@@ -0,0 +1,365 @@
+"""
+Grafo de relaciones entre entidades de SKUDO.
+
+Une nodos (N-), ítems de diagnóstico (D-), acciones (A-), requisitos
+normativos (Req-3687-*), estudios (E-) y escenarios (RP-). El campo de texto
+`relacionados` ("D-001 | A-003 | Req-3687-9") se interpreta una sola vez al
+construir el grafo; después las consultas son sobre listas de adyacencia:
+vecinos en O(grado), expansión a k saltos y "todo lo impactado por un
+requisito" con BFS.
+
+Internamente cada entidad tiene un id entero compacto (0..n-1); la referencia
+de texto y el tipo se guardan en listas paralelas.
+
+`GrafoRelaciones` (networkx) sirve para construir; `GrafoCSR` es la forma
+compacta para redes grandes: arreglos NumPy en disco, mapeados en memoria y
+compartidos en solo lectura entre sesiones.
+"""
+import shutil
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+PREFIJOS_TIPO = (
+    ("Req-", "requisito"),
+    ("RP-", "escenario"),
+    ("N-", "nodo"),
+    ("D-", "diagnostico"),
+    ("A-", "accion"),
+    ("E-", "estudio"),
+)
+
+ETIQUETAS_TIPO = {
+    "requisito": "Requisitos normativos",
+    "escenario": "Escenarios de riesgo",
+    "nodo": "Nodos",
+    "diagnostico": "Ítems de diagnóstico",
+    "accion": "Acciones",
+    "estudio": "Estudios",
+    "otro": "Otras referencias",
+}
+
+
+def tipo_entidad(ref: str) -> str:
+    for prefijo, tipo in PREFIJOS_TIPO:
+        if ref.startswith(prefijo):
+            return tipo
+    return "otro"
+
+
+def separar_relacionados(serie: pd.Series) -> pd.DataFrame:
+    """
+    "D-001 | A-003" -> filas (posición de origen, referencia). Vectorizado con
+    str.split + explode.
+    """
+    partes = serie.fillna("").astype(str).str.split("|").explode().str.strip()
+    partes = partes[partes != ""]
+    return pd.DataFrame({"pos": partes.index, "ref": partes.to_numpy()})
+
+
+class GrafoRelaciones:
+    """
+    Grafo no dirigido y tipado sobre networkx con ids enteros compactos.
+    Cada arista guarda el tipo de relación en el atributo "rel".
+    """
+
+    def __init__(self):
+        self.grafo = nx.Graph()
+        self.ids: dict[str, int] = {}
+        self.refs: list[str] = []
+        self.tipos: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    # ---------------------------------------------------------
+    # Construcción
+    # ---------------------------------------------------------
+    def id_de(self, ref: str, crear: bool = False) -> int | None:
+        ref = ref.strip()
+        i = self.ids.get(ref)
+        if i is None and crear:
+            i = len(self.refs)
+            self.ids[ref] = i
+            self.refs.append(ref)
+            self.tipos.append(tipo_entidad(ref))
+            self.grafo.add_node(i)
+        return i
+
+    def relacionar(self, a: str, b: str, rel: str = "relacionado"):
+        ia, ib = self.id_de(a, crear=True), self.id_de(b, crear=True)
+        if ia != ib:
+            self.grafo.add_edge(ia, ib, rel=rel)
+
+    @classmethod
+    def desde_tablas(
+        cls,
+        df_nodos: pd.DataFrame,
+        df_riesgos: pd.DataFrame | None = None,
+        df_estudios: pd.DataFrame | None = None,
+    ) -> "GrafoRelaciones":
+        """
+        Aristas:
+        - nodo <-> cada referencia de su campo `relacionados`
+        - escenario (id_escenario) <-> estudio (id_estudio) del histórico
+        - nodo <-> estudio que cubre el mismo equipo
+        """
+        g = cls()
+        df_nodos = df_nodos.reset_index(drop=True)
+        origen = df_nodos["id"].astype(str).to_numpy()
+        for ref in origen:
+            g.id_de(ref, crear=True)
+
+        rel = separar_relacionados(df_nodos["relacionados"])
+        for pos, ref in zip(rel["pos"].to_numpy(), rel["ref"].to_numpy()):
+            g.relacionar(origen[pos], ref, "relacionado")
+
+        if df_riesgos is not None and not df_riesgos.empty:
+            pares = df_riesgos[["id_escenario", "id_estudio"]].dropna().drop_duplicates()
+            for esc, est in pares.itertuples(index=False):
+                g.relacionar(str(esc), str(est), "escenario_de")
+
+        if df_estudios is not None and not df_estudios.empty:
+            pares = df_nodos[["id", "equipo"]].merge(df_estudios[["id_estudio", "equipo"]], on="equipo")
+            for nodo, est in pares[["id", "id_estudio"]].itertuples(index=False):
+                g.relacionar(str(nodo), str(est), "mismo_equipo")
+        return g
+
+    # ---------------------------------------------------------
+    # Consultas
+    # ---------------------------------------------------------
+    def vecinos(self, ref: str, tipo: str | None = None) -> list[str]:
+        """Referencias directamente relacionadas (O(grado)), opcionalmente de un tipo."""
+        i = self.id_de(ref)
+        if i is None:
+            return []
+        salida = [self.refs[j] for j in self.grafo.adj[i] if tipo is None or self.tipos[j] == tipo]
+        return sorted(salida)
+
+    def vecinos_por_tipo(self, ref: str) -> dict[str, list[str]]:
+        agrupados: dict[str, list[str]] = {}
+        for r in self.vecinos(ref):
+            agrupados.setdefault(tipo_entidad(r), []).append(r)
+        return agrupados
+
+    def expandir(self, ref: str, k: int = 2) -> pd.DataFrame:
+        """Entidades a k saltos o menos (columnas: ref, tipo, distancia)."""
+        i = self.id_de(ref)
+        if i is None:
+            return pd.DataFrame(columns=["ref", "tipo", "distancia"])
+        dist = nx.single_source_shortest_path_length(self.grafo, i, cutoff=k)
+        filas = [(self.refs[j], self.tipos[j], d) for j, d in dist.items() if j != i]
+        return (
+            pd.DataFrame(filas, columns=["ref", "tipo", "distancia"])
+            .sort_values(["distancia", "tipo", "ref"])
+            .reset_index(drop=True)
+        )
+
+    def impactados_por(self, requisito: str, k: int | None = None) -> pd.DataFrame:
+        """
+        Todo lo alcanzable desde un requisito (o cualquier entidad): nodos,
+        estudios, escenarios, acciones... con su distancia en saltos.
+        """
+        return self.expandir(requisito, k=k if k is not None else len(self.refs))
+
+
+# =========================================================
+# REPRESENTACIÓN CSR (compacta, mapeable en memoria)
+# =========================================================
+TIPOS_NODO = tuple(t for _, t in PREFIJOS_TIPO) + ("otro",)
+TIPOS_REL = ("relacionado", "escenario_de", "mismo_equipo")
+
+_ARCHIVOS_CSR = ("indptr", "indices", "rel", "tipos", "refs", "refs_ord", "orden")
+
+
+class GrafoCSR:
+    """
+    Adyacencia en formato CSR: los vecinos de i son indices[indptr[i]:indptr[i+1]]
+    y rel[...] el tipo de cada arista (código en TIPOS_REL). Cada arista no
+    dirigida se guarda en ambos sentidos.
+
+    Los arreglos se guardan con np.save y se abren con mmap_mode="r": todas las
+    sesiones (y procesos) comparten las mismas páginas de solo lectura. Las
+    consultas (BFS, alcanzabilidad, grados) son vectorizadas con NumPy.
+    """
+
+    def __init__(self, indptr, indices, rel, tipos, refs, refs_ord, orden):
+        self.indptr = indptr    # int64 [n + 1]
+        self.indices = indices  # int32 [2 * aristas]
+        self.rel = rel          # int8  [2 * aristas]
+        self.tipos = tipos      # int8  [n], código en TIPOS_NODO
+        self.refs = refs        # str   [n]
+        self.refs_ord = refs_ord  # str [n], refs ordenadas (búsqueda binaria)
+        self.orden = orden      # int32 [n], refs_ord[j] == refs[orden[j]]
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+    @property
+    def n_aristas(self) -> int:
+        return len(self.indices) // 2
+
+    # ---------------------------------------------------------
+    # Construcción / persistencia
+    # ---------------------------------------------------------
+    @classmethod
+    def desde_aristas(cls, refs: list[str], origen, destino, rel) -> "GrafoCSR":
+        """`origen`/`destino` son ids enteros (posiciones en `refs`), `rel` códigos de TIPOS_REL."""
+        n = len(refs)
+        origen = np.asarray(origen, dtype=np.int64)
+        destino = np.asarray(destino, dtype=np.int64)
+        rel = np.asarray(rel, dtype=np.int8)
+
+        src = np.concatenate([origen, destino])
+        dst = np.concatenate([destino, origen])
+        rel2 = np.concatenate([rel, rel])
+        perm = np.lexsort((dst, src))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+
+        refs_arr = np.asarray(refs, dtype=str)
+        codigos = {t: i for i, t in enumerate(TIPOS_NODO)}
+        tipos = np.fromiter((codigos[tipo_entidad(r)] for r in refs), dtype=np.int8, count=n)
+        orden = np.argsort(refs_arr, kind="stable").astype(np.int32)
+        return cls(indptr, dst[perm].astype(np.int32), rel2[perm], tipos, refs_arr, refs_arr[orden], orden)
+
+    @classmethod
+    def desde_grafo(cls, g: GrafoRelaciones) -> "GrafoCSR":
+        codigos = {r: i for i, r in enumerate(TIPOS_REL)}
+        aristas = list(g.grafo.edges(data="rel"))
+        origen = [a for a, _, _ in aristas]
+        destino = [b for _, b, _ in aristas]
+        rel = [codigos.get(r, 0) for _, _, r in aristas]
+        return cls.desde_aristas(g.refs, origen, destino, rel)
+
+    def guardar(self, carpeta: Path):
+        """Escribe en una carpeta temporal y la renombra (nunca queda a medias)."""
+        carpeta = Path(carpeta)
+        tmp = carpeta.with_name(carpeta.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for nombre in _ARCHIVOS_CSR:
+            np.save(tmp / f"{nombre}.npy", np.asarray(getattr(self, nombre)))
+        shutil.rmtree(carpeta, ignore_errors=True)
+        tmp.rename(carpeta)
+
+    @staticmethod
+    def podar_versiones(carpeta: Path):
+        """
+        Borra las demás versiones guardadas junto a `carpeta` (mismo prefijo
+        "<nombre>-", incluidas las .tmp abandonadas). Un proceso que aún tenga
+        una versión vieja abierta conserva sus páginas mapeadas.
+        """
+        carpeta = Path(carpeta)
+        prefijo = carpeta.name.rsplit("-", 1)[0] + "-"
+        for otra in carpeta.parent.glob(prefijo + "*"):
+            if otra != carpeta and otra.is_dir():
+                shutil.rmtree(otra, ignore_errors=True)
+
+    @classmethod
+    def abrir(cls, carpeta: Path) -> "GrafoCSR":
+        """Abre los arreglos mapeados en memoria (solo lectura)."""
+        carpeta = Path(carpeta)
+        return cls(*(np.load(carpeta / f"{nombre}.npy", mmap_mode="r") for nombre in _ARCHIVOS_CSR))
+
+    def a_networkx(self, ids=None) -> nx.Graph:
+        """
+        Grafo networkx (completo o inducido por `ids`) para los algoritmos que
+        no están implementados aquí. Nodos = ids enteros con atributos ref/tipo.
+        """
+        ids = np.arange(len(self)) if ids is None else np.asarray(ids, dtype=np.int64)
+        g = nx.Graph()
+        for i in ids.tolist():
+            g.add_node(i, ref=str(self.refs[i]), tipo=TIPOS_NODO[self.tipos[i]])
+        dentro = np.zeros(len(self), dtype=bool)
+        dentro[ids] = True
+        src = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        mascara = dentro[src] & dentro[self.indices] & (src < self.indices)
+        g.add_edges_from(
+            (int(a), int(b), {"rel": TIPOS_REL[r]})
+            for a, b, r in zip(src[mascara], self.indices[mascara], self.rel[mascara])
+        )
+        return g
+
+    # ---------------------------------------------------------
+    # Consultas vectorizadas
+    # ---------------------------------------------------------
+    def id_de(self, ref: str) -> int | None:
+        ref = ref.strip()
+        pos = int(np.searchsorted(self.refs_ord, ref))
+        if pos < len(self.refs_ord) and self.refs_ord[pos] == ref:
+            return int(self.orden[pos])
+        return None
+
+    def grados(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def vecinos_ids(self, i: int) -> np.ndarray:
+        return np.asarray(self.indices[self.indptr[i]:self.indptr[i + 1]])
+
+    def _vecinos_de(self, frontera: np.ndarray) -> np.ndarray:
+        # concatena los rangos indptr[f]:indptr[f+1] de toda la frontera sin bucle
+        inicios = self.indptr[frontera]
+        largos = self.indptr[frontera + 1] - inicios
+        total = int(largos.sum())
+        if total == 0:
+            return np.zeros(0, dtype=np.int64)
+        desplaz = np.repeat(inicios - np.cumsum(largos) + largos, largos) + np.arange(total)
+        return np.asarray(self.indices[desplaz], dtype=np.int64)
+
+    def bfs(self, origenes, k: int | None = None) -> np.ndarray:
+        """
+        Distancia en saltos desde los `origenes` (ids) a cada entidad; -1 si no
+        es alcanzable en k saltos. Avanza por niveles: un paso vectorizado por nivel.
+        """
+        dist = np.full(len(self), -1, dtype=np.int32)
+        frontera = np.unique(np.asarray(origenes, dtype=np.int64))
+        dist[frontera] = 0
+        nivel = 0
+        while frontera.size and (k is None or nivel < k):
+            nivel += 1
+            vec = self._vecinos_de(frontera)
+            frontera = np.unique(vec[dist[vec] < 0])
+            dist[frontera] = nivel
+        return dist
+
+    def alcanzables(self, origenes, k: int | None = None) -> np.ndarray:
+        """Máscara booleana de entidades alcanzables (incluye los orígenes)."""
+        return self.bfs(origenes, k) >= 0
+
+    # Misma interfaz de consulta que GrafoRelaciones (la usa render_nodos)
+    def vecinos(self, ref: str, tipo: str | None = None) -> list[str]:
+        i = self.id_de(ref)
+        if i is None:
+            return []
+        ids = self.vecinos_ids(i)
+        if tipo is not None:
+            ids = ids[self.tipos[ids] == TIPOS_NODO.index(tipo)]
+        return sorted(str(r) for r in self.refs[ids])
+
+    def vecinos_por_tipo(self, ref: str) -> dict[str, list[str]]:
+        agrupados: dict[str, list[str]] = {}
+        for r in self.vecinos(ref):
+            agrupados.setdefault(tipo_entidad(r), []).append(r)
+        return agrupados
+
+    def expandir(self, ref: str, k: int = 2) -> pd.DataFrame:
+        i = self.id_de(ref)
+        if i is None:
+            return pd.DataFrame(columns=["ref", "tipo", "distancia"])
+        dist = self.bfs([i], k)
+        ids = np.flatnonzero(dist > 0)
+        return (
+            pd.DataFrame({
+                "ref": self.refs[ids].astype(str),
+                "tipo": np.asarray(TIPOS_NODO, dtype=object)[self.tipos[ids]],
+                "distancia": dist[ids],
+            })
+            .sort_values(["distancia", "tipo", "ref"])
+            .reset_index(drop=True)
+        )
+
+    def impactados_por(self, requisito: str, k: int | None = None) -> pd.DataFrame:
+        return self.expandir(requisito, k=k)
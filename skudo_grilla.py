@@ -0,0 +1,190 @@
+"""
+Grilla paginada del lado del servidor.
+
+`st.dataframe(df)` serializa la tabla completa a Arrow y la manda al
+navegador en cada rerun. `grilla_paginada` filtra, ordena y pagina en el
+servidor y solo envía la ventana visible (25/50/100 filas), así que el
+tamaño del mensaje y la memoria del navegador no dependen del tamaño de la
+tabla.
+
+El filtrado y el orden se calculan una vez por (fuente, versión, filtro,
+orden) y se cachean como un índice de posiciones. La paginación es por
+cursor: cada página recuerda la clave de su última fila y la siguiente
+empieza justo después de ella, de modo que la posición se mantiene aunque
+la consulta se recalcule (p. ej. al cambiar la versión de los datos).
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from skudo_datos import DATOS_TTL_S
+from skudo_ui import fragmento
+
+TAMANOS_PAGINA = (25, 50, 100)
+
+
+# =========================================================
+# CONSULTA (filtro + orden) CACHEADA
+# =========================================================
+class _Consulta:
+    """Posiciones de las filas que pasan el filtro, en orden, y sus claves."""
+
+    def __init__(self, posiciones: np.ndarray, claves: pd.Index):
+        self.posiciones = posiciones
+        self.claves = claves
+
+    def inicio_despues_de(self, cursor) -> int:
+        """Índice de la primera fila posterior al cursor (0 si no hay cursor o ya no existe)."""
+        if cursor is None:
+            return 0
+        try:
+            pos = self.claves.get_loc(cursor)
+        except KeyError:
+            return 0
+        return int(pos) + 1 if isinstance(pos, (int, np.integer)) else 0
+
+
+def _mascara(df: pd.DataFrame, filtros: tuple, texto: str, columnas_texto: tuple) -> np.ndarray:
+    mask = np.ones(len(df), dtype=bool)
+    for col, val in filtros:
+        if isinstance(val, tuple):
+            mask &= df[col].isin(val).to_numpy()
+        else:
+            mask &= (df[col] == val).to_numpy()
+    # sin columnas de texto la búsqueda no aplica (no debe ocultar todas las filas)
+    if texto and columnas_texto:
+        coincide = np.zeros(len(df), dtype=bool)
+        for col in columnas_texto:
+            coincide |= df[col].astype(str).str.contains(texto, case=False, regex=False, na=False).to_numpy()
+        mask &= coincide
+    return mask
+
+
+@st.cache_resource(ttl=DATOS_TTL_S, max_entries=128, show_spinner=False)
+def _consulta(fuente: str, version: str, filtros: tuple, texto: str, columnas_texto: tuple,
+              orden: str | None, descendente: bool, clave: str | None, _df: pd.DataFrame) -> _Consulta:
+    posiciones = np.flatnonzero(_mascara(_df, filtros, texto, columnas_texto))
+    if orden:
+        sub = _df.iloc[posiciones]
+        por = [orden] + ([clave] if clave and clave != orden else [])
+        orden_pos = (
+            sub.reset_index(drop=True)
+            .sort_values(por, ascending=not descendente, na_position="last", kind="stable")
+            .index.to_numpy()
+        )
+        posiciones = posiciones[orden_pos]
+    claves = pd.Index(_df[clave].to_numpy()[posiciones]) if clave else None
+    if claves is None or not claves.is_unique:
+        # con claves repetidas el cursor no ubica su fila: se usa la posición
+        claves = pd.Index(posiciones)
+    return _Consulta(posiciones, claves)
+
+
+def _es_texto(serie: pd.Series) -> bool:
+    # pandas 3 usa el dtype "str" para texto; antes era object
+    return pd.api.types.is_string_dtype(serie.dtype) or pd.api.types.is_object_dtype(serie.dtype)
+
+
+def _huella_df(df: pd.DataFrame) -> str:
+    return str(int(pd.util.hash_pandas_object(df, index=False).sum()))
+
+
+# =========================================================
+# COMPONENTE
+# =========================================================
+def _estado(clave_widget: str, firma: tuple) -> dict:
+    """Pila de cursores de la grilla; se reinicia si cambia la consulta."""
+    est = st.session_state.get(clave_widget)
+    if est is None or est["firma"] != firma:
+        est = st.session_state[clave_widget] = {"firma": firma, "cursores": [None]}
+    return est
+
+
+def _anterior(clave_widget: str):
+    cursores = st.session_state[clave_widget]["cursores"]
+    if len(cursores) > 1:
+        cursores.pop()
+
+
+def _siguiente(clave_widget: str, cursor):
+    st.session_state[clave_widget]["cursores"].append(cursor)
+
+
+@fragmento
+def grilla_paginada(
+    clave_widget: str,
+    df: pd.DataFrame,
+    columnas: list[str] | None = None,
+    *,
+    clave: str | None = None,
+    version: str | None = None,
+    filtros: dict | None = None,
+    columnas_texto: list[str] | None = None,
+    tamano_pagina: int = 25,
+):
+    """
+    Muestra `df` paginado. Solo la página visible se envía al navegador.
+
+    - clave: columna única para el cursor (por defecto, o si tiene repetidos,
+      la posición de la fila).
+    - version: identifica el contenido de `df` (p. ej. ALMACEN.version(...));
+      si no se da, se calcula un hash del DataFrame.
+    - filtros: {"col": valor | [valores]} aplicados antes de paginar.
+    - columnas_texto: columnas donde busca el cuadro "Buscar" (por defecto, las de texto visibles).
+    El DataFrame no se modifica.
+    """
+    columnas = list(columnas) if columnas is not None else list(df.columns)
+    if columnas_texto is None:
+        columnas_texto = [c for c in columnas if _es_texto(df[c])]
+    filtros_h = tuple(sorted(
+        (k, tuple(v) if isinstance(v, (list, tuple, set, frozenset)) else v)
+        for k, v in (filtros or {}).items() if v is not None
+    ))
+    if version is None:
+        version = _huella_df(df)
+
+    c_txt, c_ord, c_dir, c_tam = st.columns([2.2, 1.6, 0.9, 0.8])
+    with c_txt:
+        texto = st.text_input("Buscar", key=f"{clave_widget}_texto", placeholder="Filtrar filas…").strip()
+    with c_ord:
+        orden = st.selectbox("Ordenar por", ["(sin orden)"] + columnas, key=f"{clave_widget}_orden")
+        orden = None if orden == "(sin orden)" else orden
+    with c_dir:
+        descendente = st.toggle("Desc.", key=f"{clave_widget}_desc")
+    with c_tam:
+        tam = st.selectbox(
+            "Filas", TAMANOS_PAGINA,
+            index=TAMANOS_PAGINA.index(tamano_pagina) if tamano_pagina in TAMANOS_PAGINA else 0,
+            key=f"{clave_widget}_tam",
+        )
+
+    consulta = _consulta(
+        clave_widget, version, filtros_h, texto, tuple(columnas_texto),
+        orden, descendente, clave, df,
+    )
+    est = _estado(f"{clave_widget}_cursor", (version, filtros_h, texto, orden, descendente, tam))
+    ini = consulta.inicio_despues_de(est["cursores"][-1])
+    fin = min(ini + tam, len(consulta.posiciones))
+
+    st.dataframe(
+        df.iloc[consulta.posiciones[ini:fin]][columnas],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    total = len(consulta.posiciones)
+    c_prev, c_info, c_next = st.columns([1, 3, 1])
+    with c_prev:
+        st.button(
+            "◀ Anterior", key=f"{clave_widget}_prev",
+            disabled=len(est["cursores"]) <= 1,
+            on_click=_anterior, args=(f"{clave_widget}_cursor",),
+        )
+    with c_info:
+        st.caption(f"Filas {ini + 1 if total else 0:,}–{fin:,} de {total:,}")
+    with c_next:
+        st.button(
+            "Siguiente ▶", key=f"{clave_widget}_next",
+            disabled=fin >= total,
+            on_click=_siguiente, args=(f"{clave_widget}_cursor", consulta.claves[fin - 1] if fin else None),
+        )
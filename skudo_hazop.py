@@ -0,0 +1,304 @@
+"""
+Hoja de trabajo HAZOP columnar.
+
+Una sola tabla por estudio, indexada por `id_row` (único: lleva el id del
+nodo), con `id_nodo`, `Nodo` y `Desviación` como categóricas. Cada nodo tiene
+la lista ordenada de sus filas, así que:
+- la vista de un nodo para el editor es un `.loc` sobre esas filas, sin
+  reconstruir nada;
+- editar una celda es `df.at[id_row, columna]` (O(1));
+- la tabla consolidada se arma una vez y queda cacheada hasta el próximo
+  cambio.
+
+Los nodos se pueden cargar bajo demanda (`cargador`, por lotes: `tabla()`
+pide todos los que faltan en una sola lectura y los anexa con un único concat)
+y la hoja anota qué nodos cambiaron (`sucios`) para que el repositorio guarde
+solo esos.
+
+Agregar una fila no vuelve a tipar la tabla: se suman las categorías que
+falten y se extiende el índice (un reindex). Borrar una fila solo la saca del
+orden del nodo y la marca como borrada (O(1)); las borradas se compactan cuando
+pasan de la mitad de la tabla, y deshacer un borrado reutiliza su fila.
+
+Los cambios del editor llegan como parches por fila (`aplicar_cambios`) y cada
+paso guarda su operación inversa, así que `deshacer` revierte el último paso
+sin copiar la hoja.
+"""
+from collections import deque
+from itertools import chain
+
+import pandas as pd
+
+COLUMNAS = ["id_row", "id_nodo", "Nodo", "Desviación", "Causa", "Consecuencia", "Salvaguarda", "Recomendación"]
+COLUMNAS_FILA = [c for c in COLUMNAS if c != "id_nodo"]
+CATEGORICAS = ("id_nodo", "Nodo", "Desviación")
+PASOS_DESHACER = 50
+COMPACTAR_MINIMO = 64  # filas borradas antes de considerar compactar
+
+# Palabras guía habituales (la lista crece con las desviaciones que se usen)
+DESVIACIONES = [
+    "Alta presión", "Baja presión", "Alta temperatura", "Baja temperatura",
+    "Alto flujo", "Bajo flujo / sin flujo", "Flujo inverso", "Alto nivel", "Bajo nivel",
+    "Pérdida de contención", "Contaminación", "Arranque / parada", "Mantenimiento",
+]
+
+
+def _vacio() -> pd.DataFrame:
+    df = pd.DataFrame({c: pd.Series(dtype=object) for c in COLUMNAS}).set_index("id_row")
+    return _tipar(df)
+
+
+def _tipar(df: pd.DataFrame) -> pd.DataFrame:
+    for c in CATEGORICAS:
+        base = DESVIACIONES if c == "Desviación" else []
+        valores = df[c].astype(object).where(df[c].notna(), "")
+        categorias = list(dict.fromkeys([*base, *valores.unique().tolist()]))
+        df[c] = pd.Categorical(valores, categories=categorias)
+    for c in df.columns:
+        if c not in CATEGORICAS:
+            df[c] = df[c].astype(object).where(df[c].notna(), "")
+    return df
+
+
+class HojaHazop:
+    """
+    Filas HAZOP de todos los nodos de un estudio + recomendación por nodo.
+    """
+
+    def __init__(self, nodos: list[str] | None = None, cargador=None):
+        """
+        nodos: orden de los nodos. cargador(nids) -> {nid: (recomendacion, filas)}
+        lee de una vez los nodos que aún no están en memoria (los que falten
+        en el resultado quedan vacíos).
+        """
+        self.df = _vacio()
+        self.recomendaciones: dict[str, str] = {}
+        self._nodos = list(nodos or [])
+        self._filas_nodo: dict[str, list[str]] = {}
+        self._borradas: set[str] = set()
+        self._cargador = cargador
+        self.sucios: set[str] = set()
+        self.persistida = cargador is not None
+        self._tabla: pd.DataFrame | None = None
+        self._deshacer: deque[list] = deque(maxlen=PASOS_DESHACER)
+
+    @classmethod
+    def desde_filas(cls, filas: list[dict], recomendaciones: dict[str, str]) -> "HojaHazop":
+        """Construye la hoja de una vez (filas con las COLUMNAS)."""
+        hoja = cls(list(recomendaciones))
+        if filas:
+            df = pd.DataFrame.from_records(filas, columns=COLUMNAS).drop_duplicates("id_row", keep="last")
+            hoja.df = _tipar(df.set_index("id_row"))
+        ids = hoja.df.index.to_series()
+        por_nodo = ids.groupby(hoja.df["id_nodo"].astype(object), sort=False).agg(list).to_dict()
+        for nid in hoja._nodos:
+            hoja._filas_nodo[nid] = por_nodo.get(nid, [])
+        hoja.recomendaciones = dict(recomendaciones)
+        hoja.sucios = set(hoja._nodos)
+        return hoja
+
+    # ---------------------------------------------------------
+    # Nodos
+    # ---------------------------------------------------------
+    def nodos(self) -> list[str]:
+        return list(self._nodos)
+
+    def __len__(self) -> int:
+        return len(self._nodos)
+
+    def __bool__(self) -> bool:
+        return bool(self._nodos)
+
+    def _asegurar(self, nid: str):
+        if nid not in self._filas_nodo:
+            self._asegurar_varios([nid])
+
+    def _asegurar_varios(self, nids):
+        """Carga en un solo lote los nodos de `nids` que aún no están en memoria."""
+        faltan = [n for n in nids if n not in self._filas_nodo]
+        if not faltan:
+            return
+        for nid in faltan:
+            if nid not in self._nodos:
+                raise KeyError(nid)
+        leidos = self._cargador(faltan) if self._cargador else {}
+        registros = []
+        for nid in faltan:
+            recomendacion, filas = leidos.get(nid) or ("", [])
+            self.recomendaciones[nid] = recomendacion
+            self._filas_nodo[nid] = [f["id_row"] for f in filas]
+            registros += [{**f, "id_nodo": nid} for f in filas]
+        if registros:
+            self._anexar(pd.DataFrame.from_records(registros, columns=COLUMNAS).set_index("id_row"))
+
+    def _anexar(self, nuevo: pd.DataFrame):
+        """Suma filas nuevas: solo se tipan ellas y se unen las categorías."""
+        nuevo = _tipar(nuevo[~nuevo.index.duplicated(keep="last")].copy())
+        # una fila ya presente (p. ej. borrada) se reemplaza por la nueva
+        repetidas = self.df.index.intersection(nuevo.index)
+        if len(repetidas):
+            self.df = self.df.drop(index=repetidas)
+            self._borradas.difference_update(repetidas)
+        for c in CATEGORICAS:
+            categorias = self.df[c].cat.categories.union(nuevo[c].cat.categories, sort=False)
+            self.df[c] = self.df[c].cat.set_categories(categorias)
+            nuevo[c] = nuevo[c].cat.set_categories(categorias)
+        self.df = pd.concat([self.df, nuevo])
+        self._tabla = None
+
+    def _tocar(self, nid: str):
+        self.sucios.add(nid)
+        self._tabla = None
+
+    # ---------------------------------------------------------
+    # Lectura
+    # ---------------------------------------------------------
+    def vista(self, nid: str) -> pd.DataFrame:
+        """Filas de un nodo (COLUMNAS_FILA), listas para el editor."""
+        self._asegurar(nid)
+        vista = self.df.loc[self._filas_nodo[nid], COLUMNAS_FILA[1:]]
+        vista = vista.reset_index()
+        vista["Nodo"] = vista["Nodo"].astype(object)
+        return vista
+
+    def filas(self, nid: str) -> list[dict]:
+        return self.vista(nid).to_dict(orient="records")
+
+    def recomendacion(self, nid: str) -> str:
+        self._asegurar(nid)
+        return self.recomendaciones.get(nid, "")
+
+    def tabla(self) -> pd.DataFrame:
+        """Hoja consolidada (COLUMNAS), en orden de nodos; cacheada hasta el próximo cambio."""
+        if self._tabla is None:
+            self._asegurar_varios(self._nodos)
+            ids = list(chain.from_iterable(self._filas_nodo[n] for n in self._nodos))
+            tabla = self.df.loc[ids].reset_index()[COLUMNAS]
+            self._tabla = tabla
+        return self._tabla
+
+    # ---------------------------------------------------------
+    # Escritura (cada cambio se registra para deshacer)
+    # ---------------------------------------------------------
+    def actualizar(self, id_row: str, columna: str, valor):
+        """Cambia una celda (O(1))."""
+        self._registrar([self._celda(id_row, columna, valor)])
+
+    def set_recomendacion(self, nid: str, texto: str):
+        self._asegurar(nid)
+        if self.recomendaciones.get(nid, "") != texto:
+            self._registrar([self._recomendacion(nid, texto)])
+
+    def agregar_fila(self, nid: str, fila: dict | None = None) -> str:
+        """Agrega una fila al final del nodo y devuelve su id_row."""
+        self._asegurar(nid)
+        inversa = self._insertar(nid, len(self._filas_nodo[nid]), fila or {})
+        self._registrar([inversa])
+        return inversa[1]
+
+    def borrar_fila(self, id_row: str):
+        self._registrar([self._quitar(id_row)])
+
+    def aplicar_cambios(self, nid: str, vista: pd.DataFrame, cambios: dict) -> int:
+        """
+        Aplica los cambios de st.data_editor hechos sobre `vista` (la
+        `vista(nid)` mostrada) como parches por fila: celdas editadas, filas
+        agregadas y filas borradas. Todo queda como un solo paso de deshacer.
+        Devuelve el número de operaciones.
+        """
+        self._asegurar(nid)
+        ids = vista["id_row"].tolist()
+        inversa = []
+        for pos, celdas in cambios.get("edited_rows", {}).items():
+            id_row = ids[int(pos)]
+            inversa += [self._celda(id_row, c, v) for c, v in celdas.items() if c in COLUMNAS_FILA[1:]]
+        for fila in cambios.get("added_rows", []):
+            inversa.append(self._insertar(nid, len(self._filas_nodo[nid]), fila))
+        for pos in sorted((int(p) for p in cambios.get("deleted_rows", [])), reverse=True):
+            inversa.append(self._quitar(ids[pos]))
+        self._registrar(inversa)
+        return len(inversa)
+
+    def deshacer(self) -> bool:
+        """Revierte el último paso. False si no hay nada que deshacer."""
+        if not self._deshacer:
+            return False
+        for op, *args in reversed(self._deshacer.pop()):
+            getattr(self, op)(*args)
+        return True
+
+    @property
+    def puede_deshacer(self) -> bool:
+        return bool(self._deshacer)
+
+    def _registrar(self, inversa: list):
+        if inversa:
+            self._deshacer.append(inversa)
+
+    # Primitivas: aplican un cambio y devuelven la operación inversa
+    # (nombre del método, *argumentos).
+    def _celda(self, id_row: str, columna: str, valor) -> tuple:
+        anterior = self.df.at[id_row, columna]
+        if columna in CATEGORICAS:
+            valor = "" if valor is None else valor
+            if valor not in self.df[columna].cat.categories:
+                self.df[columna] = self.df[columna].cat.add_categories([valor])
+        elif valor is None or (isinstance(valor, float) and pd.isna(valor)):
+            valor = ""
+        self.df.at[id_row, columna] = valor
+        self._tocar(str(self.df.at[id_row, "id_nodo"]))
+        return ("_celda", id_row, columna, anterior)
+
+    def _recomendacion(self, nid: str, texto: str) -> tuple:
+        anterior = self.recomendaciones.get(nid, "")
+        self.recomendaciones[nid] = texto
+        self._tocar(nid)
+        return ("_recomendacion", nid, anterior)
+
+    def _insertar(self, nid: str, posicion: int, fila: dict) -> tuple:
+        id_row = fila.get("id_row") or ""
+        # una fila borrada (deshacer) vuelve a su lugar; si no, el id debe ser nuevo
+        if id_row not in self._borradas and (not id_row or id_row in self.df.index):
+            n = len(self._filas_nodo[nid]) + 1
+            id_row = f"{nid}-R-{n:03d}"
+            while id_row in self.df.index:
+                n += 1
+                id_row = f"{nid}-R-{n:03d}"
+        datos = {c: "" for c in COLUMNAS_FILA[1:]}
+        datos.update({k: v for k, v in fila.items() if k in datos and v is not None})
+        datos["id_nodo"] = nid
+        if id_row in self._borradas:
+            self._borradas.discard(id_row)
+        else:
+            self.df = self.df.reindex(self.df.index.append(pd.Index([id_row])))
+            self.df.index.name = "id_row"
+        for c, v in datos.items():
+            if c in CATEGORICAS and v not in self.df[c].cat.categories:
+                self.df[c] = self.df[c].cat.add_categories([v])
+            self.df.at[id_row, c] = v
+        self._filas_nodo[nid].insert(posicion, id_row)
+        self._tocar(nid)
+        return ("_quitar", id_row)
+
+    def _quitar(self, id_row: str) -> tuple:
+        nid = str(self.df.at[id_row, "id_nodo"])
+        datos = {"id_row": id_row, **self.df.loc[id_row].astype(object).to_dict()}
+        posicion = self._filas_nodo[nid].index(id_row)
+        self._filas_nodo[nid].remove(id_row)
+        self._borradas.add(id_row)
+        if len(self._borradas) > max(COMPACTAR_MINIMO, len(self.df) // 2):
+            self._compactar()
+        self._tocar(nid)
+        return ("_insertar", nid, posicion, datos)
+
+    def _compactar(self):
+        # las borradas ya no están en ningún nodo: se sacan de la tabla de una vez
+        self.df = self.df.drop(index=list(self._borradas))
+        self._borradas.clear()
+
+    # ---------------------------------------------------------
+    # Persistencia
+    # ---------------------------------------------------------
+    def registro_nodo(self, nid: str) -> dict:
+        """{"recomendacion_nodo", "rows"} de un nodo (formato que guarda el repositorio)."""
+        return {"recomendacion_nodo": self.recomendacion(nid), "rows": self.filas(nid)}
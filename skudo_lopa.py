@@ -0,0 +1,312 @@
+"""
+Motor LOPA y matriz de riesgo, vectorizado sobre todo el registro de
+escenarios.
+
+Para cada escenario:
+    frecuencia mitigada = frecuencia del evento iniciador × Π PFD de sus IPL
+Los créditos de IPL son una tabla dispersa (id_escenario, ipl): cada escenario
+tiene solo las capas que le aplican. El producto se calcula en log10 con un
+único `np.bincount` sobre los créditos (equivale a multiplicar una matriz
+dispersa escenario×IPL por el vector log10(PFD)), así que recalcular el
+registro completo tras cambiar un supuesto de PFD es O(créditos), sin bucles
+de Python.
+
+La frecuencia mitigada se ubica en una matriz de riesgo configurable (cortes
+de frecuencia → categoría 1..5; severidad × categoría → nivel). La matriz por
+defecto reproduce la regla S×F que ya usa SKUDO (≥15 Muy alto, ≥8 Alto).
+
+`montecarlo` agrega un modo de incertidumbre: muestrea la frecuencia del
+iniciador (lognormal, mediana = valor puntual, factor de error) y la PFD de
+cada IPL acreditada (beta con media = supuesto de PFD, ver ALFA_MIN_PFD) y
+devuelve P5/P50/P95 de la frecuencia mitigada por escenario. Se calcula como
+una matriz (escenarios × muestras) por bloques de escenarios para acotar la
+memoria; cada escenario tiene su propio flujo aleatorio (SeedSequence con la
+semilla y su posición en el registro), así que el resultado es reproducible y
+no depende de qué escenarios se pidan juntos ni de cuántos procesos se usen.
+Los bloques se reparten en un pool de procesos y los percentiles salen de una
+selección parcial (`np.partition`). Referencia: 10^5 escenarios × 10^4
+muestras ≈ 136 s en un núcleo (casi todo es el muestreo beta / normal).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+# Frecuencia del evento iniciador (eventos/año) según la categoría 1..5:
+# punto medio (log) de cada banda de la matriz.
+FRECUENCIA_INICIADOR = {1: 10 ** -4.5, 2: 10 ** -3.5, 3: 10 ** -2.5, 4: 10 ** -1.5, 5: 10 ** -0.5}
+
+# Supuestos de PFD por tipo de IPL (CCPS, valores genéricos)
+PFD_IPL = {
+    "PSV": 0.01,
+    "SIS / interlock": 0.01,
+    "Alarma + respuesta del operador": 0.1,
+    "Control básico (BPCS)": 0.1,
+    "Detección de gas / parada remota": 0.1,
+    "Dique / contención": 0.01,
+}
+
+# Palabras de `salvaguardas_clave` que dan crédito a cada IPL (datos DEMO)
+PALABRAS_IPL = {
+    "PSV": r"\bpsv\b|válvula de alivio",
+    "SIS / interlock": r"\bsis\b|interlock|enclavamiento",
+    "Alarma + respuesta del operador": r"alarma",
+    "Control básico (BPCS)": r"control de (?:temperatura|presión|nivel|caudal)",
+    "Detección de gas / parada remota": r"detecci[oó]n|parada remota",
+    "Dique / contención": r"dique|contenci[oó]n",
+}
+
+
+# Incertidumbre (Monte Carlo)
+FACTOR_ERROR_IEF = 3.0      # P95 / P50 de la frecuencia del iniciador
+CONCENTRACION_PFD = 50.0    # a + b mínima de la beta de cada PFD (mayor = menos dispersa)
+# Con a + b fija, una PFD chica da una beta en J (PFD 0.01 → Beta(0.5, 49.5):
+# mediana ≈ 0.0046, P5 ≈ 4e-5, la P50 queda ~2× bajo el valor puntual). La
+# concentración se escala con la PFD para que a = PFD·(a + b) ≥ ALFA_MIN_PFD:
+# PFD 0.01 → Beta(2, 198), unimodal, mediana ≈ 0.0084.
+ALFA_MIN_PFD = 2.0
+MUESTRAS_MC = 10_000
+SEMILLA_MC = 3687
+BLOQUE_MC = 256             # escenarios por bloque (≈ BLOQUE_MC × muestras × 8 B por matriz)
+PERCENTILES_MC = (5, 50, 95)
+# Por debajo de este número de valores (escenarios × muestras) no vale la pena el pool
+MINIMO_POOL_MC = 20_000_000
+_Z95 = 1.6448536269514722
+
+
+def supuestos_validos(pfd: dict | None) -> dict:
+    """
+    PFD_IPL actualizado por `pfd`, ignorando valores vacíos, no numéricos o
+    fuera de (0, 1] (p. ej. una celda borrada en el editor): esos IPL quedan
+    con su PFD genérica.
+    """
+    supuestos = dict(PFD_IPL)
+    for ipl, valor in (pfd or {}).items():
+        try:
+            valor = float(valor)
+        except (TypeError, ValueError):
+            continue
+        if 0.0 < valor <= 1.0:
+            supuestos[ipl] = valor
+    return supuestos
+
+
+def _nivel_sxf(severidad: int, categoria: int) -> str:
+    riesgo = severidad * categoria
+    return "Muy alto" if riesgo >= 15 else "Alto" if riesgo >= 8 else "Medio"
+
+
+# Matriz de riesgo: cortes (eventos/año) entre categorías de frecuencia 1..5 y
+# nivel por [severidad - 1][categoría - 1].
+MATRIZ_DEFECTO = {
+    "cortes_frecuencia": [1e-4, 1e-3, 1e-2, 1e-1],
+    "niveles": [[_nivel_sxf(s, f) for f in range(1, 6)] for s in range(1, 6)],
+}
+
+
+def creditos_desde_salvaguardas(df_rp: pd.DataFrame, col: str = "salvaguardas_clave") -> pd.DataFrame:
+    """Tabla dispersa (id_escenario, ipl) a partir del texto de salvaguardas (DEMO)."""
+    texto = df_rp[col].fillna("").astype(str).str.lower()
+    partes = [
+        pd.DataFrame({"id_escenario": df_rp.loc[texto.str.contains(patron, regex=True).to_numpy(), "id_escenario"], "ipl": ipl})
+        for ipl, patron in PALABRAS_IPL.items()
+    ]
+    return pd.concat(partes, ignore_index=True)
+
+
+class MotorLOPA:
+    """
+    Registro de escenarios + créditos IPL, indexados una vez. `evaluar`
+    recibe los supuestos de PFD (y la matriz) y devuelve todo el registro.
+    Es de solo lectura después de construido: se puede compartir entre sesiones.
+    """
+
+    def __init__(self, escenarios: pd.DataFrame, creditos: pd.DataFrame):
+        """
+        escenarios: id_escenario, severidad (1..5) y frecuencia_inicial
+        (eventos/año) o, si no está, frecuencia (categoría 1..5).
+        creditos: id_escenario, ipl (una fila por IPL acreditada).
+        """
+        self.ids = pd.Index(escenarios["id_escenario"])
+        self.severidad = escenarios["severidad"].to_numpy(dtype=np.int64).clip(1, 5)
+        if "frecuencia_inicial" in escenarios.columns:
+            self.ief = escenarios["frecuencia_inicial"].to_numpy(dtype=np.float64)
+        else:
+            cat = escenarios["frecuencia"].to_numpy(dtype=np.int64).clip(1, 5)
+            self.ief = np.array([FRECUENCIA_INICIADOR[c] for c in range(1, 6)])[cat - 1]
+
+        self.catalogo = pd.Index(sorted(set(PFD_IPL) | set(creditos["ipl"].unique())))
+        esc = self.ids.get_indexer(creditos["id_escenario"])
+        ipl = self.catalogo.get_indexer(creditos["ipl"])
+        validos = esc >= 0
+        # créditos ordenados por escenario (CSR): los del escenario i están en
+        # _ipl[_ptr[i]:_ptr[i + 1]]
+        orden = np.argsort(esc[validos], kind="stable")
+        self._esc = esc[validos][orden]
+        self._ipl = ipl[validos][orden]
+        self.n_ipl = np.bincount(self._esc, minlength=len(self.ids))
+        self._ptr = np.concatenate([[0], np.cumsum(self.n_ipl)])
+
+    def pfd_catalogo(self, pfd: dict | None = None) -> np.ndarray:
+        """
+        PFD de cada IPL del catálogo (PFD_IPL actualizado por los valores
+        válidos de `pfd`, ver `supuestos_validos`; 1.0 = sin crédito).
+        """
+        supuestos = supuestos_validos(pfd)
+        return np.array([supuestos.get(i, 1.0) for i in self.catalogo], dtype=np.float64)
+
+    def creditos_de(self, pos: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(ptr, ipl) en formato CSR de los escenarios en las posiciones `pos`."""
+        largos = self.n_ipl[pos]
+        ptr = np.concatenate([[0], np.cumsum(largos)])
+        idx = np.repeat(self._ptr[pos] - ptr[:-1], largos) + np.arange(ptr[-1])
+        return ptr, self._ipl[idx]
+
+    def frecuencia_mitigada(self, pfd: dict | None = None) -> np.ndarray:
+        """IEF × Π PFD por escenario (eventos/año), con PFD_IPL actualizado por `pfd`."""
+        log_pfd = np.log10(self.pfd_catalogo(pfd))
+        suma = np.bincount(self._esc, weights=log_pfd[self._ipl], minlength=len(self.ids))
+        return self.ief * np.power(10.0, suma)
+
+    def evaluar(self, pfd: dict | None = None, matriz: dict | None = None) -> pd.DataFrame:
+        """
+        Registro completo (índice id_escenario): frecuencia_inicial,
+        n_ipl, frecuencia_mitigada, frecuencia_residual (categoría 1..5),
+        riesgo_residual (S × categoría) y nivel_riesgo.
+        """
+        matriz = matriz or MATRIZ_DEFECTO
+        fm = self.frecuencia_mitigada(pfd)
+        categoria = np.searchsorted(np.asarray(matriz["cortes_frecuencia"]), fm, side="right") + 1
+        niveles = np.asarray(matriz["niveles"], dtype=object)
+        return pd.DataFrame({
+            "frecuencia_inicial": self.ief,
+            "n_ipl": self.n_ipl,
+            "frecuencia_mitigada": fm,
+            "frecuencia_residual": categoria,
+            "riesgo_residual": self.severidad * categoria,
+            "nivel_riesgo": niveles[self.severidad - 1, categoria - 1],
+        }, index=self.ids)
+
+
+def aplicar_lopa(df_rp: pd.DataFrame, resultado: pd.DataFrame) -> pd.DataFrame:
+    """Copia de `df_rp` con las columnas calculadas de `resultado` (de `evaluar`)."""
+    calculado = resultado.reindex(df_rp["id_escenario"])
+    out = df_rp.drop(columns=[c for c in calculado.columns if c in df_rp.columns])
+    return pd.concat([out.reset_index(drop=True), calculado.reset_index(drop=True)], axis=1)
+
+
+# =========================================================
+# INCERTIDUMBRE (MONTE CARLO)
+# =========================================================
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _pool_procesos(procesos: int) -> ProcessPoolExecutor:
+    """Pool compartido por el proceso (spawn: seguro aunque el servidor tenga hilos)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._max_workers != procesos:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _descartar_pool(roto: ProcessPoolExecutor):
+    """Olvida un pool roto (p. ej. un worker muerto por falta de memoria) para que se cree otro."""
+    global _pool
+    with _pool_lock:
+        if _pool is roto:
+            _pool = None
+    roto.shutdown(wait=False, cancel_futures=True)
+
+
+def _en_pool(procesos: int, tareas: list) -> list:
+    # un pool roto se reemplaza una vez; si el nuevo también falla, se calcula aquí
+    for _ in range(2):
+        pool = _pool_procesos(procesos)
+        try:
+            return list(pool.map(_bloque_mc, *zip(*tareas)))
+        except BrokenProcessPool:
+            _descartar_pool(pool)
+    return [_bloque_mc(*t) for t in tareas]
+
+
+def _percentiles(matriz: np.ndarray, percentiles) -> np.ndarray:
+    """
+    Percentiles por fila (interpolación lineal, igual que `np.percentile`)
+    con una sola selección parcial `np.partition` en vez de ordenar cada fila.
+    """
+    h = (matriz.shape[1] - 1) * np.asarray(percentiles, dtype=np.float64) / 100.0
+    bajo = np.floor(h).astype(np.intp)
+    alto = np.minimum(bajo + 1, matriz.shape[1] - 1)
+    parcial = np.partition(matriz, np.unique(np.concatenate([bajo, alto])), axis=1)
+    return parcial[:, bajo] + (h - bajo) * (parcial[:, alto] - parcial[:, bajo])
+
+
+def _bloque_mc(ief, ptr, ipl, pfd, n_muestras, sigma, concentracion, semilla, pos, percentiles):
+    """Percentiles de la frecuencia mitigada de un bloque de escenarios (corre en un proceso del pool)."""
+    log_f = np.empty((len(ief), n_muestras))
+    log_ief = np.log10(ief)
+    escala = sigma / np.log(10)
+    media = np.clip(pfd[ipl], 1e-9, 1 - 1e-9)
+    conc = np.maximum(concentracion, ALFA_MIN_PFD / media)
+    for j in range(len(ief)):
+        # cada escenario tiene su propio flujo (semilla, posición en el registro):
+        # el resultado no depende de qué otros escenarios se pidieron
+        rng = np.random.default_rng(np.random.SeedSequence(semilla, spawn_key=(int(pos[j]),)))
+        # log10 de la frecuencia: lognormal del iniciador ...
+        fila = log_f[j]
+        rng.standard_normal(n_muestras, out=fila)
+        fila *= escala
+        fila += log_ief[j]
+        # ... + log10 de la PFD muestreada de cada IPL (beta con media = supuesto)
+        for m, c in zip(media[ptr[j]:ptr[j + 1]], conc[ptr[j]:ptr[j + 1]]):
+            fila += np.log10(np.maximum(rng.beta(m * c, (1 - m) * c, n_muestras), 1e-300))
+    return np.power(10.0, _percentiles(log_f, percentiles))
+
+
+def montecarlo(
+    motor: MotorLOPA,
+    ids=None,
+    pfd: dict | None = None,
+    n_muestras: int = MUESTRAS_MC,
+    semilla: int = SEMILLA_MC,
+    factor_error_ief: float = FACTOR_ERROR_IEF,
+    concentracion_pfd: float = CONCENTRACION_PFD,
+    bloque: int = BLOQUE_MC,
+    procesos: int | None = None,
+    percentiles: tuple = PERCENTILES_MC,
+) -> pd.DataFrame:
+    """
+    Percentiles (p5/p50/p95 por defecto) de la frecuencia mitigada de los
+    escenarios `ids` (todos si es None), índice id_escenario.
+    procesos=1 calcula en el proceso actual; None usa todos los núcleos (si
+    el trabajo es grande).
+    """
+    pos = np.arange(len(motor.ids)) if ids is None else motor.ids.get_indexer(pd.Index(ids))
+    pos = pos[pos >= 0]
+    columnas = [f"p{q:g}" for q in percentiles]
+    if len(pos) == 0:
+        return pd.DataFrame(columns=columnas, index=pd.Index([], name="id_escenario"))
+
+    pfd_cat = motor.pfd_catalogo(pfd)
+    sigma = np.log(factor_error_ief) / _Z95
+    tareas = []
+    for ini in range(0, len(pos), bloque):
+        sub = pos[ini:ini + bloque]
+        ptr, ipl = motor.creditos_de(sub)
+        tareas.append((motor.ief[sub], ptr, ipl, pfd_cat, n_muestras, sigma,
+                       concentracion_pfd, semilla, sub, tuple(percentiles)))
+
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or len(tareas) == 1 or len(pos) * n_muestras < MINIMO_POOL_MC:
+        partes = [_bloque_mc(*t) for t in tareas]
+    else:
+        partes = _en_pool(procesos, tareas)
+    return pd.DataFrame(np.vstack(partes), columns=columnas, index=motor.ids[pos])
@@ -0,0 +1,67 @@
+"""
+Puntaje de madurez CCPS a partir de la calificación del diagnóstico.
+
+`calificacion` se guarda como Categorical ordenado y el puntaje se obtiene
+con un único `take` sobre una tabla indexada por el código de la categoría,
+en vez de llamar a una función de Python por fila. La columna `score` se
+calcula una vez al ingerir (`preparar_diagnostico`) y la reutilizan todos
+los promedios y group-bys.
+"""
+import numpy as np
+import pandas as pd
+
+CALIFICACIONES = ["Muy bajo", "Bajo", "Medio", "Alto", "Muy alto"]
+SCORES = {"Muy bajo": 20, "Bajo": 40, "Medio": 60, "Alto": 80, "Muy alto": 95}
+SCORE_DESCONOCIDO = 50
+
+CALIFICACION_DTYPE = pd.CategoricalDtype(CALIFICACIONES, ordered=True)
+
+# Indexada por código de categoría; el código -1 (valor fuera del catálogo)
+# cae en la última posición.
+_TABLA_SCORES = np.array([SCORES[c] for c in CALIFICACIONES] + [SCORE_DESCONOCIDO], dtype=np.int16)
+
+
+def calificacion_to_score(calif: str) -> int:
+    """Versión escalar (para un solo valor)."""
+    return SCORES.get(calif, SCORE_DESCONOCIDO)
+
+
+def como_categoria(calificaciones: pd.Series) -> pd.Series:
+    if isinstance(calificaciones.dtype, pd.CategoricalDtype) and calificaciones.dtype == CALIFICACION_DTYPE:
+        return calificaciones
+    return calificaciones.astype(str).astype(CALIFICACION_DTYPE)
+
+
+def scores_calificacion(calificaciones: pd.Series) -> pd.Series:
+    """Puntaje vectorizado de una serie de calificaciones."""
+    codigos = como_categoria(calificaciones).cat.codes.to_numpy()
+    return pd.Series(_TABLA_SCORES[codigos], index=calificaciones.index, name="score")
+
+
+def preparar_diagnostico(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia con `calificacion` categórica ordenada y columna `score` precalculada."""
+    out = df.copy()
+    out["calificacion"] = como_categoria(out["calificacion"])
+    out["score"] = scores_calificacion(out["calificacion"])
+    return out
+
+
+def con_score(df: pd.DataFrame) -> pd.DataFrame:
+    """Devuelve `df` tal cual si ya trae `score`; si no, una copia preparada."""
+    if "score" in df.columns:
+        return df
+    return preparar_diagnostico(df)
+
+
+def calcular_madurez_global(df_diag_filtrado: pd.DataFrame) -> float:
+    if df_diag_filtrado.empty:
+        return 0.0
+    return round(float(con_score(df_diag_filtrado)["score"].mean()), 1)
+
+
+def madurez_por(df_diag_filtrado: pd.DataFrame, columna: str) -> pd.DataFrame:
+    """Promedio de `score` por pilar / elemento / instalación, redondeado a 1 decimal."""
+    df = con_score(df_diag_filtrado)
+    out = df.groupby(columna, as_index=False, observed=True)["score"].mean()
+    out["score"] = out["score"].round(1)
+    return out
@@ -0,0 +1,288 @@
+"""
+Visor de P&ID por teselas (tiles).
+
+Cada imagen de P&ID se corta una sola vez en una pirámide de niveles de zoom
+(nivel máximo = resolución original, cada nivel anterior a la mitad) con
+teselas de 256 px, guardada en static/pid/<huella>/<z>/<x>/<y>.png. Streamlit
+sirve esa carpeta como archivos estáticos (server.enableStaticServing en
+.streamlit/config.toml) y el visor (Leaflet, CRS.Simple) solo pide las teselas
+visibles del nivel actual. Los resaltados de nodos se dibujan en el navegador
+sobre la imagen, sin volver a codificarla. Leaflet (1.9.3, licencia BSD) está
+copiado en static/leaflet/ y se sirve desde ahí, sin depender de un CDN.
+
+La huella es la del contenido del archivo: si el P&ID cambia se genera otra
+pirámide; si no, se reutiliza la del disco.
+
+Además, `derivados` genera una sola vez por contenido (SHA-256) tres versiones
+WebP de cada imagen —miniatura, vista previa y completa— en
+datos/derivados/<sha256>/. La carpeta tiene un tope de tamaño
+(SKUDO_DERIVADOS_MB) y se poda por LRU: cada uso actualiza el mtime y se
+borran primero los menos usados.
+"""
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import streamlit.components.v1 as components
+from PIL import Image
+
+from skudo_datos import huella_fuente, ruta_datos, sha256_archivo, sha256_bytes
+
+TESELA = 256
+DIR_STATIC = Path(__file__).parent / "static"
+# Prefijo con que Streamlit publica la carpeta static/ (relativo a la página).
+URL_STATIC = os.environ.get("SKUDO_STATIC_URL", "app/static")
+DIR_LEAFLET = DIR_STATIC / "leaflet"
+LEAFLET = f"{URL_STATIC}/leaflet"
+
+# Lado máximo (px) de cada derivado; WebP admite hasta 16383 px por lado.
+VARIANTES = {"miniatura": 320, "vista": 1600, "completa": 16383}
+CALIDAD_WEBP = {"miniatura": 75, "vista": 82, "completa": 90}
+LIMITE_DERIVADOS_MB = int(os.environ.get("SKUDO_DERIVADOS_MB", "1024"))
+EXTENSIONES_IMAGEN = {".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff", ".bmp"}
+
+# Límite contra "decompression bombs". Los P&ID de imagenes/ (escaneos A0,
+# archivos propios) pueden llegar a MAX_PIXELES_PID; lo que suben los usuarios
+# queda en MAX_PIXELES_SUBIDA, el límite por defecto de Pillow. Pillow solo
+# corta a partir del doble de MAX_IMAGE_PIXELS, así que el tope global queda
+# finito y cada apertura verifica su propio límite.
+MAX_PIXELES_PID = int(os.environ.get("SKUDO_PID_MAX_MPX", "300")) * 1_000_000
+MAX_PIXELES_SUBIDA = Image.MAX_IMAGE_PIXELS or 89_478_485
+Image.MAX_IMAGE_PIXELS = max(MAX_PIXELES_SUBIDA, MAX_PIXELES_PID)
+# Errores al abrir una imagen no válida o demasiado grande
+ERRORES_IMAGEN = (OSError, Image.DecompressionBombError)
+
+# Un lock por contenido (repartidos en N_LOCKS): dos imágenes distintas se
+# procesan en paralelo; la misma imagen se genera una sola vez.
+N_LOCKS = 64
+_locks = [threading.Lock() for _ in range(N_LOCKS)]
+_lock_poda = threading.Lock()
+
+
+def _lock_de(clave: str) -> threading.Lock:
+    return _locks[int(hashlib.sha1(clave.encode("utf-8")).hexdigest()[:8], 16) % N_LOCKS]
+
+
+def _abrir(fuente, limite: int) -> Image.Image:
+    """Abre la imagen (solo lee la cabecera) y rechaza las que superan `limite` píxeles."""
+    img = Image.open(fuente)
+    ancho, alto = img.size
+    if ancho * alto > limite:
+        img.close()
+        raise Image.DecompressionBombError(
+            f"Imagen de {ancho}×{alto} px supera el límite de {limite:,} píxeles"
+        )
+    return img
+
+
+# =========================================================
+# PIRÁMIDE DE TESELAS
+# =========================================================
+def _guardar_nivel(img: Image.Image, carpeta: Path):
+    ancho, alto = img.size
+    for x in range(math.ceil(ancho / TESELA)):
+        col = carpeta / str(x)
+        col.mkdir(parents=True, exist_ok=True)
+        for y in range(math.ceil(alto / TESELA)):
+            caja = (x * TESELA, y * TESELA, min((x + 1) * TESELA, ancho), min((y + 1) * TESELA, alto))
+            img.crop(caja).save(col / f"{y}.png", optimize=False)
+
+
+def construir_piramide(origen: Path, destino: Path) -> dict:
+    """
+    Genera todos los niveles en una carpeta temporal y la renombra al final
+    (nunca queda una pirámide a medias). Devuelve los metadatos.
+    """
+    tmp = destino.with_name(destino.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    with _abrir(origen, MAX_PIXELES_PID) as fuente:
+        img = fuente.convert("RGB")
+    ancho, alto = img.size
+    z_max = max(0, math.ceil(math.log2(max(ancho, alto) / TESELA)))
+
+    # del nivel más fino al más grueso, reduciendo a la mitad cada vez
+    for z in range(z_max, -1, -1):
+        _guardar_nivel(img, tmp / str(z))
+        if z:
+            img = img.reduce(2)
+
+    meta = {"ancho": ancho, "alto": alto, "z_max": z_max, "tesela": TESELA}
+    (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    shutil.rmtree(destino, ignore_errors=True)
+    tmp.rename(destino)
+    return meta
+
+
+def piramide(origen: Path) -> tuple[str, dict]:
+    """
+    (huella, metadatos) de la pirámide de `origen`, generándola si no existe.
+    Solo para P&ID propios (imagenes/): admite hasta MAX_PIXELES_PID.
+    """
+    origen = Path(origen)
+    huella = huella_fuente(origen)
+    destino = DIR_STATIC / "pid" / huella
+    meta = destino / "meta.json"
+    with _lock_de(huella):
+        if not meta.exists():
+            return huella, construir_piramide(origen, destino)
+    return huella, json.loads(meta.read_text(encoding="utf-8"))
+
+
+# =========================================================
+# VISOR
+# =========================================================
+_HTML_VISOR = """
+<link rel="stylesheet" href="{leaflet}/leaflet.css"/>
+<script src="{leaflet}/leaflet.js"></script>
+<div id="pid" style="height:{alto}px; background:#fff; border-radius:8px;"></div>
+<script>
+if (typeof L === "undefined") {{
+  document.getElementById("pid").innerHTML =
+    "<p style='font-family:sans-serif; color:#64748B; padding:1em'>No se pudo cargar el visor de P&amp;ID (Leaflet).</p>";
+  throw new Error("Leaflet no disponible en {leaflet}");
+}}
+const meta = {meta};
+const zonas = {zonas};
+const map = L.map("pid", {{crs: L.CRS.Simple, minZoom: 0, maxZoom: meta.z_max + 1, zoomSnap: 0.5, attributionControl: false}});
+const px = (x, y) => map.unproject([x, y], meta.z_max);
+const limites = L.latLngBounds(px(0, meta.alto), px(meta.ancho, 0));
+L.tileLayer("{url}/{{z}}/{{x}}/{{y}}.png", {{
+  tileSize: meta.tesela, minZoom: 0, maxNativeZoom: meta.z_max, maxZoom: meta.z_max + 1,
+  noWrap: true, bounds: limites
+}}).addTo(map);
+map.setMaxBounds(limites.pad(0.1));
+let foco = limites;
+for (const z of zonas) {{
+  const r = L.rectangle(
+    [px(z.x0 * meta.ancho, z.y1 * meta.alto), px(z.x1 * meta.ancho, z.y0 * meta.alto)],
+    {{color: z.activa ? "#F97316" : "#64748B", weight: z.activa ? 3 : 1, fillOpacity: z.activa ? 0.12 : 0.04}}
+  ).bindTooltip(z.etiqueta).addTo(map);
+  if (z.activa) foco = r.getBounds().pad(0.15);
+}}
+map.fitBounds(foco);
+</script>
+"""
+
+
+def visor_pid(origen: Path, zonas: dict | None = None, activa: str | None = None, alto: int = 520):
+    """
+    Visor pan/zoom del P&ID. `zonas` = {etiqueta: (x0, y0, x1, y1)} en
+    fracciones del ancho/alto de la imagen; la zona `activa` se resalta y el
+    visor se centra en ella. Falla con FileNotFoundError si falta Leaflet en
+    static/leaflet/ (quien llama puede mostrar otra vista).
+    """
+    for nombre in ("leaflet.js", "leaflet.css"):
+        if not (DIR_LEAFLET / nombre).exists():
+            raise FileNotFoundError(DIR_LEAFLET / nombre)
+    huella, meta = piramide(origen)
+    capas = [
+        {"etiqueta": k, "x0": c[0], "y0": c[1], "x1": c[2], "y1": c[3], "activa": k == activa}
+        for k, c in (zonas or {}).items()
+    ]
+    html = _HTML_VISOR.format(
+        leaflet=LEAFLET,
+        alto=alto,
+        meta=json.dumps(meta),
+        zonas=json.dumps(capas, ensure_ascii=False),
+        url=f"{URL_STATIC}/pid/{huella}",
+    )
+    components.html(html, height=alto + 10)
+
+
+# =========================================================
+# DERIVADOS (miniatura / vista / completa) POR SHA-256
+# =========================================================
+def es_imagen(nombre: str) -> bool:
+    return Path(nombre).suffix.lower() in EXTENSIONES_IMAGEN
+
+
+def _generar_derivados(fuente, destino: Path, limite: int):
+    tmp = destino.with_name(destino.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    with _abrir(fuente, limite) as img:
+        img = img.convert("RGB")
+        for variante, lado in VARIANTES.items():
+            copia = img.copy()
+            copia.thumbnail((lado, lado), Image.LANCZOS)  # solo reduce, nunca amplía
+            copia.save(tmp / f"{variante}.webp", "WEBP", quality=CALIDAD_WEBP[variante], method=4)
+    shutil.rmtree(destino, ignore_errors=True)
+    tmp.rename(destino)
+
+
+def _podar(conservar: Path):
+    """Borra los derivados menos usados hasta quedar bajo LIMITE_DERIVADOS_MB."""
+    carpetas = []
+    for c in ruta_datos("derivados").iterdir():
+        if c.is_dir() and not c.name.endswith(".tmp"):
+            try:
+                carpetas.append((c.stat().st_mtime, sum(f.stat().st_size for f in c.iterdir()), c))
+            except FileNotFoundError:
+                continue  # otra sesión la está regenerando
+    total = sum(t for _, t, _ in carpetas)
+    limite = LIMITE_DERIVADOS_MB * 1024 * 1024
+    for _, tam, c in sorted(carpetas, key=lambda x: x[0]):
+        if total <= limite:
+            break
+        if c == conservar:
+            continue
+        # si otra sesión está usando o generando ese derivado, se deja para la próxima poda
+        lock = _lock_de(c.name)
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            shutil.rmtree(c, ignore_errors=True)
+        finally:
+            lock.release()
+        total -= tam
+
+
+def derivados(origen: Path | bytes, sha: str | None = None, confiable: bool = False) -> dict[str, Path]:
+    """
+    Rutas {miniatura, vista, completa} (WebP) de una imagen, dada como ruta o
+    como bytes (p. ej. un archivo subido). Se generan solo la primera vez.
+    Si ya se conoce el SHA-256 del contenido (p. ej. un blob) se puede pasar.
+    `confiable=True` solo para archivos propios (imagenes/): admite hasta
+    MAX_PIXELES_PID; el resto queda en MAX_PIXELES_SUBIDA.
+    """
+    limite = MAX_PIXELES_PID if confiable else MAX_PIXELES_SUBIDA
+    if isinstance(origen, (bytes, bytearray, memoryview)):
+        datos = bytes(origen)
+        sha = sha or sha256_bytes(datos)
+    else:
+        datos = None
+        sha = sha or sha256_archivo(origen)
+
+    carpeta = ruta_datos("derivados") / sha
+    with _lock_de(sha):
+        rutas = _usar(sha)
+        if rutas is not None:
+            return rutas
+        _generar_derivados(io.BytesIO(datos) if datos is not None else Path(origen), carpeta, limite)
+    with _lock_poda:
+        _podar(carpeta)
+    return {v: carpeta / f"{v}.webp" for v in VARIANTES}
+
+
+def derivados_guardados(sha: str) -> dict[str, Path] | None:
+    """Derivados ya generados para un SHA-256 (None si no existen o se podaron)."""
+    with _lock_de(sha):
+        return _usar(sha)
+
+
+def _usar(sha: str) -> dict[str, Path] | None:
+    carpeta = ruta_datos("derivados") / sha
+    rutas = {v: carpeta / f"{v}.webp" for v in VARIANTES}
+    if not all(r.exists() for r in rutas.values()):
+        return None
+    ahora = time.time()
+    os.utime(carpeta, (ahora, ahora))  # marca de uso para el LRU
+    return rutas
@@ -0,0 +1,110 @@
+"""
+Motor de priorización de brechas del diagnóstico CCPS.
+
+Reemplaza el "ordenar todo + iterrows + if por fila" de
+`prioridades_desde_diag`:
+- la prioridad de cada ítem es una suma ponderada (score, peso del pilar,
+  antigüedad de la brecha, estado del plan) calculada en una sola pasada
+  vectorizada sobre todas las filas;
+- solo se seleccionan las top_n con la selección parcial de skudo_ranking
+  (O(n)), en vez de ordenar la tabla completa; el empate se resuelve por
+  posición, igual que un orden estable;
+- Nivel / Impacto / Plazo salen de un único corte del score
+  (`np.searchsorted` sobre CORTES_SCORE) y se devuelven como categóricas
+  ordenadas.
+
+Con los pesos por defecto (solo score) el resultado es el mismo que ordenar
+por score ascendente y tomar las primeras top_n.
+"""
+import numpy as np
+import pandas as pd
+
+from skudo_madurez import con_score
+from skudo_ranking import top_k
+
+# score <= 40 → Crítico; <= 60 → Importante; resto → Mejorable
+CORTES_SCORE = np.array([40, 60])
+NIVELES = ["Crítico", "Importante", "Mejorable"]
+IMPACTOS = ["Muy alto", "Alto", "Medio"]
+PLAZOS = ["0–3 meses", "3–6 meses", "6–12 meses"]
+
+NIVEL_DTYPE = pd.CategoricalDtype(NIVELES, ordered=True)
+IMPACTO_DTYPE = pd.CategoricalDtype(IMPACTOS, ordered=True)
+PLAZO_DTYPE = pd.CategoricalDtype(PLAZOS, ordered=True)
+
+# Pesos de cada término de la fórmula (todos los términos van de 0 a 1)
+PESOS_DEFECTO = {"score": 1.0, "pilar": 0.0, "antiguedad": 0.0, "estado_plan": 0.0}
+# Urgencia según el estado del plan de acción
+URGENCIA_ESTADO_PLAN = {"Sin plan": 1.0, "En diseño": 0.6, "En ejecución": 0.3, "Cerrado": 0.0}
+# Antigüedad a partir de la cual la brecha cuenta como "máxima"
+ANTIGUEDAD_TOPE_DIAS = 365
+
+COLUMNAS = ["Tema", "Nivel", "Pilar", "Instalación", "Impacto", "Plazo sugerido"]
+
+
+def _mapear(serie: pd.Series, valores: dict, defecto: float) -> np.ndarray:
+    return serie.map(valores).astype(float).fillna(defecto).to_numpy()
+
+
+def puntaje_prioridad(
+    df_diag: pd.DataFrame,
+    pesos: dict | None = None,
+    pesos_pilar: dict | None = None,
+    col_fecha: str = "fecha_diagnostico",
+    hoy: pd.Timestamp | None = None,
+) -> np.ndarray:
+    """
+    Prioridad (mayor = más urgente) de cada fila, en una pasada:
+        w_score·(100 − score)/100 + w_pilar·peso_pilar
+        + w_antiguedad·min(días/ANTIGUEDAD_TOPE_DIAS, 1) + w_estado·urgencia(estado_plan)
+    Los términos con peso 0 (o sin columna) no se calculan.
+    """
+    pesos = {**PESOS_DEFECTO, **(pesos or {})}
+    df = con_score(df_diag)
+    prio = pesos["score"] * (100.0 - df["score"].to_numpy(dtype=float)) / 100.0
+
+    if pesos["pilar"] and "pilar" in df.columns:
+        prio += pesos["pilar"] * _mapear(df["pilar"], pesos_pilar or {}, 1.0)
+    if pesos["antiguedad"] and col_fecha in df.columns:
+        hoy = hoy if hoy is not None else pd.Timestamp.now().normalize()
+        dias = (hoy - pd.to_datetime(df[col_fecha], errors="coerce")).dt.days.to_numpy(dtype=float)
+        prio += pesos["antiguedad"] * np.clip(np.nan_to_num(dias) / ANTIGUEDAD_TOPE_DIAS, 0.0, 1.0)
+    if pesos["estado_plan"] and "estado_plan" in df.columns:
+        prio += pesos["estado_plan"] * _mapear(df["estado_plan"].astype(object), URGENCIA_ESTADO_PLAN, 1.0)
+    return np.nan_to_num(prio, nan=-np.inf)
+
+
+def priorizar(
+    df_diag: pd.DataFrame,
+    top_n: int = 5,
+    pesos: dict | None = None,
+    pesos_pilar: dict | None = None,
+    col_tema: str = "Tema",
+    col_fecha: str = "fecha_diagnostico",
+    con_prioridad: bool = False,
+) -> pd.DataFrame:
+    """
+    Top-n brechas con Nivel / Impacto / Plazo sugerido (categóricas).
+    `col_tema` es el nombre de la columna del tema en la salida.
+    """
+    columnas = [col_tema] + COLUMNAS[1:] + (["Prioridad"] if con_prioridad else [])
+    if df_diag.empty:
+        return pd.DataFrame(columns=columnas)
+
+    df = con_score(df_diag)
+    prio = puntaje_prioridad(df, pesos, pesos_pilar, col_fecha)
+    pos = top_k(prio, top_n, descendente=True)
+
+    score = df["score"].to_numpy()[pos]
+    codigo = np.searchsorted(CORTES_SCORE, score, side="left")
+    out = pd.DataFrame({
+        col_tema: df["descripcion"].to_numpy()[pos],
+        "Nivel": pd.Categorical.from_codes(codigo, dtype=NIVEL_DTYPE),
+        "Pilar": df["pilar"].to_numpy()[pos],
+        "Instalación": df["instalacion"].to_numpy()[pos],
+        "Impacto": pd.Categorical.from_codes(codigo, dtype=IMPACTO_DTYPE),
+        "Plazo sugerido": pd.Categorical.from_codes(codigo, dtype=PLAZO_DTYPE),
+    })
+    if con_prioridad:
+        out["Prioridad"] = prio[pos].round(3)
+    return out
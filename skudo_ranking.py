@@ -0,0 +1,92 @@
+"""
+Selección parcial top-k compartida por los rankings de SKUDO (brechas,
+escenarios, búsqueda de causas, elemento más débil...).
+
+`df.sort_values(...).head(k)` ordena toda la tabla (O(n log n)) para quedarse
+con unas pocas filas. Aquí:
+- `top_k` elige las k mejores posiciones con `np.argpartition` sobre la
+  primera clave (O(n)); solo los empatados en el umbral se desempatan con las
+  claves siguientes, y al final ordena únicamente las k elegidas;
+- el desempate es estable: claves en orden y, al final, la posición original
+  (mismo resultado que un `sort_values(kind="stable").head(k)`); los NaN van
+  al final, en cualquier sentido;
+- `top_k_por_lotes` mantiene el top-k sobre datos que llegan por bloques
+  (p. ej. un histórico leído por partes) sin juntar todo en memoria.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _como_lista(valor, n: int) -> list:
+    return list(valor) if isinstance(valor, (list, tuple)) else [valor] * n
+
+
+def _normalizar(clave, descendente: bool) -> np.ndarray:
+    """Clave numérica donde "menor = mejor" y NaN = +inf."""
+    serie = pd.Series(clave) if not isinstance(clave, pd.Series) else clave
+    if pd.api.types.is_bool_dtype(serie.dtype) or pd.api.types.is_numeric_dtype(serie.dtype):
+        valores = serie.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        # texto / categorías: se ordenan por su código (factorize ordenado)
+        codigos, _ = pd.factorize(serie, sort=True)
+        valores = np.where(codigos < 0, np.nan, codigos).astype(np.float64)
+    if descendente:
+        valores = -valores
+    return np.where(np.isnan(valores), np.inf, valores)
+
+
+def _orden(claves: list[np.ndarray], pos: np.ndarray) -> np.ndarray:
+    """Ordena `pos` por las claves (la primera manda) y luego por posición."""
+    return pos[np.lexsort([pos] + [c[pos] for c in reversed(claves)])]
+
+
+def top_k(claves, k: int, descendente=False) -> np.ndarray:
+    """
+    Posiciones (0..n-1) de las k primeras filas según `claves` (un array /
+    Serie o una lista de ellos; la primera manda), ya ordenadas.
+    `descendente` puede ser un bool o uno por clave.
+    """
+    claves = claves if isinstance(claves, (list, tuple)) else [claves]
+    norm = [_normalizar(c, d) for c, d in zip(claves, _como_lista(descendente, len(claves)))]
+    n = len(norm[0]) if norm else 0
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return _orden(norm, np.arange(n))
+
+    primera = norm[0]
+    umbral = np.partition(primera, k - 1)[k - 1]
+    mejores = np.flatnonzero(primera < umbral)
+    empatados = np.flatnonzero(primera == umbral)
+    faltan = k - len(mejores)
+    if len(empatados) > faltan:
+        # solo el grupo empatado en el umbral se desempata con el resto de claves
+        empatados = _orden(norm[1:], empatados)[:faltan]
+    return _orden(norm, np.concatenate([mejores, empatados]))
+
+
+def top_k_df(df: pd.DataFrame, k: int, por, descendente=False) -> pd.DataFrame:
+    """Equivalente a `df.sort_values(por, ascending=not descendente, kind="stable").head(k)`."""
+    por = por if isinstance(por, (list, tuple)) else [por]
+    return df.iloc[top_k([df[c] for c in por], k, descendente)]
+
+
+def primero(df: pd.DataFrame, por, descendente=False) -> pd.Series:
+    """Mejor fila según `por` (IndexError si `df` está vacío)."""
+    return top_k_df(df, 1, por, descendente).iloc[0]
+
+
+def top_k_por_lotes(lotes, k: int, por, descendente=False) -> pd.DataFrame:
+    """
+    Top-k sobre un iterable de DataFrames (mismas columnas), guardando en
+    memoria solo las k mejores filas vistas más el lote actual. El empate
+    final respeta el orden de llegada.
+    """
+    mejores = None
+    for lote in lotes:
+        if lote.empty:
+            continue
+        # las filas ya elegidas llegaron antes que el lote: van primero
+        candidatos = lote if mejores is None else pd.concat([mejores, lote])
+        mejores = top_k_df(candidatos, k, por, descendente)
+    return mejores if mejores is not None else pd.DataFrame()
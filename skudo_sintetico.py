@@ -0,0 +1,260 @@
+"""
+Generador sintético de datos SKUDO a escala de producción.
+
+Produce diagnóstico CCPS, estudios, escenarios de riesgo (histórico PHA) y
+nodos con las mismas columnas que los datos DEMO de app5/app6, pero desde
+10³ hasta 10⁷ filas, con texto realista (plantillas con equipos, causas y
+consecuencias típicas) y distribuciones sesgadas: unas pocas plantas
+concentran la mayoría de ítems, las calificaciones siguen la proporción del
+diagnóstico DEMO y severidad/frecuencia se cargan hacia valores medios.
+
+Todo se genera vectorizado con NumPy a partir de una semilla, así que el
+mismo (escala, semilla) produce siempre los mismos datos.
+
+    tablas = generar(n_diag=1_000_000, semilla=7)
+    tablas["diag"], tablas["riesgos"], tablas["nodos"], tablas["estudios"]
+"""
+import numpy as np
+import pandas as pd
+
+# Tamaños de referencia (número de ítems de diagnóstico)
+ESCALAS = {
+    "xs": 1_000,
+    "s": 10_000,
+    "m": 100_000,
+    "l": 1_000_000,
+    "xl": 10_000_000,
+}
+
+ELEMENTOS = [
+    "Cultura de Seguridad de Procesos",
+    "Gestión de riesgos de proceso",
+    "Gestión de contratistas",
+    "Gestión del cambio",
+    "Integridad mecánica",
+    "Preparación y respuesta a emergencias",
+    "Competencias y entrenamiento",
+    "Procedimientos operativos",
+    "Investigación de incidentes",
+    "Auditorías",
+]
+PILARES = ["Compromiso", "Comprender el riesgo", "Gestionar el riesgo", "Aprender"]
+CALIFICACIONES = ["Muy bajo", "Bajo", "Medio", "Alto", "Muy alto"]
+P_CALIFICACIONES = [0.1, 0.2, 0.3, 0.25, 0.15]
+ESTADOS_PLAN = ["Sin plan", "En diseño", "En ejecución", "Cerrado"]
+
+PREFIJOS_EQUIPO = ["R", "TK", "P", "E", "V", "C", "PSV", "FV"]
+UNIDADES = [
+    "Reactor", "Área de tanques", "Tanques esféricos", "Área de carga", "Compresión",
+    "Destilación", "Servicios industriales", "Tratamiento de efluentes",
+]
+DESVIACIONES = [
+    "Sobrepresión", "Alta temperatura", "Bajo caudal", "Flujo inverso", "Pérdida de contención",
+    "Alto nivel", "Reacción fuera de control", "Vacío",
+]
+CAUSAS = [
+    "cierre inadvertido de válvula de salida",
+    "fallo del control de caudal",
+    "corrosión en bridas críticas",
+    "bloqueo aguas abajo",
+    "falla del transmisor de presión",
+    "sobredosis de reactivo",
+    "error operativo en arranque",
+    "mantenimiento deficiente de sellos",
+    "pérdida de enfriamiento",
+    "falla de energía eléctrica",
+]
+CONSECUENCIAS = [
+    "disparo del PSV y descarga a antorcha",
+    "fuga de solvente inflamable con posible incendio",
+    "liberación tóxica al área de proceso",
+    "ruptura del recipiente y proyección de fragmentos",
+    "derrame al dique de contención",
+    "parada no programada de la unidad",
+]
+SALVAGUARDAS = [
+    "PSV y alarma de alta presión",
+    "detección de gas y parada de emergencia",
+    "SIS con disparo por alta temperatura",
+    "inspección basada en riesgo y dique de contención",
+    "procedimiento operativo y entrenamiento",
+]
+TIPOS_PELIGRO = [
+    "Presión / Integridad mecánica", "Incendio / Explosión", "Tóxico", "Ambiental", "Reactividad",
+]
+TIPOS_ESTUDIO = ["HAZOP", "LOPA", "What-if", "QRA", "Checklist"]
+P_TIPOS_ESTUDIO = [0.45, 0.2, 0.15, 0.1, 0.1]
+CLASES_ACCION = [
+    "Procedimientos / Entrenamiento", "Mantenimiento / Inspección", "Diseño / Ingeniería",
+    "Instrumentación / SIS", "Gestión del cambio",
+]
+TIPOS_NODO = ["Escenario de riesgo", "Acción / Plan", "Requisito normativo"]
+
+
+def _pesos_zipf(n: int, s: float = 0.8) -> np.ndarray:
+    """Pocas instalaciones grandes y muchas pequeñas."""
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def _elegir(rng, opciones, n: int, p=None) -> np.ndarray:
+    return np.asarray(opciones, dtype=object)[rng.choice(len(opciones), size=n, p=p)]
+
+
+def _unir(*partes) -> np.ndarray:
+    """Concatena arreglos y textos fijos elemento a elemento."""
+    n = max(len(p) for p in partes if not isinstance(p, str))
+    out = pd.Series(np.full(n, "", dtype=object))
+    for p in partes:
+        out = out + (p if isinstance(p, str) else pd.Series(np.asarray(p, dtype=object)))
+    return out.to_numpy()
+
+
+def _ids(prefijo: str, n: int, ancho: int = 7) -> np.ndarray:
+    return _unir(prefijo, pd.Series(np.arange(1, n + 1)).astype(str).str.zfill(ancho).to_numpy())
+
+
+def generar_instalaciones(n: int, rng) -> pd.DataFrame:
+    riesgo = _elegir(rng, ["ALTO", "MEDIO", "BAJO"], n, p=[0.35, 0.45, 0.2])
+    return pd.DataFrame({
+        "sitio": [f"Planta {i:03d}" for i in range(1, n + 1)],
+        "lat": rng.uniform(-4.0, 12.0, n).round(4),
+        "lon": rng.uniform(-79.0, -67.0, n).round(4),
+        "riesgo_global": riesgo,
+        "madurez_ccps": rng.integers(40, 90, n),
+    })
+
+
+def generar_diagnostico(n: int, sitios: np.ndarray, rng) -> pd.DataFrame:
+    idx = np.arange(1, n + 1).astype(str)
+    return pd.DataFrame({
+        "id": _ids("D-", n),
+        "pilar": _elegir(rng, PILARES, n),
+        "elemento": _elegir(rng, ELEMENTOS, n),
+        "instalacion": sitios[rng.choice(len(sitios), size=n, p=_pesos_zipf(len(sitios)))],
+        "descripcion": _unir("Ítem de evaluación CCPS #", idx),
+        "calificacion": _elegir(rng, CALIFICACIONES, n, p=P_CALIFICACIONES),
+        "evidencia": "Documento / Registros / Entrevistas",
+        "estado_plan": _elegir(rng, ESTADOS_PLAN, n, p=[0.3, 0.25, 0.25, 0.2]),
+    })
+
+
+def _equipos(rng, n: int) -> np.ndarray:
+    num = rng.integers(100, 999, n).astype(str)
+    return _unir(_elegir(rng, PREFIJOS_EQUIPO, n), "-", num)
+
+
+def generar_estudios(n: int, sitios: np.ndarray, rng) -> pd.DataFrame:
+    estado = np.where(rng.random(n) < 0.75, "Vigente", "Obsoleto")
+    return pd.DataFrame({
+        "id_estudio": _ids("E-", n),
+        "tipo": _elegir(rng, TIPOS_ESTUDIO, n, p=P_TIPOS_ESTUDIO),
+        "anio": rng.integers(2010, 2026, n),
+        "instalacion": sitios[rng.choice(len(sitios), size=n, p=_pesos_zipf(len(sitios)))],
+        "unidad": _elegir(rng, UNIDADES, n),
+        "equipo": _equipos(rng, n),
+        "cobertura": _elegir(rng, ["Alta", "Media", "Baja"], n, p=[0.4, 0.4, 0.2]),
+        "estado": estado,
+        "accion_sugerida": _elegir(rng, [
+            "Revalidar enfocado en escenarios de sobrepresión.",
+            "Revisar supuestos de frecuencias y fallas de PSV.",
+            "No repetir completo, documentar decisiones previas.",
+            "Usar como base para ordenamiento territorial y PEC.",
+        ], n),
+        "comentario": "",
+    })
+
+
+def generar_riesgos(n: int, df_estudios: pd.DataFrame, rng) -> pd.DataFrame:
+    """Escenarios del histórico PHA; cada uno hereda instalación/unidad/equipo de su estudio."""
+    est = df_estudios.iloc[rng.integers(0, len(df_estudios), n)].reset_index(drop=True)
+    # severidad y frecuencia 1..5 cargadas hacia el centro
+    sev = np.clip(np.rint(rng.normal(3.2, 1.0, n)), 1, 5).astype(int)
+    fre = np.clip(np.rint(rng.normal(2.6, 1.0, n)), 1, 5).astype(int)
+    riesgo = sev * fre
+    nivel = np.select([riesgo >= 15, riesgo >= 8], ["Muy alto", "Alto"], default="Medio")
+    desv = _elegir(rng, DESVIACIONES, n)
+    causa = _elegir(rng, CAUSAS, n)
+    tipo_accion = np.where(rng.random(n) < 0.6, "General", "Trabajo en equipo")
+    return pd.DataFrame({
+        "id_estudio": est["id_estudio"].to_numpy(),
+        "id_escenario": _ids("RP-", n),
+        "instalacion": est["instalacion"].to_numpy(),
+        "unidad": est["unidad"].to_numpy(),
+        "equipo": est["equipo"].to_numpy(),
+        "descripcion_escenario": _unir(desv, " en ", est["equipo"].to_numpy(), " por ", causa, "."),
+        "tipo_peligro": _elegir(rng, TIPOS_PELIGRO, n),
+        "fase_operativa": _elegir(rng, ["Operación normal", "Arranque", "Parada", "Mantenimiento"], n),
+        "causa_principal": _unir(pd.Series(causa).str.capitalize().to_numpy(), "."),
+        "consecuencia_principal": _unir(pd.Series(_elegir(rng, CONSECUENCIAS, n)).str.capitalize().to_numpy(), "."),
+        "salvaguardas_clave": _unir(pd.Series(_elegir(rng, SALVAGUARDAS, n)).str.capitalize().to_numpy(), "."),
+        "severidad": sev,
+        "frecuencia": fre,
+        "riesgo_residual": riesgo,
+        "nivel_riesgo": nivel,
+        "accion_sugerida": _elegir(rng, [
+            "Reforzar entrenamiento en arranque/parada y actualizar procedimiento operativo.",
+            "Incluir bridas críticas en programa de inspección basada en riesgo.",
+            "Evaluar instalación de SIS adicional por alta presión.",
+            "Revisar dimensionamiento del PSV con el caso de bloqueo.",
+            "Instalar detección de gas y parada remota de bombas.",
+        ], n),
+        "tipo_accion": tipo_accion,
+        "clase_accion": _elegir(rng, CLASES_ACCION, n),
+        "estado_accion": _elegir(rng, ["Pendiente", "En curso", "Cerrada"], n, p=[0.5, 0.3, 0.2]),
+    })
+
+
+def generar_nodos(n: int, df_estudios: pd.DataFrame, n_diag: int, rng) -> pd.DataFrame:
+    est = df_estudios.iloc[rng.integers(0, len(df_estudios), n)].reset_index(drop=True)
+    ids = _ids("N-", n)
+    # 1 a 4 referencias por nodo: ítems de diagnóstico, acciones, requisitos y otros nodos
+    ref_d = _unir("D-", pd.Series(rng.integers(1, max(n_diag, 1) + 1, n)).astype(str).str.zfill(7).to_numpy())
+    ref_a = _unir("A-", pd.Series(rng.integers(1, max(n // 2, 1) + 1, n)).astype(str).str.zfill(7).to_numpy())
+    ref_r = _unir("Req-3687-", rng.integers(1, 40, n).astype(str))
+    ref_n = ids[rng.integers(0, n, n)]
+    k = rng.integers(1, 5, n)
+    rel = pd.Series(ref_d)
+    for extra, minimo in ((ref_a, 2), (ref_r, 3), (ref_n, 4)):
+        rel = rel.where(k < minimo, rel + " | " + pd.Series(extra))
+    return pd.DataFrame({
+        "id": ids,
+        "tipo": _elegir(rng, TIPOS_NODO, n, p=[0.6, 0.3, 0.1]),
+        "instalacion": est["instalacion"].to_numpy(),
+        "unidad": est["unidad"].to_numpy(),
+        "equipo": est["equipo"].to_numpy(),
+        "descripcion": _unir(_elegir(rng, DESVIACIONES, n), " en ", est["equipo"].to_numpy(), ": ",
+                             _elegir(rng, CONSECUENCIAS, n), "."),
+        "riesgo": _elegir(rng, ["ALTO", "MEDIO", "BAJO"], n, p=[0.3, 0.5, 0.2]),
+        "pilar": _elegir(rng, PILARES, n),
+        "relacionados": rel.to_numpy(),
+    })
+
+
+def generar(
+    n_diag: int = 10_000,
+    n_escenarios: int | None = None,
+    n_nodos: int | None = None,
+    n_estudios: int | None = None,
+    n_instalaciones: int = 25,
+    semilla: int = 0,
+) -> dict[str, pd.DataFrame]:
+    """
+    Genera todas las tablas. Por defecto escala escenarios, nodos y estudios a
+    partir de `n_diag` (n_diag/2, n_diag/10 y n_diag/50, con mínimos).
+    """
+    rng = np.random.default_rng(semilla)
+    n_escenarios = n_escenarios if n_escenarios is not None else max(n_diag // 2, 10)
+    n_nodos = n_nodos if n_nodos is not None else max(n_diag // 10, 10)
+    n_estudios = n_estudios if n_estudios is not None else max(n_diag // 50, 5)
+
+    df_sites = generar_instalaciones(n_instalaciones, rng)
+    sitios = df_sites["sitio"].to_numpy(dtype=object)
+    df_estudios = generar_estudios(n_estudios, sitios, rng)
+    return {
+        "sites": df_sites,
+        "diag": generar_diagnostico(n_diag, sitios, rng),
+        "estudios": df_estudios,
+        "riesgos": generar_riesgos(n_escenarios, df_estudios, rng),
+        "nodos": generar_nodos(n_nodos, df_estudios, n_diag, rng),
+    }
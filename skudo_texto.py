@@ -0,0 +1,262 @@
+"""
+Normalización de texto en español para todas las búsquedas de SKUDO.
+
+Un único pipeline: minúsculas -> tokens -> stopwords -> plegado de acentos ->
+raíz (stemmer estilo Snowball para español, sobre el texto ya sin acentos).
+Así "operación" y "operacion" dan la misma raíz. La idea es normalizar una sola
+vez al ingerir los datos (ver `anotar_tokens`) y en cada consulta normalizar
+solo el texto que escribe el usuario.
+
+    tokens_texto("Sobrepresiones por bloqueo de válvulas en R-101")
+    -> ('sobrepresion', 'bloque', 'valvul', 'r-101')
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+import pandas as pd
+
+# Palabras o tags de equipo (R-101, TK-201-ESF); los guiones internos se conservan
+_RE_TOKEN = re.compile(r"[0-9a-záéíóúüñ]+(?:-[0-9a-záéíóúüñ]+)*")
+_RE_NO_ALNUM = re.compile(r"[^0-9a-z\-]+")
+
+_VOCALES = frozenset("aeiou")
+
+STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde
+donde durante e el ella ellas ellos en entre era es esa esas ese eso esos esta
+estan estas este esto estos fue fueron ha han hasta hay la las le les lo los
+mas me mi muy nada ni no nos o otra otras otro otros para pero poco por porque
+que quien se sea ser si sin sobre son su sus tambien te tiene tienen todo todos
+tu un una unas uno unos y ya cuanto cerca mucho mismo misma
+""".split())
+
+TOKEN_MIN = 3
+
+
+def plegar_acentos(texto: str) -> str:
+    """'Presión' -> 'Presion'. Elimina marcas diacríticas (incluida la de la ñ)."""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def normalizar(texto) -> str:
+    """Minúsculas, sin acentos y sin puntuación (se conservan los guiones de tags)."""
+    plano = plegar_acentos(str(texto or "").lower())
+    return " ".join(_RE_NO_ALNUM.sub(" ", plano).split())
+
+
+# =========================================================
+# STEMMER ESPAÑOL (algoritmo Snowball, sobre texto sin acentos)
+# =========================================================
+def _plegados(sufijos) -> list[str]:
+    # sufijos sin acento, sin duplicados y del más largo al más corto
+    return sorted({plegar_acentos(s) for s in sufijos}, key=len, reverse=True)
+
+
+_PRONOMBRES = ("selas", "selos", "sela", "selo", "las", "les", "los", "nos", "me", "se", "la", "le", "lo")
+_ANTES_PRONOMBRE = ("iendo", "ando", "ar", "er", "ir")
+
+_PASO1 = _plegados([
+    "anza", "anzas", "ico", "ica", "icos", "icas", "ismo", "ismos", "able", "ables",
+    "ible", "ibles", "ista", "istas", "oso", "osa", "osos", "osas", "amiento",
+    "amientos", "imiento", "imientos",
+    "adora", "ador", "ación", "adoras", "adores", "aciones", "ante", "antes",
+    "ancia", "ancias",
+    "logía", "logías", "ución", "uciones", "encia", "encias",
+    "amente", "mente", "idad", "idades", "iva", "ivo", "ivas", "ivos",
+])
+
+_PASO2A = _plegados(["ya", "ye", "yan", "yen", "yeron", "yendo", "yo", "yó", "yas", "yes", "yais", "yamos"])
+
+_PASO2B = _plegados("""
+en es éis emos arían arías arán arás aríais aría aréis aríamos aremos ará aré
+erían erías erán erás eríais ería eréis eríamos eremos erá eré irían irías irán
+irás iríais iría iréis iríamos iremos irá iré aba ada ida ía ara iera ad ed id
+ase iese aste iste an aban ían aran ieran asen iesen aron ieron ado ido ando
+iendo ió ar er ir as abas adas idas ías aras ieras ases ieses ís áis abais íais
+arais ierais aseis ieseis asteis isteis ados idos amos ábamos íamos imos áramos
+iéramos iésemos ásemos
+""".split())
+
+_PASO3 = _plegados(["os", "a", "o", "á", "í", "ó", "e", "é"])
+
+
+def _sufijo(palabra: str, sufijos) -> str:
+    for s in sufijos:
+        if palabra.endswith(s):
+            return s
+    return ""
+
+
+def _region_tras(palabra: str, inicio: int) -> int:
+    # posición tras la primera consonante que sigue a una vocal, desde `inicio`
+    for i in range(inicio + 1, len(palabra)):
+        if palabra[i] not in _VOCALES and palabra[i - 1] in _VOCALES:
+            return i + 1
+    return len(palabra)
+
+
+def _regiones(p: str) -> tuple[int, int, int]:
+    n = len(p)
+    r1 = _region_tras(p, 0)
+    r2 = _region_tras(p, r1)
+    if n < 2:
+        rv = n
+    elif p[1] not in _VOCALES:
+        rv = next((i + 1 for i in range(2, n) if p[i] in _VOCALES), n)
+    elif p[0] in _VOCALES:
+        rv = next((i + 1 for i in range(2, n) if p[i] not in _VOCALES), n)
+    else:
+        rv = min(3, n)
+    return rv, r1, r2
+
+
+@lru_cache(maxsize=200_000)
+def raiz(palabra: str) -> str:
+    """Raíz de una palabra en minúsculas (algoritmo Snowball para español, sin acentos)."""
+    p = plegar_acentos(palabra)
+    rv, r1, r2 = _regiones(p)
+
+    # Paso 0: pronombre enclítico (dándole -> dar, haciéndolo -> haciendo)
+    pron = _sufijo(p, _PRONOMBRES)
+    if pron:
+        base = p[:-len(pron)]
+        for forma in _ANTES_PRONOMBRE:
+            if base.endswith(forma) and len(base) - len(forma) >= rv:
+                p = base
+                break
+        else:
+            if base.endswith("yendo") and base[:-5].endswith("u") and len(base) - 5 >= rv:
+                p = base
+
+    # Paso 1: sufijos estándar
+    largo_antes = len(p)
+    s = _sufijo(p, _PASO1)
+    if s:
+        i = len(p) - len(s)
+        if s in ("logia", "logias"):
+            if i >= r2:
+                p = p[:i] + "log"
+        elif s in ("ucion", "uciones"):
+            if i >= r2:
+                p = p[:i] + "u"
+        elif s in ("encia", "encias"):
+            if i >= r2:
+                p = p[:i] + "ente"
+        elif s == "amente":
+            if i >= r1:
+                p = p[:i]
+                if p.endswith("iv") and len(p) - 2 >= r2:
+                    p = p[:-2]
+                    if p.endswith("at") and len(p) - 2 >= r2:
+                        p = p[:-2]
+                elif _sufijo(p, ("os", "ic", "ad")) and len(p) - 2 >= r2:
+                    p = p[:-2]
+        elif s == "mente":
+            if i >= r2:
+                p = p[:i]
+                ant = _sufijo(p, ("ante", "able", "ible"))
+                if ant and len(p) - len(ant) >= r2:
+                    p = p[:-len(ant)]
+        elif s in ("idad", "idades"):
+            if i >= r2:
+                p = p[:i]
+                ant = _sufijo(p, ("abil", "ic", "iv"))
+                if ant and len(p) - len(ant) >= r2:
+                    p = p[:-len(ant)]
+        elif s in ("iva", "ivo", "ivas", "ivos"):
+            if i >= r2:
+                p = p[:i]
+                if p.endswith("at") and len(p) - 2 >= r2:
+                    p = p[:-2]
+        elif s in ("adora", "ador", "acion", "adoras", "adores", "aciones", "ante", "antes", "ancia", "ancias"):
+            if i >= r2:
+                p = p[:i]
+                if p.endswith("ic") and len(p) - 2 >= r2:
+                    p = p[:-2]
+        elif i >= r2:
+            p = p[:i]
+
+    # Pasos 2a / 2b: sufijos verbales (solo si el paso 1 no quitó nada)
+    if len(p) == largo_antes:
+        s = _sufijo(p, _PASO2A)
+        hecho = False
+        if s:
+            i = len(p) - len(s)
+            if i >= rv and p[:i].endswith("u"):
+                p = p[:i]
+                hecho = True
+        if not hecho:
+            s = _sufijo(p, _PASO2B)
+            if s:
+                i = len(p) - len(s)
+                if i >= rv:
+                    p = p[:i]
+                    if s in ("en", "es", "eis", "emos") and p.endswith("gu"):
+                        p = p[:-1]
+
+    # Paso 3: sufijo residual
+    s = _sufijo(p, _PASO3)
+    if s:
+        i = len(p) - len(s)
+        if i >= rv:
+            p = p[:i]
+            if s == "e" and p.endswith("gu") and len(p) - 1 >= rv:
+                p = p[:-1]
+
+    return p
+
+
+# =========================================================
+# PIPELINE
+# =========================================================
+@lru_cache(maxsize=200_000)
+def _normalizar_token(tok: str) -> str:
+    # tags con dígitos o guiones (R-101, PSV-14) no se lematizan
+    if any(c.isdigit() for c in tok) or "-" in tok:
+        return plegar_acentos(tok)
+    plano = plegar_acentos(tok)
+    if plano in STOPWORDS or len(tok) < TOKEN_MIN:
+        return ""
+    return raiz(plano)
+
+
+def tokens_texto(texto) -> tuple[str, ...]:
+    """Tokens normalizados (sin stopwords, con raíz y sin acentos) de un texto."""
+    salida = []
+    for tok in _RE_TOKEN.findall(str(texto or "").lower()):
+        norm = _normalizar_token(tok)
+        if norm:
+            salida.append(norm)
+    return tuple(salida)
+
+
+def coincide_tokens(serie: pd.Series, consulta) -> pd.Series:
+    """
+    True donde todos los tokens de `consulta` aparecen en el valor de la fila
+    (misma normalización que el resto de búsquedas). Consulta vacía -> todo True.
+    """
+    buscados = set(tokens_texto(consulta))
+    if not buscados:
+        return pd.Series(True, index=serie.index)
+    valores = serie.fillna("").astype(str)
+    # cada valor distinto se normaliza una sola vez
+    ok = {v: buscados <= set(tokens_texto(v)) for v in valores.unique()}
+    return valores.map(ok).astype(bool)
+
+
+def anotar_tokens(df: pd.DataFrame, campos: list[str], destino: str = "tokens") -> pd.DataFrame:
+    """
+    Devuelve una copia de `df` con la columna `destino`: tupla de tokens
+    normalizados de los `campos` concatenados. Se hace una vez al ingerir.
+    """
+    out = df.copy()
+    if out.empty:
+        out[destino] = pd.Series(dtype=object)
+        return out
+    texto = out[campos[0]].fillna("").astype(str)
+    for c in campos[1:]:
+        texto = texto + " " + out[c].fillna("").astype(str)
+    out[destino] = [tokens_texto(t) for t in texto.tolist()]
+    return out
@@ -0,0 +1,323 @@
+"""
+Trazas de rendimiento por rerun.
+
+Cada ejecución del script es una "corrida" (iniciar_corrida / cerrar_corrida).
+Dentro de ella, las funciones decoradas con @trazar y los bloques
+`with span("...")` registran un span con tiempo de pared, tiempo de CPU,
+filas procesadas y, si tracemalloc está activo, memoria asignada. Los spans se
+anidan, así que el panel de administración puede dibujar un desglose tipo
+flame chart.
+
+Al cerrar la corrida los spans se agregan a datos/trazas/spans-AAAAMMDD.jsonl
+(una línea por span) para calcular p50/p95 de latencia en producción. El
+panel no vuelve a leer esos archivos en cada rerun: cada archivo se parsea
+una vez y se cachea por (mtime, tamaño); el del día, que solo crece, se lee
+desde donde quedó la lectura anterior.
+Desactivar la exportación con SKUDO_TRAZAS=0. El cuerpo del script va dentro
+de `cuerpo_corrida()`, así las corridas que terminan con st.rerun(), st.stop()
+o una excepción también se cierran y exportan (columna "fin").
+
+La medición de memoria (tracemalloc) la activa un administrador para sus
+propias corridas: tracemalloc se enciende al iniciar una corrida que la pide y
+se apaga cuando no queda ninguna en curso. tracemalloc es global al proceso,
+así que mientras tanto el resto de las sesiones también corre más lento.
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import altair as alt
+import pandas as pd
+import streamlit as st
+
+from skudo_datos import ruta_datos
+
+EXPORTAR = os.environ.get("SKUDO_TRAZAS", "1") != "0"
+HISTORIAL_SESION = 20
+
+_local = threading.local()
+_lock_archivo = threading.Lock()
+_lock_memoria = threading.Lock()
+_lock_lectura = threading.Lock()
+# {ruta: (mtime_ns, tamaño, bytes leídos, DataFrame)} de los spans ya parseados
+_spans_leidos: dict = {}
+_corridas_midiendo = 0
+
+
+# =========================================================
+# CORRIDAS Y SPANS
+# =========================================================
+def _medir_memoria(activar: bool):
+    # cuenta las corridas que miden memoria; tracemalloc solo corre mientras haya alguna
+    global _corridas_midiendo
+    with _lock_memoria:
+        _corridas_midiendo += 1 if activar else -1
+        if _corridas_midiendo > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif _corridas_midiendo <= 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def iniciar_corrida(app: str):
+    """Llamar al inicio del script (un rerun = una corrida)."""
+    if getattr(_local, "corrida", None) is not None:
+        # la anterior no llegó a cerrarse (terminó fuera de cuerpo_corrida)
+        cerrar_corrida(fin="sin_cerrar")
+    memoria = bool(st.session_state.get("trazas_mem")) and es_admin()
+    if memoria:
+        _medir_memoria(True)
+    _local.corrida = {
+        "id": uuid.uuid4().hex[:12],
+        "app": app,
+        "etiquetas": {},
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "t0": time.perf_counter(),
+        "spans": [],
+        "pila": [],
+        "memoria": memoria,
+    }
+
+
+def etiquetar_corrida(**etiquetas):
+    """Datos de contexto de la corrida (página, perfil, instalación...)."""
+    corrida = getattr(_local, "corrida", None)
+    if corrida is not None:
+        corrida["etiquetas"].update({k: str(v) for k, v in etiquetas.items()})
+
+
+def _filas(obj) -> int | None:
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if isinstance(obj, (tuple, list)):
+        for o in obj:
+            if isinstance(o, (pd.DataFrame, pd.Series)):
+                return len(o)
+    return None
+
+
+@contextmanager
+def span(nombre: str, filas: int | None = None):
+    """
+    Registra un bloque. Fuera de una corrida no hace nada. El dict devuelto
+    se puede completar (p. ej. reg["filas"] = len(df)).
+    """
+    corrida = getattr(_local, "corrida", None)
+    if corrida is None:
+        yield {}
+        return
+
+    pila = corrida["pila"]
+    reg = {
+        "nombre": nombre,
+        "padre": pila[-1] if pila else None,
+        "profundidad": len(pila),
+        "inicio_ms": (time.perf_counter() - corrida["t0"]) * 1000,
+        "filas": filas,
+    }
+    corrida["spans"].append(reg)
+    pila.append(len(corrida["spans"]) - 1)
+
+    mem0 = tracemalloc.get_traced_memory()[0] if corrida["memoria"] and tracemalloc.is_tracing() else None
+    w0 = time.perf_counter()
+    c0 = time.thread_time()
+    try:
+        yield reg
+    finally:
+        reg["wall_ms"] = round((time.perf_counter() - w0) * 1000, 3)
+        reg["cpu_ms"] = round((time.thread_time() - c0) * 1000, 3)
+        reg["inicio_ms"] = round(reg["inicio_ms"], 3)
+        if mem0 is not None:
+            reg["asignado_kb"] = round((tracemalloc.get_traced_memory()[0] - mem0) / 1024, 1)
+        pila.pop()
+
+
+def trazar(fn=None, *, nombre: str | None = None):
+    """
+    Decorador: @trazar o @trazar(nombre="..."). Las filas procesadas son las
+    del primer DataFrame de los argumentos o, si no hay, las del resultado.
+    """
+    def decorar(f):
+        etiqueta = nombre or f.__name__
+
+        @functools.wraps(f)
+        def envoltura(*args, **kwargs):
+            with span(etiqueta) as reg:
+                resultado = f(*args, **kwargs)
+                if reg and reg.get("filas") is None:
+                    entrada = next((n for n in map(_filas, (*args, *kwargs.values())) if n is not None), None)
+                    reg["filas"] = entrada if entrada is not None else _filas(resultado)
+                return resultado
+        return envoltura
+
+    return decorar(fn) if fn is not None else decorar
+
+
+def cerrar_corrida(fin: str = "ok") -> dict | None:
+    """
+    Cierra la corrida, la exporta a JSONL y la devuelve (para el panel).
+    `fin` indica cómo terminó ("ok" o el nombre de la excepción).
+    """
+    corrida = getattr(_local, "corrida", None)
+    if corrida is None:
+        return None
+    _local.corrida = None
+    corrida["total_ms"] = round((time.perf_counter() - corrida["t0"]) * 1000, 3)
+    corrida["fin"] = fin
+    corrida.pop("pila", None)
+    if corrida["memoria"]:
+        _medir_memoria(False)
+    if EXPORTAR:
+        _exportar(corrida)
+    return corrida
+
+
+@contextmanager
+def cuerpo_corrida():
+    """
+    Envuelve el cuerpo del script. Si termina con st.rerun() / st.stop()
+    (excepciones de control de Streamlit) o con un error, la corrida se
+    cierra y exporta igual antes de propagar la excepción.
+    """
+    try:
+        yield
+    except BaseException as e:
+        cerrar_corrida(fin=type(e).__name__)
+        raise
+
+
+def _exportar(corrida: dict):
+    ruta = ruta_datos("trazas") / f"spans-{datetime.now():%Y%m%d}.jsonl"
+    base = {"corrida": corrida["id"], "app": corrida["app"], "ts": corrida["ts"], "fin": corrida["fin"],
+            **corrida["etiquetas"]}
+    lineas = [json.dumps({**base, "nombre": "<rerun>", "profundidad": -1, "wall_ms": corrida["total_ms"]},
+                         ensure_ascii=False)]
+    lineas += [json.dumps({**base, **s}, ensure_ascii=False) for s in corrida["spans"]]
+    with _lock_archivo, open(ruta, "a", encoding="utf-8") as fh:
+        fh.write("\n".join(lineas) + "\n")
+
+
+# =========================================================
+# ESTADÍSTICAS (p50 / p95)
+# =========================================================
+def _spans_archivo(ruta) -> pd.DataFrame:
+    """Spans de un archivo; solo parsea lo que cambió desde la lectura anterior."""
+    st_ = ruta.stat()
+    previo = _spans_leidos.get(ruta)
+    if previo is not None and previo[:2] == (st_.st_mtime_ns, st_.st_size):
+        return previo[3]
+    # el archivo solo se agrega: si creció, se lee desde donde quedó
+    leido, df = (previo[2], previo[3]) if previo is not None and st_.st_size >= previo[2] else (0, None)
+    with open(ruta, "rb") as fh:
+        fh.seek(leido)
+        datos = fh.read(st_.st_size - leido)
+    # una línea a medio escribir (sin "\n") queda para la próxima lectura
+    datos = datos[:datos.rfind(b"\n") + 1]
+    nuevo = pd.DataFrame([json.loads(linea) for linea in datos.splitlines() if linea.strip()])
+    if df is None or df.empty:
+        df = nuevo
+    elif len(nuevo):
+        df = pd.concat([df, nuevo], ignore_index=True)
+    _spans_leidos[ruta] = (st_.st_mtime_ns, st_.st_size, leido + len(datos), df)
+    return df
+
+
+def leer_spans(dias: int = 7) -> pd.DataFrame:
+    limite = f"{datetime.now() - timedelta(days=dias):%Y%m%d}"
+    rutas = [
+        ruta for ruta in sorted(ruta_datos("trazas").glob("spans-*.jsonl"))
+        if ruta.stem[len("spans-"):] >= limite
+    ]
+    with _lock_lectura:
+        for ruta in set(_spans_leidos) - set(rutas):
+            del _spans_leidos[ruta]
+        partes = [df for df in map(_spans_archivo, rutas) if not df.empty]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+def percentiles(df_spans: pd.DataFrame) -> pd.DataFrame:
+    """p50 / p95 de tiempo de pared por span ("<rerun>" = rerun completo)."""
+    if df_spans.empty:
+        return pd.DataFrame(columns=["nombre", "n", "p50_ms", "p95_ms"])
+    g = df_spans.groupby("nombre")["wall_ms"]
+    out = pd.DataFrame({
+        "n": g.size(),
+        "p50_ms": g.quantile(0.5).round(1),
+        "p95_ms": g.quantile(0.95).round(1),
+    }).reset_index()
+    return out.sort_values("p95_ms", ascending=False).reset_index(drop=True)
+
+
+# =========================================================
+# PANEL DE ADMINISTRACIÓN
+# =========================================================
+def es_admin() -> bool:
+    """SKUDO_ADMIN=1 habilita el panel; o ?admin=<token> si se define SKUDO_ADMIN_TOKEN."""
+    if os.environ.get("SKUDO_ADMIN") == "1":
+        return True
+    token = os.environ.get("SKUDO_ADMIN_TOKEN")
+    return bool(token) and st.query_params.get("admin") == token
+
+
+def panel_trazas(corrida: dict | None):
+    """Panel de rendimiento en la barra lateral (solo administradores)."""
+    if corrida is None or not es_admin():
+        return
+
+    historial = st.session_state.setdefault("trazas_historial", [])
+    historial.append({"pagina": corrida["etiquetas"].get("pagina", ""), "total_ms": corrida["total_ms"]})
+    del historial[:-HISTORIAL_SESION]
+
+    with st.sidebar.expander("⏱️ Rendimiento (admin)", expanded=False):
+        # rige desde el próximo rerun y solo para las corridas de esta sesión
+        st.toggle(
+            "Medir asignaciones (tracemalloc, global)", key="trazas_mem",
+            help="tracemalloc es global al proceso: mientras corre un rerun de esta sesión, "
+                 "todas las sesiones del servidor van más lentas.",
+        )
+
+        st.metric("Último rerun", f"{corrida['total_ms']:.0f} ms")
+        spans = pd.DataFrame(corrida["spans"])
+        if spans.empty:
+            st.caption("Sin spans registrados.")
+        else:
+            spans["fin_ms"] = spans["inicio_ms"] + spans["wall_ms"]
+            flame = (
+                alt.Chart(spans)
+                .mark_bar(height=14)
+                .encode(
+                    x=alt.X("inicio_ms:Q", title="ms desde el inicio del rerun"),
+                    x2="fin_ms:Q",
+                    y=alt.Y("profundidad:O", title=None, axis=None),
+                    color=alt.Color("nombre:N", legend=None),
+                    tooltip=["nombre", "wall_ms", "cpu_ms", "filas"]
+                    + (["asignado_kb"] if "asignado_kb" in spans.columns else []),
+                )
+                .properties(height=30 + 18 * int(spans["profundidad"].max() + 1))
+            )
+            st.altair_chart(flame, use_container_width=True)
+
+            tabla = spans.copy()
+            tabla["span"] = ["· " * p + n for p, n in zip(tabla["profundidad"], tabla["nombre"])]
+            cols = ["span", "wall_ms", "cpu_ms", "filas"] + (["asignado_kb"] if "asignado_kb" in tabla.columns else [])
+            st.dataframe(tabla[cols], use_container_width=True, hide_index=True)
+
+        st.markdown("**Reruns de esta sesión**")
+        st.line_chart(pd.DataFrame(historial)["total_ms"], height=120)
+
+        if EXPORTAR:
+            df_hist = leer_spans()
+            st.markdown("**p50 / p95 (últimos 7 días)**")
+            st.dataframe(percentiles(df_hist), use_container_width=True, hide_index=True)
+            if not df_hist.empty:
+                st.download_button(
+                    "Descargar spans (JSONL)",
+                    data=df_hist.to_json(orient="records", lines=True, force_ascii=False),
+                    file_name="skudo_spans.jsonl",
+                    mime="application/json",
+                )
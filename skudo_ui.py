@@ -0,0 +1,110 @@
+"""
+Utilidades de interfaz para las páginas de SKUDO.
+
+`st.tabs` ejecuta el contenido de todas las pestañas en cada rerun aunque solo
+se vea una. `selector_secciones` lo reemplaza por un selector horizontal: la
+página dibuja solo la sección elegida. `seccion_cacheada` guarda el resultado
+(tablas y gráficos) de cada sección por (sección, instalación, perfil, versión
+de datos), compartido entre sesiones, así que volver a una sección ya vista no
+recalcula nada.
+
+`fragmento` marca regiones de la página que se refrescan solas (reruns
+parciales): cambiar un widget dentro del fragmento no vuelve a ejecutar el
+CSS, la barra lateral ni la carga de datos.
+
+`editor_por_cambios` usa st.data_editor solo por sus cambios
+(edited_rows / added_rows / deleted_rows): la página los aplica como parches
+por fila sobre su propio almacén, en vez de reemplazar la tabla completa.
+
+IMPORTANTE: lo devuelto por `seccion_cacheada` es compartido; no mutarlo.
+"""
+import streamlit as st
+
+from skudo_datos import DATOS_TTL_S
+
+
+# =========================================================
+# SECCIONES PEREZOSAS
+# =========================================================
+def selector_secciones(clave: str, etiquetas: list[str]) -> str:
+    """Selector con aspecto de pestañas. Devuelve la etiqueta elegida."""
+    return st.radio(
+        "Sección",
+        etiquetas,
+        horizontal=True,
+        key=clave,
+        label_visibility="collapsed",
+    )
+
+
+@st.cache_resource(ttl=DATOS_TTL_S, max_entries=256, show_spinner=False)
+def _seccion(nombre: str, instalacion: str, perfil: str, version: str, _constructor, _args: tuple):
+    return _constructor(instalacion, *_args)
+
+
+def seccion_cacheada(nombre: str, constructor, instalacion: str, perfil: str, version: str, args: tuple = ()):
+    """
+    Ejecuta `constructor(instalacion, *args)` una vez por
+    (nombre, instalacion, perfil, version). `version` debe cambiar cuando
+    cambian los datos de los que depende la sección.
+    """
+    return _seccion(nombre, instalacion, perfil, version, constructor, tuple(args))
+
+
+# =========================================================
+# FRAGMENTOS (reruns parciales)
+# =========================================================
+def fragmento(fn):
+    """
+    Decorador: la función se vuelve a ejecutar sola cuando cambia uno de sus
+    widgets, sin rerun del script completo. Usa st.fragment (o
+    st.experimental_fragment en versiones anteriores); si la versión de
+    Streamlit no los tiene, la función queda igual (reruns completos).
+    """
+    decorador = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    return decorador(fn) if decorador is not None else fn
+
+
+def rerun_fragmento():
+    """Dentro de un fragmento, vuelve a ejecutar solo el fragmento (si la versión lo permite)."""
+    try:
+        st.rerun(scope="fragment")
+    except TypeError:
+        st.rerun()
+
+
+# =========================================================
+# EDICIÓN POR CAMBIOS (data_editor)
+# =========================================================
+def editor_por_cambios(clave: str, datos, al_cambiar, **kwargs):
+    """
+    st.data_editor que entrega a `al_cambiar(cambios)` solo lo editado
+    ({"edited_rows": {pos: {col: valor}}, "added_rows": [...], "deleted_rows": [pos]},
+    posiciones relativas a `datos`). Tras aplicar los cambios el editor se
+    reinicia sobre los datos ya parchados, así los cambios no se aplican dos veces.
+    """
+    rev_clave = f"{clave}__rev"
+    widget = f"{clave}__{st.session_state.get(rev_clave, 0)}"
+
+    def _al_cambiar():
+        cambios = st.session_state.get(widget) or {}
+        if any(cambios.get(k) for k in ("edited_rows", "added_rows", "deleted_rows")):
+            al_cambiar(cambios)
+        st.session_state[rev_clave] = st.session_state.get(rev_clave, 0) + 1
+
+    return st.data_editor(datos, key=widget, on_change=_al_cambiar, **kwargs)
+
+
+def parchar_celdas(df, edited_rows: dict) -> dict:
+    """
+    Aplica `edited_rows` ({pos: {col: valor}}) sobre `df` en su lugar.
+    Devuelve los valores anteriores con el mismo formato (aplicarlo deshace).
+    """
+    anterior = {}
+    for pos, celdas in edited_rows.items():
+        pos = int(pos)
+        for col, valor in celdas.items():
+            j = df.columns.get_loc(col)
+            anterior.setdefault(pos, {})[col] = df.iat[pos, j]
+            df.iat[pos, j] = "" if valor is None else valor
+    return anterior